@@ -0,0 +1,17 @@
+"""
+Helper functions for the molecular mechanics toy-system notebooks.
+
+The notebooks live in ``03_molecular_mechanics`` itself, so the package can be
+imported directly:
+
+>>> from md_utils import simulate_walkers
+"""
+
+from .potentials import batch_functions, is_time_dependent
+from .walkers import WalkerTrajectory, simulate_walkers
+from .trajectory import ArrayTrajectory, BufferedPerturbedSystem, BufferedSystem
+from .trajectory_file import (DiskPerturbedSystem, DiskSystem, TrajectoryFile, TrajectoryWriter,
+                              attach_trajectory_files, potential_energies)
+from .replica_exchange import ParallelReplicaExchange
+from .tabulated import TabulatedPotential, tabulate
+from .metadynamics import GridMetadynamicsPotential
@@ -0,0 +1,179 @@
+"""
+Metadynamics with constant cost per Gaussian deposition.
+
+``metadynamicsPotential`` builds a new sympy ``gaussPotential`` for every hill
+and evaluates it on all ``numbins`` bins; energies of several positions are
+looked up one by one with ``np.searchsorted``. :class:`GridMetadynamicsPotential`
+adds every hill only to the bins within ``cutoff`` standard deviations of its
+center and accumulates the analytic derivative of the hills in the force grid
+alongside, so a deposition costs the same for any number of bins and hills.
+Lookups compute the bin index directly.
+
+Well-tempered metadynamics scales the height of every new hill by
+``exp(-V_bias(s) / bias_temperature)``. Several walkers share one bias when the
+potential is given to :func:`simulate_walkers`: every walker deposits a hill
+every ``n_trigger`` steps.
+
+Example
+-------
+>>> totpot = GridMetadynamicsPotential(V, amplitude=.3, sigma=.21, n_trigger=10,
+...                                    bias_grid_min=0, bias_grid_max=10, numbins=1000,
+...                                    table_points=10001)
+>>> system4 = system(potential=totpot, sampler=sampler, start_position=4, temperature=1)
+>>> traj = simulate_walkers(totpot, sampler, 4, steps=100000, n_walkers=16, temperature=1)
+>>> x, free_energy = totpot.free_energy(temperature=1)
+"""
+
+import numpy as np
+
+from ensembler.potentials.OneD import harmonicOscillatorPotential, metadynamicsPotential
+
+from .tabulated import TabulatedPotential
+
+
+class GridMetadynamicsPotential(metadynamicsPotential):
+    """
+    Drop-in replacement of ``metadynamicsPotential`` with truncated Gaussian deposition.
+
+    Parameters
+    ----------
+    origPotential: potential type
+        The unbiased 1D potential.
+    amplitude: float
+        Height of the Gaussians (initial height in well-tempered metadynamics).
+    sigma: float
+        Standard deviation of the Gaussians.
+    n_trigger: int
+        A Gaussian is added every n_trigger steps.
+    bias_grid_min: float
+        Lower bound of the bias grid; no bias is applied outside the grid.
+    bias_grid_max: float
+        Upper bound of the bias grid.
+    numbins: int
+        Number of bins of the bias grid.
+    bias_temperature: float or None
+        Delta T of well-tempered metadynamics (in the energy units of the
+        potential, k_B = 1 as in the ensembler Langevin samplers). If None,
+        all Gaussians have the same height.
+    cutoff: float
+        Gaussians are truncated beyond cutoff * sigma.
+    table_points: int or None
+        If given, the original potential is tabulated with this many points on
+        the bias grid range (see :class:`TabulatedPotential`); worthwhile for
+        expensive expressions like ``fourWellPotential``.
+    """
+    # ene and force accept arrays of positions (used by batch_functions)
+    vectorized = True
+
+    def __init__(self, origPotential=harmonicOscillatorPotential(), amplitude=0.1, sigma=1, n_trigger=100,
+                 bias_grid_min=0, bias_grid_max=10, numbins=100, bias_temperature=None, cutoff=5.0, table_points=None):
+        super().__init__(origPotential=origPotential, amplitude=amplitude, sigma=sigma, n_trigger=n_trigger,
+                         bias_grid_min=bias_grid_min, bias_grid_max=bias_grid_max, numbins=numbins)
+        self.bias_grid_min = bias_grid_min
+        self.bias_width = (bias_grid_max - bias_grid_min) / numbins
+        self.numbins = numbins
+        self.bias_temperature = bias_temperature
+        self.stencil_half_width = int(np.ceil(cutoff * sigma / self.bias_width))
+        self.n_hills = 0
+        self.original_table = None
+        if table_points is not None:
+            self.original_table = TabulatedPotential(origPotential, limits=(bias_grid_min, bias_grid_max),
+                                                     n_points=table_points)
+
+    def _bins(self, positions):
+        """
+        Bin index of every position and whether it lies on the grid.
+        """
+        index = np.floor((np.asarray(positions, dtype=float) - self.bias_grid_min) / self.bias_width).astype(int)
+        inside = (index >= 0) & (index < self.numbins)
+        return np.minimum(np.maximum(index, 0), self.numbins - 1), inside
+
+    def bias_energy(self, positions):
+        """
+        Current bias at the given position/s.
+        """
+        index, inside = self._bins(positions)
+        return np.where(inside, self.bias_grid_energy[index], 0.0)
+
+    def deposit(self, positions):
+        """
+        Add one Gaussian at every given position (e.g. all walkers).
+        """
+        for center in np.ravel(positions):
+            height = self.amplitude
+            if self.bias_temperature is not None:
+                height *= np.exp(-self.bias_energy(center) / self.bias_temperature)
+            # Only the bins within cutoff * sigma of the center
+            center_bin = int(np.floor((center - self.bias_grid_min) / self.bias_width))
+            first = max(center_bin - self.stencil_half_width, 0)
+            last = min(center_bin + self.stencil_half_width + 1, self.numbins)
+            if first >= last:
+                continue
+            distance = self.bin_centers[first:last] - center
+            hill = height * np.exp(-distance ** 2 / (2 * self.sigma ** 2))
+            self.bias_grid_energy[first:last] += hill
+            self.bias_grid_force[first:last] -= distance / self.sigma ** 2 * hill
+            self.n_hills += 1
+
+    def _update_potential(self, curr_position):
+        # Called by check_for_metastep of the coupled system
+        self.deposit(curr_position)
+
+    def _original_energies(self, positions):
+        if self.original_table is None:
+            return self._calculate_energies(positions)
+        return self.original_table.ene(positions)
+
+    def _original_dVdpos(self, positions):
+        if self.original_table is None:
+            return self._calculate_dVdpos(positions)
+        return self.original_table.force(positions)
+
+    def ene(self, positions):
+        """
+        Energy of the original potential plus the bias.
+        """
+        if np.size(positions) == 1:
+            position = float(np.squeeze(positions))
+            # Same bins as for arrays of positions
+            index, inside = self._bins(position)
+            bias = self.bias_grid_energy[index] if inside else 0.0
+            return np.squeeze(self._original_energies(position) + bias)
+        positions = np.asarray(positions, dtype=float).reshape(-1)
+        return np.squeeze(self._original_energies(positions) + self.bias_energy(positions))
+
+    def force(self, positions):
+        """
+        dV/dpos of the original potential plus the bias (as ``potential.force``).
+        """
+        if np.size(positions) == 1:
+            position = float(np.squeeze(positions))
+            # Same bins as for arrays of positions
+            index, inside = self._bins(position)
+            bias = self.bias_grid_force[index] if inside else 0.0
+            return np.squeeze(self._original_dVdpos(position) + bias)
+        positions = np.asarray(positions, dtype=float).reshape(-1)
+        index, inside = self._bins(positions)
+        return np.squeeze(self._original_dVdpos(positions) + np.where(inside, self.bias_grid_force[index], 0.0))
+
+    def free_energy(self, temperature=1.0):
+        """
+        Free-energy estimate from the bias, shifted to a minimum of 0.
+
+        Parameters
+        ----------
+        temperature: float
+            Temperature of the simulation (only used for well-tempered metadynamics).
+
+        Returns
+        -------
+        bin_centers: numpy.ndarray
+            Positions of the bins.
+        free_energy: numpy.ndarray
+            -V_bias, or -(T + Delta T) / Delta T * V_bias for well-tempered metadynamics.
+        """
+        if self.bias_temperature is None:
+            free_energy = -self.bias_grid_energy
+        else:
+            free_energy = -(temperature + self.bias_temperature) / self.bias_temperature * self.bias_grid_energy
+        return self.bin_centers, free_energy - free_energy.min()
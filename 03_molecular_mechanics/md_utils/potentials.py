@@ -0,0 +1,97 @@
+"""
+Energy and force evaluation of ensembler potentials for many positions at once.
+
+The ``ene`` and ``force`` methods of the ensembler potentials are meant for one
+position at a time (``force`` of the 2D potentials does not accept arrays of
+positions at all). Here, the symbolic expression of the potential is turned
+into NumPy functions that take an (n_positions x n_dimensions) array.
+
+Example
+-------
+>>> V = potentials2D.wavePotential(amplitude=(1, 1), radians=True)
+>>> energy, gradient = batch_functions(V)
+>>> gradient(np.zeros((1000, 2))).shape
+(1000, 2)
+"""
+
+import numpy as np
+import sympy as sp
+
+
+def position_symbols(potential):
+    """
+    The sympy symbols of the coordinates of a potential, as a list.
+    """
+    if isinstance(potential.position, sp.MatrixBase):
+        return list(potential.position)
+    return [potential.position]
+
+
+def is_time_dependent(potential):
+    """
+    Whether the potential changes during a simulation (metadynamics biases).
+
+    ``bias_potential`` is also set for static biases like ``addedPotentials``,
+    only the metadynamics potentials deposit new terms every ``n_trigger`` steps.
+    """
+    return hasattr(potential, "n_trigger")
+
+
+def _per_position(function, n_dimensions):
+    """
+    Fall back to calling an ensembler function for every position separately.
+    """
+    def evaluate(positions):
+        positions = np.asarray(positions, dtype=float).reshape(-1, n_dimensions)
+        if n_dimensions == 1:
+            return np.array([function(float(x)) for x in positions[:, 0]], dtype=float).reshape(positions.shape[0], -1)
+        return np.array([function(x) for x in positions], dtype=float).reshape(positions.shape[0], -1)
+    return evaluate
+
+
+def batch_functions(potential):
+    """
+    Vectorized energy and gradient of an ensembler potential.
+
+    Parameters
+    ----------
+    potential: ensembler potential
+        A 1D or 2D potential. Potentials that are not fully described by their
+        symbolic expression (e.g. metadynamics with its grid bias) are
+        evaluated position by position with their own ``ene``/``force``, and
+        potentials marked ``vectorized`` are called with the whole array.
+
+    Returns
+    -------
+    energy: callable
+        Maps an (n, n_dimensions) array to the n energies.
+    gradient: callable
+        Maps an (n, n_dimensions) array to the (n, n_dimensions) derivatives
+        dV/dpos (the same quantity as ``potential.force``).
+    """
+    n_dimensions = potential.constants[potential.nDimensions]
+    if getattr(potential, "vectorized", False):
+        # e.g. TabulatedPotential, which takes arrays of positions itself
+        return (lambda positions: np.reshape(potential.ene(positions), -1),
+                lambda positions: np.reshape(potential.force(positions), (-1, n_dimensions)))
+    if is_time_dependent(potential) or not isinstance(getattr(potential, "V", None), sp.Expr):
+        energy = _per_position(potential.ene, n_dimensions)
+        gradient = _per_position(potential.force, n_dimensions)
+        return (lambda positions: energy(positions)[:, 0]), gradient
+
+    symbols = position_symbols(potential)
+    expression = potential.V.doit()
+    energy_function = sp.lambdify(symbols, expression, "numpy")
+    gradient_function = sp.lambdify(symbols, [sp.diff(expression, s) for s in symbols], "numpy")
+
+    def energy(positions):
+        positions = np.asarray(positions, dtype=float).reshape(-1, n_dimensions)
+        return np.broadcast_to(energy_function(*positions.T), positions.shape[:1]).astype(float)
+
+    def gradient(positions):
+        positions = np.asarray(positions, dtype=float).reshape(-1, n_dimensions)
+        # Constant derivatives come back as scalars and are broadcast
+        columns = [np.broadcast_to(column, positions.shape[:1]) for column in gradient_function(*positions.T)]
+        return np.stack(columns, axis=1).astype(float)
+
+    return energy, gradient
@@ -0,0 +1,192 @@
+"""
+Replica exchange with the replicas propagated in parallel worker processes.
+
+``ensemble.simulate(trials)`` propagates the replicas one after another between
+two exchange trials. :class:`ParallelReplicaExchange` distributes the replicas
+of an ensembler replica-exchange ensemble over a pool of persistent worker
+processes. Every worker keeps its replicas (including their samplers and
+trajectories) in memory for the whole run; between two trials only the
+current states go back to the main process, where the ensemble decides the
+exchanges as before, and only the new positions and temperatures go out to the
+workers. The wall time per trial is set by the slowest worker instead of the
+sum over all replicas.
+
+Example
+-------
+>>> ensemble = temperatureReplicaExchange(system=sys, temperature_range=T_values)
+>>> with ParallelReplicaExchange(ensemble, n_workers=8) as parallel:
+...     parallel.simulate(trials, steps_between_trials=steps_between_trials)
+...     trajectories = parallel.replica_trajectories()
+"""
+
+import multiprocessing as mp
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+
+def _replica_worker(connection, replicas, seed):
+    """
+    Keep a set of replicas resident and propagate them on request.
+    """
+    # Otherwise all forked workers would draw the same random numbers
+    np.random.seed(seed)
+    while True:
+        command, arguments = connection.recv()
+        try:
+            if command == "simulate":
+                steps, updates = arguments
+                for coordinate, (position, temperature) in updates.items():
+                    replica = replicas[coordinate]
+                    replica._currentPosition = position
+                    replica.temperature = temperature
+                connection.send({coordinate: replica.simulate(steps=steps, withdraw_traj=False, init_system=False,
+                                                              verbosity=False)
+                                 for coordinate, replica in replicas.items()})
+            elif command == "trajectories":
+                connection.send({coordinate: replica.trajectory for coordinate, replica in replicas.items()})
+            elif command == "close":
+                connection.send(None)
+                break
+        except Exception as error:
+            # Hand the error to the main process, which raises it
+            connection.send(error)
+            break
+    connection.close()
+
+
+def _receive(connection):
+    """
+    Answer of a worker; errors raised in the worker are raised again here.
+    """
+    answer = connection.recv()
+    if isinstance(answer, Exception):
+        raise answer
+    return answer
+
+
+class ParallelReplicaExchange:
+    """
+    Runs the replicas of an ensembler replica-exchange ensemble in persistent worker processes.
+
+    Parameters
+    ----------
+    ensemble: ensembler replica exchange ensemble
+        e.g. a ``temperatureReplicaExchange``. Its replicas are copied to the
+        workers; the ensemble itself keeps deciding and recording the exchanges.
+    n_workers: int or None
+        Number of worker processes. If None, one per replica (at most one per core).
+    random_seed: int or None
+        Seed for the random numbers of the workers.
+    """
+
+    def __init__(self, ensemble, n_workers=None, random_seed=None):
+        if ensemble.exchange_param != "_currentPosition":
+            raise ValueError("ParallelReplicaExchange only supports exchanging positions (exchange_trajs=False)")
+        self.ensemble = ensemble
+        self.n_workers = min(n_workers or os.cpu_count(), ensemble.nReplicas)
+        self.random_seed = random_seed
+        self._workers = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        """
+        Start the worker processes and hand each one its share of the replicas.
+        """
+        if self._workers:
+            return
+        coordinates = list(self.ensemble.replicas)
+        seeds = np.random.SeedSequence(self.random_seed).generate_state(self.n_workers)
+        for index in range(self.n_workers):
+            share = {coordinate: self.ensemble.replicas[coordinate] for coordinate in coordinates[index::self.n_workers]}
+            connection, worker_connection = mp.Pipe()
+            process = mp.Process(target=_replica_worker, args=(worker_connection, share, int(seeds[index])),
+                                 daemon=True)
+            process.start()
+            worker_connection.close()
+            self._workers.append((process, connection, list(share)))
+
+    def close(self):
+        """
+        Stop the worker processes. The replicas and their trajectories in the workers are lost.
+        """
+        for process, connection, _ in self._workers:
+            try:
+                # A worker that failed has already exited and closed its end of the pipe
+                if process.is_alive():
+                    connection.send(("close", None))
+                    connection.recv()
+            except (OSError, EOFError):
+                process.terminate()
+            process.join()
+            connection.close()
+        self._workers = []
+
+    def run(self):
+        """
+        Propagate all replicas by ``steps_between_trials`` steps at the same time.
+        """
+        self.start()
+        replicas = self.ensemble.replicas
+        steps = self.ensemble.nSteps_between_trials
+        for _, connection, coordinates in self._workers:
+            updates = {coordinate: (replicas[coordinate]._currentPosition, replicas[coordinate].temperature)
+                       for coordinate in coordinates}
+            connection.send(("simulate", (steps, updates)))
+
+        for _, connection, _ in self._workers:
+            for coordinate, state in _receive(connection).items():
+                # The main process only needs the current state to decide the exchanges
+                replica = replicas[coordinate]
+                replica._currentPosition = state.position
+                replica._currentVelocities = state.velocity
+                replica._currentForce = state.dhdpos
+                replica._update_energies()
+                replica.update_current_state()
+
+    def simulate(self, ntrials, steps_between_trials=None):
+        """
+        Run ``ntrials`` exchange trials, like ``ensemble.simulate``.
+
+        Parameters
+        ----------
+        ntrials: int
+            Number of exchange trials.
+        steps_between_trials: int or None
+            Steps between two trials. If None, the setting of the ensemble is used.
+
+        Returns
+        -------
+        states: dict
+            The current state of every replica.
+        """
+        if isinstance(steps_between_trials, int):
+            self.ensemble.set_simulation_steps_between_trials(nsteps=steps_between_trials)
+        for _ in tqdm(range(ntrials), desc="Running trials", leave=True):
+            self.run()
+            self.ensemble.exchange()
+        return self.ensemble.get_replicas_current_states()
+
+    def replica_trajectories(self):
+        """
+        Trajectories of all replicas, collected from the workers.
+
+        Returns
+        -------
+        trajectories: dict
+            Trajectory DataFrame of every replica coordinate.
+        """
+        if not self._workers:
+            raise ValueError("the workers are not running, the trajectories are only available before close()")
+        trajectories = {}
+        for _, connection, _ in self._workers:
+            connection.send(("trajectories", None))
+            trajectories.update(_receive(connection))
+        return {coordinate: trajectories[coordinate] for coordinate in self.ensemble.replicas}
@@ -0,0 +1,233 @@
+"""
+Tabulated ensembler potentials with interpolated energies and forces.
+
+Every ``ene``/``force`` call of an ensembler potential evaluates its full
+symbolic expression, so composed potentials such as
+``potentials1D.addedPotentials(V, biaspot)`` get slower with every term.
+:class:`TabulatedPotential` evaluates energy and force once on a fine grid
+(vectorized, see :func:`batch_functions`) and afterwards only interpolates
+linearly between the grid points. A lookup costs the same for every potential.
+Positions outside the grid are evaluated with the original potential, unless
+the grid is periodic.
+
+Tables are cached in memory and optionally in ``cache_dir``, keyed by the
+expression of the potential (which contains all its parameters) and the grid.
+
+Example
+-------
+>>> V = potentials1D.addedPotentials(V, biaspot)
+>>> V_tab = TabulatedPotential(V, limits=(0, 10))
+>>> sys = system(potential=V_tab, sampler=sampler, start_position=2, temperature=1)
+>>> V2D_tab = TabulatedPotential(potentials2D.wavePotential(amplitude=(1, 1), radians=True),
+...                              limits=[(-np.pi, np.pi), (-np.pi, np.pi)], periodic=True)
+"""
+
+import copy
+import hashlib
+import itertools
+import os
+from os import path
+from pathlib import Path
+
+import numpy as np
+
+from ensembler.potentials._basicPotentials import _potentialCls
+
+from .potentials import batch_functions, is_time_dependent
+
+# Grid points per dimension if not given
+DEFAULT_POINTS = {1: 10001, 2: 501}
+
+_TABLES = {}
+
+
+def _table_key(potential, limits, n_points):
+    """
+    Identifies a table by the potential expression (with its parameters) and the grid.
+    """
+    return "|".join([potential.name, str(potential.V), str(np.asarray(limits, dtype=float).tolist()), str(n_points)])
+
+
+def tabulate(potential, limits, n_points=None, cache_dir=None):
+    """
+    Energies and gradients of a potential on a regular grid.
+
+    Parameters
+    ----------
+    potential: ensembler potential
+        A 1D or 2D potential with a fixed symbolic expression.
+    limits: array-like
+        (lower, upper) bound of the grid, one pair per dimension.
+    n_points: int or None
+        Grid points per dimension (default: 10001 in 1D, 501 in 2D).
+    cache_dir: str or pathlib.Path or None
+        Directory for tables that are reused across sessions.
+
+    Returns
+    -------
+    energies: numpy.ndarray
+        Energies, shape (n_points,) * n_dimensions.
+    gradients: numpy.ndarray
+        dV/dpos, shape (n_points,) * n_dimensions + (n_dimensions,).
+    """
+    if is_time_dependent(potential):
+        raise ValueError("biased potentials change during the simulation and cannot be tabulated")
+    n_dimensions = potential.constants[potential.nDimensions]
+    n_points = n_points or DEFAULT_POINTS[n_dimensions]
+    limits = np.asarray(limits, dtype=float).reshape(n_dimensions, 2)
+
+    key = _table_key(potential, limits, n_points)
+    if key in _TABLES:
+        return _TABLES[key]
+    cache_file = None
+    if cache_dir is not None:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        cache_file = path.join(cache_dir, f"{hashlib.sha1(key.encode()).hexdigest()}.npz")
+        if path.exists(cache_file):
+            with np.load(cache_file) as table:
+                _TABLES[key] = table["energies"], table["gradients"]
+            return _TABLES[key]
+
+    energy, gradient = batch_functions(potential)
+    axes = [np.linspace(lower, upper, n_points) for lower, upper in limits]
+    grid = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, n_dimensions)
+    shape = (n_points,) * n_dimensions
+    energies = energy(grid).reshape(shape)
+    gradients = gradient(grid).reshape(shape + (n_dimensions,))
+
+    if cache_file is not None:
+        temporary = f"{cache_file}.{os.getpid()}.tmp.npz"
+        np.savez(temporary, energies=energies, gradients=gradients)
+        os.replace(temporary, cache_file)
+    _TABLES[key] = energies, gradients
+    return energies, gradients
+
+
+class TabulatedPotential(_potentialCls):
+    """
+    Drop-in replacement of an ensembler potential, interpolated from a grid.
+
+    Parameters
+    ----------
+    potential: ensembler potential
+        The 1D or 2D potential to tabulate.
+    limits: array-like
+        (lower, upper) bound of the grid, one pair per dimension.
+    n_points: int or None
+        Grid points per dimension (default: 10001 in 1D, 501 in 2D).
+    periodic: bool
+        Positions outside the grid are wrapped into it (e.g. ``wavePotential``
+        with limits of one period). Otherwise, they are evaluated with the
+        original potential.
+    cache_dir: str or pathlib.Path or None
+        Directory for tables that are reused across sessions.
+    """
+    # ene and force accept arrays of positions (used by batch_functions)
+    vectorized = True
+
+    def __init__(self, potential, limits, n_points=None, periodic=False, cache_dir=None):
+        n_dimensions = potential.constants[potential.nDimensions]
+        super().__init__(nDimensions=n_dimensions, nStates=potential.constants[potential.nStates])
+        self.name = f"tabulated {potential.name}"
+        self.potential = potential
+        self.periodic = periodic
+        self.energies, self.gradients = tabulate(potential, limits, n_points=n_points, cache_dir=cache_dir)
+        self.n_points = self.energies.shape[0]
+        self.lower = np.asarray(limits, dtype=float).reshape(n_dimensions, 2)[:, 0]
+        self.spacing = (np.asarray(limits, dtype=float).reshape(n_dimensions, 2)[:, 1] - self.lower) / (self.n_points - 1)
+        # Plain Python copies for the per-step lookups
+        self._n_dimensions = n_dimensions
+        self._lower = self.lower.tolist()
+        self._spacing = self.spacing.tolist()
+        self._grid_axis = np.arange(self.n_points, dtype=float)
+
+    def __deepcopy__(self, memo):
+        # ensembler copies objects by calling the constructor without arguments
+        copy_obj = self.__class__.__new__(self.__class__)
+        copy_obj.__setstate__(copy.deepcopy(self.__getstate__(), memo))
+        return copy_obj
+
+    def _interpolate(self, table, positions):
+        """
+        Multilinear interpolation of a table; None where positions are off the grid.
+        """
+        n_dimensions = self._n_dimensions
+        positions = np.asarray(positions, dtype=float).reshape(-1, n_dimensions)
+        grid_position = (positions - self.lower) / self.spacing
+        if self.periodic:
+            grid_position = np.mod(grid_position, self.n_points - 1)
+            outside = None
+        else:
+            outside = np.any((grid_position < 0) | (grid_position > self.n_points - 1), axis=1)
+
+        if n_dimensions == 1:
+            # np.interp does the same for one dimension, in C
+            columns = table.reshape(self.n_points, -1).T
+            values = np.stack([np.interp(grid_position[:, 0], self._grid_axis, column) for column in columns], axis=1)
+            return positions, values.reshape((-1,) + table.shape[1:]), outside
+
+        index = np.minimum(np.maximum(np.floor(grid_position).astype(int), 0), self.n_points - 2)
+        weight = grid_position - index
+
+        values = 0
+        for corner in itertools.product((0, 1), repeat=n_dimensions):
+            corner_weight = np.prod(np.where(corner, weight, 1 - weight), axis=1)
+            corner_values = table[tuple(index[:, k] + corner[k] for k in range(n_dimensions))]
+            values = values + corner_weight.reshape((-1,) + (1,) * (corner_values.ndim - 1)) * corner_values
+        return positions, values, outside
+
+    def _lookup(self, table, position):
+        """
+        Interpolation at a single position in plain Python; None if it is off the grid.
+
+        The samplers call ``ene``/``force`` for one position every step, where
+        the overhead of the array operations would dominate.
+        """
+        index = []
+        weight = []
+        for value, lower, spacing in zip(np.ravel(position).tolist(), self._lower, self._spacing):
+            grid_position = (value - lower) / spacing
+            if self.periodic:
+                grid_position %= self.n_points - 1
+            elif not 0 <= grid_position <= self.n_points - 1:
+                return None
+            i = min(int(grid_position), self.n_points - 2)
+            index.append(i)
+            weight.append(grid_position - i)
+        if len(index) == 1:
+            i, = index
+            w, = weight
+            return table[i] * (1 - w) + table[i + 1] * w
+        (i, j), (wx, wy) = index, weight
+        block = table[i:i + 2, j:j + 2]
+        return (1 - wx) * ((1 - wy) * block[0, 0] + wy * block[0, 1]) + wx * ((1 - wy) * block[1, 0] + wy * block[1, 1])
+
+    def ene(self, positions):
+        """
+        Interpolated potential energy of the given position/s.
+        """
+        if np.size(positions) == self._n_dimensions:
+            energy = self._lookup(self.energies, positions)
+            return self.potential.ene(positions) if energy is None else energy
+        positions, energies, outside = self._interpolate(self.energies, positions)
+        if outside is not None and outside.any():
+            energies[outside] = [self.potential.ene(position if position.size > 1 else float(position))
+                                 for position in positions[outside]]
+        return np.squeeze(energies)
+
+    def force(self, positions):
+        """
+        Interpolated dV/dpos of the given position/s (the quantity of ``potential.force``).
+        """
+        if np.size(positions) == self._n_dimensions:
+            # 1D: a number, as returned by the ensembler potentials
+            gradient = self._lookup(self.gradients[..., 0] if self._n_dimensions == 1 else self.gradients, positions)
+            return self.potential.force(positions) if gradient is None else gradient
+        positions, gradients, outside = self._interpolate(self.gradients, positions)
+        if outside is not None and outside.any():
+            gradients[outside] = [np.reshape(self.potential.force(position if position.size > 1 else float(position)), -1)
+                                  for position in positions[outside]]
+        return np.squeeze(gradients)
+
+    def dvdpos(self, positions):
+        return self.force(positions)
@@ -0,0 +1,215 @@
+"""
+Preallocated NumPy trajectory storage for ensembler systems.
+
+An ensembler ``system`` keeps its trajectory as a Python list of state tuples
+and builds a new pandas DataFrame from this list every time ``sys.trajectory``
+is accessed. :class:`ArrayTrajectory` stores every state variable in its own
+NumPy column instead; the buffers are allocated for the requested number of
+steps before ``simulate`` starts. The DataFrame is only built when
+``trajectory`` is accessed and is reused until new states are added.
+
+``BufferedSystem`` and ``BufferedPerturbedSystem`` are drop-in replacements for
+``system`` and ``perturbedSystem`` using this storage.
+
+Example
+-------
+>>> sys = BufferedSystem(potential=V, sampler=sampler, start_position=[np.pi, np.pi],
+...                      temperature=1, conditions=[periodic_cond])
+>>> sys.simulate(steps=100000, save_every_state=10)
+>>> sys.trajectory.head(20)
+>>> sys.trajectory_arrays["position"].shape
+(10002, 2)
+"""
+
+import numpy as np
+import pandas as pd
+
+from ensembler.system.basic_system import system
+from ensembler.system.perturbed_system import perturbedSystem
+
+
+class ArrayTrajectory:
+    """
+    Column-wise trajectory storage with list-like ``append``.
+
+    Parameters
+    ----------
+    state: namedtuple class
+        The state type of the system (its fields become the columns).
+    capacity: int
+        Number of states the buffers can hold before they grow.
+    """
+
+    def __init__(self, state, capacity=1024):
+        self.state = state
+        self.fields = list(state._fields)
+        self.capacity = max(int(capacity), 1)
+        self.columns = {}
+        self.n_states = 0
+        self._frame = None
+
+    def __len__(self):
+        return self.n_states
+
+    def reserve(self, capacity):
+        """
+        Make sure that ``capacity`` states fit into the buffers.
+        """
+        if capacity <= self.capacity:
+            return
+        for field, column in self.columns.items():
+            grown = np.full((capacity,) + column.shape[1:], np.nan)
+            grown[:self.n_states] = column[:self.n_states]
+            self.columns[field] = grown
+        self.capacity = capacity
+
+    def _column(self, field, width):
+        """
+        Buffer of a field with room for ``width`` values per state.
+        """
+        column = self.columns.get(field)
+        if column is None:
+            column = np.full((self.capacity,) if width == 0 else (self.capacity, width), np.nan)
+            self.columns[field] = column
+        elif width > 0 and column.ndim == 1:
+            # e.g. the velocity of a 2D system was NaN for the first state
+            widened = np.full((self.capacity, width), np.nan)
+            widened[:self.n_states] = column[:self.n_states, np.newaxis]
+            column = self.columns[field] = widened
+        return column
+
+    def append(self, state):
+        """
+        Store one state of the system.
+        """
+        if self.n_states == self.capacity:
+            self.reserve(2 * self.capacity)
+        for field, value in zip(self.fields, state):
+            value = np.nan if value is None else np.asarray(value, dtype=float)
+            width = 0 if np.ndim(value) == 0 else np.size(value)
+            column = self._column(field, width)
+            column[self.n_states] = value
+        self.n_states += 1
+        self._frame = None
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.n_states
+        if not 0 <= index < self.n_states:
+            raise IndexError("trajectory index out of range")
+        return self.state(**{field: self._value(field, index) for field in self.fields})
+
+    def __iter__(self):
+        for index in range(self.n_states):
+            yield self[index]
+
+    def _value(self, field, index):
+        value = self.columns[field][index]
+        return float(value) if np.ndim(value) == 0 else value.copy()
+
+    def pop(self):
+        """
+        Remove and return the last state.
+        """
+        state = self[-1]
+        self.n_states -= 1
+        self._frame = None
+        return state
+
+    def clear(self):
+        self.n_states = 0
+        self._frame = None
+
+    def arrays(self):
+        """
+        The filled part of every column, without copying.
+        """
+        return {field: column[:self.n_states] for field, column in self.columns.items()}
+
+    def to_dataframe(self):
+        """
+        The trajectory as DataFrame with the layout of ``system.trajectory``.
+
+        Multi-dimensional columns (e.g. the position of a 2D system) hold one
+        array per row, as in ensembler.
+        """
+        if self._frame is None:
+            data = {}
+            for field in self.fields:
+                column = self.columns.get(field)
+                if column is None:
+                    data[field] = np.full(self.n_states, np.nan)
+                elif column.ndim == 1:
+                    data[field] = column[:self.n_states]
+                else:
+                    data[field] = list(column[:self.n_states])
+            self._frame = pd.DataFrame(data, columns=self.fields)
+        return self._frame
+
+
+class ArrayTrajectoryMixin:
+    """
+    Replaces the list trajectory of an ensembler system by an :class:`ArrayTrajectory`.
+    """
+
+    @property
+    def trajectory(self):
+        return self._trajectory.to_dataframe()
+
+    @property
+    def trajectory_arrays(self):
+        """
+        The trajectory as dictionary of NumPy arrays (one per state variable).
+        """
+        return self._trajectory.arrays()
+
+    def clear_trajectory(self):
+        self._trajectory = ArrayTrajectory(self.state)
+
+    def simulate(self, steps, withdraw_traj=False, save_every_state=1, init_system=False,
+                 verbosity=True, _progress_bar_prefix="Simulation: "):
+        """
+        Simulate as ``system.simulate``, with the trajectory buffers allocated up front.
+
+        Parameters
+        ----------
+        steps: int
+            number of integration steps
+        withdraw_traj: bool, optional
+            reset the current simulation trajectory. (default: False)
+        save_every_state: int, optional
+            save every n step. (and leave out the rest) (default: 1 - each step)
+        init_system: bool, optional
+            initialize the system. (default: False)
+        verbosity: bool, optional
+            change the verbosity of the simulation. (default: True)
+
+        Returns
+        -------
+        state
+            returns the last current state
+        """
+        if init_system:
+            self._init_position()
+            self._init_velocities()
+        if withdraw_traj or not isinstance(self._trajectory, ArrayTrajectory):
+            self.clear_trajectory()
+            self._trajectory.append(self.current_state)
+
+        # The initial state, every save_every_state-th step and the final state
+        self._trajectory.reserve(len(self._trajectory) + steps // save_every_state + 2)
+        return super().simulate(steps, withdraw_traj=False, save_every_state=save_every_state,
+                                init_system=False, verbosity=verbosity,
+                                _progress_bar_prefix=_progress_bar_prefix)
+
+
+class BufferedSystem(ArrayTrajectoryMixin, system):
+    """
+    ``system`` with preallocated NumPy trajectory storage.
+    """
+
+
+class BufferedPerturbedSystem(ArrayTrajectoryMixin, perturbedSystem):
+    """
+    ``perturbedSystem`` with preallocated NumPy trajectory storage.
+    """
@@ -0,0 +1,447 @@
+"""
+Append-only on-disk trajectories that are read back as memory maps.
+
+``system.simulate`` keeps every state in memory and the trajectory is gone
+when the kernel restarts. :class:`TrajectoryWriter` replaces the trajectory
+list of a system and writes the states in chunks to a trajectory directory:
+one raw float64 file per state variable plus ``metadata.json``, which is only
+updated after the data was written. An interrupted run therefore leaves a
+readable trajectory of all flushed states.
+
+:class:`TrajectoryFile` opens the columns with ``np.memmap``, so slicing a long
+trajectory only reads the requested frames. The columns are plain NumPy arrays
+and can be given to the ensembler free-energy estimators, and
+``TrajectoryFile.as_system`` can be given to ``simulation_analysis_plot``.
+
+Example
+-------
+>>> sys = DiskSystem(potential=V, sampler=sampler, start_position=[np.pi, np.pi], temperature=1,
+...                  conditions=[periodic_cond], trajectory_path="output/wave.traj")
+>>> sys.simulate(steps=100000, save_every_state=10)
+>>> traj = TrajectoryFile("output/wave.traj")
+>>> traj["position"][::100].shape
+(101, 2)
+>>> simulation_analysis_plot(traj.as_system(stride=10))
+"""
+
+import json
+import os
+import pickle
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ensembler.system.basic_system import system
+from ensembler.system.perturbed_system import perturbedSystem
+
+from .potentials import batch_functions
+
+# State variables with one value per dimension
+VECTOR_FIELDS = ("position", "velocity", "dhdpos")
+
+
+def _write_json(data, file):
+    """
+    Replace a JSON file in one step.
+    """
+    temporary = f"{file}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(data, f, indent=1)
+    os.replace(temporary, file)
+
+
+class TrajectoryWriter:
+    """
+    List-like trajectory that writes its states to a trajectory directory.
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        Trajectory directory (created if needed).
+    state: namedtuple class
+        The state type of the system (its fields become the columns).
+    n_dimensions: int
+        Number of dimensions of the system.
+    chunk_size: int
+        Number of states kept in memory before they are written.
+    append: bool
+        Continue an existing trajectory instead of overwriting it.
+    """
+
+    def __init__(self, path, state, n_dimensions=1, chunk_size=4096, append=False):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.state = state
+        self.fields = list(state._fields)
+        self.widths = {field: n_dimensions if field in VECTOR_FIELDS and n_dimensions > 1 else 0
+                       for field in self.fields}
+        self.chunk_size = max(int(chunk_size), 1)
+        self._pending = []
+        self.n_written = 0
+
+        if append and (self.path / "metadata.json").exists():
+            metadata = TrajectoryFile(self.path).metadata
+            if metadata["fields"] != self.fields:
+                raise ValueError(f"{self.path} holds the fields {metadata['fields']}, not {self.fields}")
+            # Drop states that were written after the last metadata update
+            self._truncate(metadata["n_states"])
+        else:
+            self.clear()
+
+    def __len__(self):
+        return self.n_written + len(self._pending)
+
+    def _file(self, field):
+        return self.path / f"{field}.dat"
+
+    def _row_bytes(self, field):
+        return 8 * max(self.widths[field], 1)
+
+    def _write_metadata(self):
+        _write_json({"fields": self.fields, "widths": self.widths, "dtype": "<f8",
+                     "n_states": self.n_written}, self.path / "metadata.json")
+
+    def _truncate(self, n_states):
+        for field in self.fields:
+            with open(self._file(field), "ab") as f:
+                f.truncate(n_states * self._row_bytes(field))
+        self.n_written = n_states
+        self._write_metadata()
+
+    def append(self, state):
+        """
+        Add one state; every ``chunk_size`` states are written to disk.
+        """
+        self._pending.append(state)
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all states held in memory.
+        """
+        if not self._pending:
+            return
+        n_states = len(self._pending)
+        for index, field in enumerate(self.fields):
+            width = self.widths[field]
+            column = np.full((n_states, width) if width else n_states, np.nan)
+            for row, state in enumerate(self._pending):
+                value = state[index]
+                if value is not None:
+                    column[row] = np.asarray(value, dtype=float).reshape(column.shape[1:])
+            with open(self._file(field), "ab") as f:
+                f.write(column.astype("<f8").tobytes())
+        self.n_written += n_states
+        self._pending = []
+        self._write_metadata()
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("trajectory index out of range")
+        if index >= self.n_written:
+            return self._pending[index - self.n_written]
+        trajectory = TrajectoryFile(self.path)
+        return self.state(**{field: trajectory._value(field, index) for field in self.fields})
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def pop(self):
+        """
+        Remove and return the last state.
+        """
+        if self._pending:
+            return self._pending.pop()
+        state = self[-1]
+        self._truncate(self.n_written - 1)
+        return state
+
+    def clear(self):
+        self._pending = []
+        self._truncate(0)
+
+
+class TrajectoryFile:
+    """
+    Read access to a trajectory directory through memory maps.
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        Trajectory directory written by :class:`TrajectoryWriter`.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / "metadata.json") as f:
+            self.metadata = json.load(f)
+        self.fields = self.metadata["fields"]
+        self.n_states = self.metadata["n_states"]
+        self._columns = {}
+
+    def __len__(self):
+        return self.n_states
+
+    def __getitem__(self, field):
+        """
+        Read-only column of a state variable, shape (n_states,) or (n_states, n_dimensions).
+        """
+        if field not in self._columns:
+            width = self.metadata["widths"][field]
+            shape = (self.n_states, width) if width else (self.n_states,)
+            if self.n_states == 0:
+                self._columns[field] = np.empty(shape)
+            else:
+                self._columns[field] = np.memmap(self.path / f"{field}.dat", dtype=self.metadata["dtype"],
+                                                 mode="r", shape=shape)
+        return self._columns[field]
+
+    def _value(self, field, index):
+        value = self[field][index]
+        return float(value) if np.ndim(value) == 0 else np.array(value)
+
+    def arrays(self):
+        """
+        All columns as dictionary of memory maps.
+        """
+        return {field: self[field] for field in self.fields}
+
+    def to_dataframe(self, start=None, stop=None, stride=None):
+        """
+        A slice of the trajectory as DataFrame with the layout of ``system.trajectory``.
+
+        Only the selected frames are read from disk.
+        """
+        frames = slice(start, stop, stride)
+        data = {}
+        for field in self.fields:
+            column = np.array(self[field][frames])
+            data[field] = column if column.ndim == 1 else list(column)
+        index = np.arange(self.n_states)[frames]
+        return pd.DataFrame(data, columns=self.fields, index=index)
+
+    def load_system(self):
+        """
+        Potential and sampler stored next to the trajectory by :class:`DiskSystem`.
+        """
+        system_file = self.path / "system.pkl"
+        if not system_file.exists():
+            return {}
+        with open(system_file, "rb") as f:
+            return pickle.load(f)
+
+    def as_system(self, potential=None, sampler=None, start=None, stop=None, stride=None):
+        """
+        Minimal system for ``simulation_analysis_plot``.
+
+        Parameters
+        ----------
+        potential: ensembler potential or None
+            The simulated potential. If None, the stored potential is used.
+        sampler: ensembler sampler or None
+            The sampler. If None, the stored sampler is used.
+        start, stop, stride: int or None
+            Frames to show.
+
+        Returns
+        -------
+        view: TrajectoryView
+            Object with ``trajectory``, ``potential``, ``sampler`` and ``nDimensions``.
+        """
+        stored = self.load_system()
+        potential = stored.get("potential") if potential is None else potential
+        sampler = stored.get("sampler") if sampler is None else sampler
+        if potential is None:
+            raise ValueError(f"{self.path} has no stored potential, please give one")
+        return TrajectoryView(trajectory=self.to_dataframe(start, stop, stride), potential=potential,
+                              sampler=sampler, nDimensions=potential.constants[potential.nDimensions])
+
+
+@dataclass
+class TrajectoryView:
+    """
+    Trajectory slice with the attributes of a system used by the ensembler plots.
+    """
+    trajectory: pd.DataFrame
+    potential: object
+    sampler: object = None
+    nDimensions: int = 1
+
+
+def potential_energies(trajectory, potential, start=None, stop=None, stride=None, chunk_size=2**16):
+    """
+    Energies of the stored positions on another potential, chunk by chunk.
+
+    Together with the ``total_potential_energy`` column this gives the input of
+    the ensembler free-energy estimators, e.g.
+    ``zwanzigEquation().calculate(Vi=traj_i["total_potential_energy"], Vj=potential_energies(traj_i, V_j))``.
+
+    Parameters
+    ----------
+    trajectory: TrajectoryFile or str or pathlib.Path
+        The trajectory.
+    potential: ensembler potential
+        Potential to evaluate.
+    start, stop, stride: int or None
+        Frames to evaluate.
+    chunk_size: int
+        Number of frames read from disk at once.
+
+    Returns
+    -------
+    energies: numpy.ndarray
+        One energy per selected frame.
+    """
+    if not isinstance(trajectory, TrajectoryFile):
+        trajectory = TrajectoryFile(trajectory)
+    energy, _ = batch_functions(potential)
+    frames = np.arange(trajectory.n_states)[slice(start, stop, stride)]
+    positions = trajectory["position"]
+    energies = np.empty(len(frames))
+    for first in range(0, len(frames), chunk_size):
+        chunk = frames[first:first + chunk_size]
+        energies[first:first + chunk_size] = energy(positions[chunk])
+    return energies
+
+
+class DiskTrajectoryMixin:
+    """
+    Writes the trajectory of an ensembler system to a trajectory directory.
+    """
+    trajectory_path = None
+    chunk_size = 4096
+
+    def __init__(self, *args, trajectory_path=None, chunk_size=4096, **kwargs):
+        # Set before the system initialises (and clears) its trajectory
+        self.trajectory_path = trajectory_path
+        self.chunk_size = chunk_size
+        super().__init__(*args, **kwargs)
+
+    @property
+    def trajectory(self):
+        if isinstance(self._trajectory, TrajectoryWriter):
+            return self.trajectory_file.to_dataframe()
+        return super().trajectory
+
+    @property
+    def trajectory_file(self):
+        """
+        The written trajectory as :class:`TrajectoryFile`.
+        """
+        self._trajectory.flush()
+        return TrajectoryFile(self._trajectory.path)
+
+    def clear_trajectory(self):
+        # Without a path (e.g. the empty copy made by deepcopy), keep the trajectory in memory
+        if self.trajectory_path is None:
+            self._trajectory = []
+        elif isinstance(getattr(self, "_trajectory", None), TrajectoryWriter) and \
+                self._trajectory.path == Path(self.trajectory_path):
+            self._trajectory.clear()
+        else:
+            self._trajectory = TrajectoryWriter(self.trajectory_path, self.state, self.nDimensions,
+                                                chunk_size=self.chunk_size)
+
+    def _save_system(self):
+        with open(self._trajectory.path / "system.pkl", "wb") as f:
+            pickle.dump({"potential": self.potential, "sampler": self.sampler}, f)
+
+    def simulate(self, steps, withdraw_traj=False, save_every_state=1, init_system=False,
+                 verbosity=True, _progress_bar_prefix="Simulation: "):
+        """
+        Simulate as ``system.simulate``; all states are on disk when it returns.
+
+        Parameters
+        ----------
+        steps: int
+            number of integration steps
+        withdraw_traj: bool, optional
+            reset the current simulation trajectory. (default: False)
+        save_every_state: int, optional
+            save every n step. (and leave out the rest) (default: 1 - each step)
+        init_system: bool, optional
+            initialize the system. (default: False)
+        verbosity: bool, optional
+            change the verbosity of the simulation. (default: True)
+
+        Returns
+        -------
+        state
+            returns the last current state
+        """
+        if self.trajectory_path is None:
+            return super().simulate(steps, withdraw_traj=withdraw_traj, save_every_state=save_every_state,
+                                    init_system=init_system, verbosity=verbosity,
+                                    _progress_bar_prefix=_progress_bar_prefix)
+        if init_system:
+            self._init_position()
+            self._init_velocities()
+        if withdraw_traj or not isinstance(self._trajectory, TrajectoryWriter):
+            self.clear_trajectory()
+            self._trajectory.append(self.current_state)
+
+        try:
+            return super().simulate(steps, withdraw_traj=False, save_every_state=save_every_state,
+                                    init_system=False, verbosity=verbosity,
+                                    _progress_bar_prefix=_progress_bar_prefix)
+        finally:
+            # Also keep what was simulated before an interrupt
+            self._trajectory.flush()
+            self._save_system()
+
+
+class DiskSystem(DiskTrajectoryMixin, system):
+    """
+    ``system`` writing its trajectory to ``trajectory_path``.
+    """
+
+
+class DiskPerturbedSystem(DiskTrajectoryMixin, perturbedSystem):
+    """
+    ``perturbedSystem`` writing its trajectory to ``trajectory_path``.
+    """
+
+
+def attach_trajectory_files(ensemble, directory, chunk_size=4096):
+    """
+    Give every replica of an ensemble its own trajectory directory.
+
+    The replicas are deep copies of one system and would otherwise write to
+    the same files. Call this after creating the ensemble and before
+    ``ensemble.simulate``.
+
+    Parameters
+    ----------
+    ensemble: ensembler replica exchange ensemble
+        Ensemble built from a :class:`DiskSystem`.
+    directory: str or pathlib.Path
+        Directory receiving ``replica_<id>.traj`` for every replica.
+    chunk_size: int
+        Number of states kept in memory before they are written.
+
+    Returns
+    -------
+    paths: dict
+        Trajectory directory of every replica ID.
+    """
+    paths = {}
+    for replica in ensemble.replicas.values():
+        if not isinstance(replica, DiskTrajectoryMixin):
+            raise ValueError("attach_trajectory_files needs an ensemble built from a DiskSystem")
+        states = list(replica._trajectory)
+        replica.trajectory_path = Path(directory) / f"replica_{replica.replicaID}.traj"
+        replica.chunk_size = chunk_size
+        replica._trajectory = TrajectoryWriter(replica.trajectory_path, replica.state, replica.nDimensions,
+                                               chunk_size=chunk_size)
+        for state in states:
+            replica._trajectory.append(state)
+        replica._trajectory.flush()
+        replica._save_system()
+        paths[replica.replicaID] = replica.trajectory_path
+    return paths
@@ -0,0 +1,216 @@
+"""
+Langevin dynamics of many independent walkers at once.
+
+``system(...).simulate(steps)`` propagates one particle, one Python-level step
+at a time. For converged histograms, many independent walkers are needed. Here,
+all walkers are stored in one (n_walkers x n_dimensions) array and every step
+evaluates the forces of all walkers with one NumPy call, so 1000 walkers cost
+about as much wall time as one.
+
+The integration follows ``langevinIntegrator`` (position BBK) and
+``langevinVelocityIntegrator`` (velocity BBK) of ensembler; the settings
+``dt``, ``gamma`` and ``old_position`` are taken from the given sampler.
+
+Example
+-------
+>>> sampler = langevinIntegrator(dt=0.1, gamma=10)
+>>> periodic_cond = periodicBoundaryCondition(boundary=[[min_x, max_x], [min_x, max_x]])
+>>> traj = simulate_walkers(V, sampler, [np.pi, np.pi], steps=100000, n_walkers=1000,
+...                         temperature=1, conditions=[periodic_cond], save_every_state=100)
+>>> plt.hist2d(*traj.position.reshape(-1, 2).T, bins=100)
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import scipy.constants as const
+from tqdm import tqdm
+
+from ensembler.conditions.box_conditions import periodicBoundaryCondition
+from ensembler.samplers.stochastic import langevinIntegrator, langevinVelocityIntegrator
+
+from .metadynamics import GridMetadynamicsPotential
+from .potentials import batch_functions
+
+
+@dataclass
+class WalkerTrajectory:
+    """
+    Stacked trajectory of many walkers.
+
+    Parameters
+    ----------
+    step: numpy.ndarray
+        Step number of every saved frame, shape (n_frames,).
+    position: numpy.ndarray
+        Positions, shape (n_frames, n_walkers, n_dimensions).
+    total_potential_energy: numpy.ndarray
+        Potential energies, shape (n_frames, n_walkers).
+    velocity: numpy.ndarray or None
+        Velocities, shape (n_frames, n_walkers, n_dimensions), only for the
+        velocity Langevin integrator.
+    temperature: float
+        Temperature of the simulation.
+    """
+    step: np.ndarray
+    position: np.ndarray
+    total_potential_energy: np.ndarray
+    velocity: np.ndarray = None
+    temperature: float = None
+
+    @property
+    def n_walkers(self):
+        return self.position.shape[1]
+
+    def walker(self, index):
+        """
+        Trajectory of one walker as DataFrame with the columns of ``system.trajectory``.
+        """
+        position = self.position[:, index]
+        frame = pd.DataFrame({
+            "position": list(position) if position.shape[1] > 1 else position[:, 0],
+            "temperature": self.temperature,
+            "total_potential_energy": self.total_potential_energy[:, index],
+        }, index=self.step)
+        if self.velocity is not None:
+            velocity = self.velocity[:, index]
+            frame["velocity"] = list(velocity) if velocity.shape[1] > 1 else velocity[:, 0]
+            frame["total_kinetic_energy"] = 0.5 * np.sum(velocity ** 2, axis=1)
+        return frame
+
+
+def _periodic_bounds(conditions, n_dimensions):
+    """
+    Lower bounds and box lengths of the periodic boundary conditions.
+    """
+    lower = None
+    length = None
+    for condition in conditions or []:
+        if not isinstance(condition, periodicBoundaryCondition):
+            raise ValueError(f"{condition.name} is not supported for walkers, only periodic boundaries are")
+        lower = np.broadcast_to(np.asarray(condition.lowerbounds, dtype=float), (n_dimensions,))
+        length = np.broadcast_to(np.asarray(condition.higherbounds, dtype=float), (n_dimensions,)) - lower
+    return lower, length
+
+
+def simulate_walkers(potential, sampler, start_positions, steps, n_walkers=None, temperature=1.0,
+                     mass=1.0, conditions=None, save_every_state=1, random_seed=None, verbosity=True):
+    """
+    Propagate many independent Langevin walkers on the same potential.
+
+    Parameters
+    ----------
+    potential: ensembler potential
+        The potential to sample (1D or 2D). With a
+        :class:`GridMetadynamicsPotential`, every walker adds a Gaussian to the
+        shared bias every ``n_trigger`` steps.
+    sampler: langevinIntegrator or langevinVelocityIntegrator
+        Provides the integration scheme and its settings.
+    start_positions: float or array-like
+        Start position of every walker, shape (n_walkers, n_dimensions), or
+        one start position shared by ``n_walkers`` walkers.
+    steps: int
+        Number of integration steps.
+    n_walkers: int or None
+        Number of walkers if only one start position is given.
+    temperature: float
+        Temperature (in kT units, as in ensembler).
+    mass: float
+        Mass of the particles.
+    conditions: list or None
+        ``periodicBoundaryCondition`` objects as given to ``system``.
+    save_every_state: int
+        Save every n-th step.
+    random_seed: int or None
+        Seed of the random number generator.
+    verbosity: bool
+        Show a progress bar.
+
+    Returns
+    -------
+    trajectory: WalkerTrajectory
+        The saved frames of all walkers.
+    """
+    if not isinstance(sampler, langevinIntegrator):
+        raise ValueError("simulate_walkers needs a langevinIntegrator or langevinVelocityIntegrator")
+    n_dimensions = potential.constants[potential.nDimensions]
+    energy, gradient = batch_functions(potential)
+    rng = np.random.default_rng(random_seed)
+
+    position = np.array(start_positions, dtype=float)
+    if n_walkers is not None:
+        position = np.broadcast_to(position.reshape(1, n_dimensions), (n_walkers, n_dimensions))
+    position = position.reshape(-1, n_dimensions).copy()
+    n_walkers = position.shape[0]
+
+    dt = sampler.dt
+    gamma = sampler.gamma
+    lower, length = _periodic_bounds(conditions, n_dimensions)
+    noise_scale = np.sqrt(2 * temperature * gamma * mass / dt)
+    with_velocity = isinstance(sampler, langevinVelocityIntegrator)
+    metadynamics = isinstance(potential, GridMetadynamicsPotential)
+
+    # Initial velocities as in system._gen_rand_vel
+    velocity = np.sqrt(const.gas_constant / 1000.0 * temperature / mass) * rng.normal(size=position.shape)
+    if sampler._oldPosition is not None:
+        old_position = np.broadcast_to(np.asarray(sampler._oldPosition, dtype=float).reshape(-1, n_dimensions),
+                                       position.shape).copy()
+    else:
+        old_position = position - velocity * dt
+    forces = -gradient(position)
+    random_forces = noise_scale * rng.normal(size=position.shape)
+
+    # The last step is always saved
+    saved_steps = list(range(0, steps + 1, save_every_state))
+    if saved_steps[-1] != steps:
+        saved_steps.append(steps)
+    frames = np.empty((len(saved_steps), n_walkers, n_dimensions))
+    energies = np.empty((len(saved_steps), n_walkers))
+    velocities = np.empty_like(frames) if with_velocity else None
+
+    def save(frame):
+        frames[frame] = position
+        energies[frame] = energy(position)
+        if with_velocity:
+            velocities[frame] = velocity
+
+    save(0)
+    frame = 1
+    iteration_queue = tqdm(range(1, steps + 1), desc="Walkers: ", mininterval=1.0) if verbosity else range(1, steps + 1)
+    for step in iteration_queue:
+        if with_velocity:
+            # Brünger-Brooks-Karplus for velocities (as langevinVelocityIntegrator)
+            half_step_velocity = (1 - gamma * dt / 2) * velocity + dt / (2 * mass) * (forces + random_forces)
+            new_position = position + half_step_velocity * dt
+        else:
+            # Brünger-Brooks-Karplus for positions (as langevinIntegrator)
+            new_position = (2 * position - old_position + gamma * dt / 2 * old_position
+                            + dt ** 2 / mass * (random_forces + forces)) / (1 + gamma * dt / 2)
+        old_position = position
+        position = new_position
+
+        if lower is not None:
+            # Wrap into the box and move the previous position along, so that
+            # the position Langevin update does not see a jump of one box length
+            wrapped = lower + np.mod(position - lower, length)
+            old_position = old_position + (wrapped - position)
+            position = wrapped
+
+        if metadynamics and step % potential.n_trigger == 0:
+            potential.deposit(position)
+
+        # One force evaluation for all walkers
+        random_forces = noise_scale * rng.normal(size=position.shape)
+        forces = -gradient(position)
+        if with_velocity:
+            # Same last half step as langevinVelocityIntegrator (dt / m instead of dt / 2m),
+            # so that walkers and ensembler systems sample the same distribution
+            velocity = (half_step_velocity + dt / mass * (forces + random_forces)) / (1 + gamma * dt / 2)
+
+        if frame < len(saved_steps) and step == saved_steps[frame]:
+            save(frame)
+            frame += 1
+
+    return WalkerTrajectory(step=np.array(saved_steps), position=frames, total_potential_energy=energies,
+                            velocity=velocities, temperature=temperature)
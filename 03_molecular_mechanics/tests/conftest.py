@@ -0,0 +1,5 @@
+import sys
+from os import path
+
+# Make md_utils importable without installing it
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
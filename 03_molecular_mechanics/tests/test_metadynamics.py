@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from ensembler.potentials import OneD as potentials1D
+from ensembler.samplers.stochastic import langevinIntegrator
+
+from md_utils import GridMetadynamicsPotential, simulate_walkers
+
+
+def make_potentials(**kwargs):
+    settings = dict(amplitude=0.3, sigma=0.2, n_trigger=10, bias_grid_min=0, bias_grid_max=10, numbins=100)
+    settings.update(kwargs)
+    V = potentials1D.harmonicOscillatorPotential(k=1, x_shift=5)
+    reference = potentials1D.metadynamicsPotential(origPotential=V, **settings)
+    return GridMetadynamicsPotential(origPotential=V, cutoff=20.0, **settings), reference
+
+
+def test_bias_grid_matches_ensembler():
+    potential, reference = make_potentials()
+    for center in [4.0, 4.37, 5.5, 0.05]:
+        potential.deposit(center)
+        reference._update_potential(center)
+    assert potential.n_hills == 4
+    np.testing.assert_allclose(potential.bias_grid_energy, reference.bias_grid_energy, atol=1e-12)
+    np.testing.assert_allclose(potential.bias_grid_force, reference.bias_grid_force, atol=1e-12)
+
+    # The bin centers fall into the same bins as in ensembler
+    positions = potential.bin_centers[[0, 39, 44, 50, 99]]
+    np.testing.assert_allclose(potential.ene(positions), reference.ene(positions))
+    np.testing.assert_allclose(potential.force(positions), reference.force(positions))
+    assert potential.ene(positions[2]) == pytest.approx(reference.ene(float(positions[2])))
+    # No bias outside of the grid
+    assert potential.ene(-1.0) == pytest.approx(18.0)
+    assert potential.ene(np.array([-1.0, 11.0])) == pytest.approx([18.0, 18.0])
+
+
+def test_single_positions_use_the_same_bins_as_arrays():
+    potential, _ = make_potentials()
+    potential.bias_grid_energy[:] = np.arange(potential.numbins)
+    potential.bias_grid_force[:] = -np.arange(potential.numbins)
+    # (1.0 - 0) // 0.1 is 9, but floor(1.0 / 0.1) is 10
+    positions = np.array([0.3, 0.7, 1.0, 2.3, 9.999999999999998, 10.0])
+    energies = potential.ene(positions)
+    forces = potential.force(positions)
+    for position, energy, force in zip(positions, energies, forces):
+        assert potential.ene(position) == energy
+        assert potential.force(position) == force
+
+
+def test_truncated_deposition_and_well_tempering():
+    V = potentials1D.harmonicOscillatorPotential(k=1, x_shift=5)
+    potential = GridMetadynamicsPotential(origPotential=V, amplitude=0.3, sigma=0.2, bias_grid_min=0,
+                                          bias_grid_max=10, numbins=100, bias_temperature=2.0, cutoff=5.0)
+    potential.deposit([5.0, 5.0])
+    # Bin 50 has its center at 5.05; the second hill is lowered by exp(-V_bias / Delta T)
+    first_bias = 0.3 * np.exp(-0.05 ** 2 / (2 * 0.2 ** 2))
+    assert potential.bias_energy(5.0) == pytest.approx(first_bias * (1 + np.exp(-first_bias / 2.0)))
+    # Bins beyond the cutoff of 5 sigma = 10 bins stay untouched
+    assert potential.bias_grid_energy[:40].max() == 0.0
+    assert potential.bias_grid_energy[61:].max() == 0.0
+    bin_centers, free_energy = potential.free_energy(temperature=1.0)
+    np.testing.assert_allclose(free_energy, 1.5 * (potential.bias_grid_energy.max() - potential.bias_grid_energy),
+                               atol=1e-12)
+
+
+def test_walkers_share_the_bias():
+    V = potentials1D.harmonicOscillatorPotential(k=1, x_shift=5)
+    potential = GridMetadynamicsPotential(origPotential=V, amplitude=0.05, sigma=0.3, n_trigger=5,
+                                          bias_grid_min=0, bias_grid_max=10, numbins=100)
+    traj = simulate_walkers(potential, langevinIntegrator(dt=0.05, gamma=5), 5.0, steps=500, n_walkers=20,
+                            temperature=1.0, random_seed=0, verbosity=False)
+    assert traj.position.shape == (501, 20, 1)
+    assert potential.n_hills == 20 * 500 // 5
+    # Most hills are deposited close to the minimum of the well
+    assert abs(potential.bin_centers[np.argmax(potential.bias_grid_energy)] - 5.0) < 0.5
@@ -0,0 +1,74 @@
+import multiprocessing as mp
+
+import numpy as np
+import pytest
+
+from ensembler.ensemble.replica_exchange import temperatureReplicaExchange
+from ensembler.potentials import OneD as potentials1D
+from ensembler.samplers.stochastic import metropolisMonteCarloIntegrator
+from ensembler.system.basic_system import system
+
+from md_utils import ParallelReplicaExchange
+
+TEMPERATURES = [100, 200, 400, 800]
+
+
+class FailingSystem(system):
+    """
+    System whose propagation fails in the worker.
+    """
+
+    def simulate(self, *args, **kwargs):
+        raise RuntimeError("propagation failed")
+
+
+def make_ensemble(system_class=system, **kwargs):
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    sys = system_class(potential=V, sampler=metropolisMonteCarloIntegrator(step_size_coefficient=1),
+                       start_position=0.0, temperature=TEMPERATURES[0], verbose=False)
+    return temperatureReplicaExchange(system=sys, temperature_range=TEMPERATURES, steps_between_trials=10,
+                                      **kwargs)
+
+
+def test_parallel_replica_exchange():
+    ensemble = make_ensemble()
+    with ParallelReplicaExchange(ensemble, n_workers=2, random_seed=0) as parallel:
+        states = parallel.simulate(5)
+        trajectories = parallel.replica_trajectories()
+    assert not mp.active_children()
+
+    assert list(trajectories) == list(ensemble.replicas)
+    for coordinate, replica in ensemble.replicas.items():
+        # The initial state and 10 steps per trial
+        assert len(trajectories[coordinate]) == 51
+        # The replicas keep their temperatures, the positions are exchanged
+        assert replica.temperature == TEMPERATURES[coordinate]
+        state = states[coordinate]
+        assert state.total_potential_energy == pytest.approx(replica.potential.ene(state.position))
+    assert len(ensemble.exchange_information) == 5 * len(TEMPERATURES)
+    assert ensemble.exchange_information.doExchange.any()
+
+    with pytest.raises(ValueError):
+        parallel.replica_trajectories()
+
+
+def test_workers_draw_different_random_numbers():
+    ensemble = make_ensemble()
+    with ParallelReplicaExchange(ensemble, n_workers=4, random_seed=0) as parallel:
+        parallel.run()
+        trajectories = parallel.replica_trajectories()
+    positions = [np.asarray(trajectory.position[1:], dtype=float) for trajectory in trajectories.values()]
+    assert not np.allclose(positions[0], positions[1])
+
+
+def test_worker_errors_are_raised():
+    ensemble = make_ensemble(FailingSystem)
+    with pytest.raises(RuntimeError, match="propagation failed"):
+        with ParallelReplicaExchange(ensemble, n_workers=2) as parallel:
+            parallel.simulate(1)
+    assert not mp.active_children()
+
+
+def test_exchanging_trajectories_is_rejected():
+    with pytest.raises(ValueError):
+        ParallelReplicaExchange(make_ensemble(exchange_trajs=True))
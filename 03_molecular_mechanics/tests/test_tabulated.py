@@ -0,0 +1,91 @@
+import copy
+
+import numpy as np
+import pytest
+
+from ensembler.potentials import OneD as potentials1D
+from ensembler.potentials import TwoD as potentials2D
+from ensembler.samplers.stochastic import langevinIntegrator
+from ensembler.system.basic_system import system
+
+from md_utils import TabulatedPotential, tabulate
+from md_utils import tabulated
+
+
+def double_well():
+    return potentials1D.addedPotentials(potentials1D.harmonicOscillatorPotential(k=1, x_shift=2),
+                                        potentials1D.harmonicOscillatorPotential(k=0.5, x_shift=5))
+
+
+def test_1d_table_matches_potential():
+    V = double_well()
+    V_tab = TabulatedPotential(V, limits=(0, 10))
+    positions = np.random.default_rng(0).uniform(0, 10, 50)
+    np.testing.assert_allclose(V_tab.ene(positions), V.ene(positions), atol=1e-5)
+    np.testing.assert_allclose(V_tab.force(positions), np.ravel(V.force(positions)), atol=1e-5)
+    # Single positions use the same interpolation as arrays
+    for position in [0.0, 3.3, 10.0]:
+        assert V_tab.ene(position) == pytest.approx(V_tab.ene(np.array([position, position]))[0])
+        assert V_tab.force(position) == pytest.approx(V.force(position), abs=1e-5)
+
+
+def test_outside_the_grid_uses_the_potential():
+    V = double_well()
+    V_tab = TabulatedPotential(V, limits=(0, 10), n_points=101)
+    assert V_tab.ene(-3.0) == pytest.approx(V.ene(-3.0))
+    np.testing.assert_allclose(V_tab.ene(np.array([-3.0, 12.0])), V.ene(np.array([-3.0, 12.0])))
+    np.testing.assert_allclose(V_tab.force(np.array([-3.0, 12.0])), np.ravel(V.force(np.array([-3.0, 12.0]))))
+
+
+def test_2d_periodic_table_matches_potential():
+    V = potentials2D.wavePotential(amplitude=(1, 1), radians=True)
+    V_tab = TabulatedPotential(V, limits=[(-np.pi, np.pi), (-np.pi, np.pi)], periodic=True)
+    positions = np.random.default_rng(0).uniform(-3 * np.pi, 3 * np.pi, size=(30, 2))
+    np.testing.assert_allclose(V_tab.ene(positions), [V.ene(x) for x in positions], atol=1e-3)
+    np.testing.assert_allclose(V_tab.force(positions), [np.ravel(V.force(x)) for x in positions], atol=1e-3)
+    for position in positions[:5]:
+        assert V_tab.ene(position) == pytest.approx(V.ene(position), abs=1e-3)
+        np.testing.assert_allclose(V_tab.force(position), np.ravel(V.force(position)), atol=1e-3)
+
+
+def test_simulation_with_table_matches_potential():
+    V = double_well()
+    trajectories = []
+    for potential in [V, TabulatedPotential(V, limits=(-5, 15))]:
+        np.random.seed(0)
+        sys = system(potential=potential, sampler=langevinIntegrator(dt=0.1, gamma=1), start_position=2.0,
+                     temperature=1.0)
+        sys.simulate(50, verbosity=False)
+        trajectories.append(np.asarray(sys.trajectory.position, dtype=float))
+    np.testing.assert_allclose(trajectories[1], trajectories[0], atol=1e-4)
+
+
+def test_deepcopy():
+    V_tab = TabulatedPotential(double_well(), limits=(0, 10), n_points=101)
+    V_copy = copy.deepcopy(V_tab)
+    assert V_copy.ene(3.0) == V_tab.ene(3.0)
+
+
+def test_tables_are_cached(tmp_path, monkeypatch):
+    V = double_well()
+    energies, _ = tabulate(V, (0, 10), n_points=51, cache_dir=tmp_path)
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+    assert tabulate(V, (0, 10), n_points=51)[0] is energies
+
+    # A new session reads the table from the cache directory
+    monkeypatch.setattr(tabulated, "_TABLES", {})
+    monkeypatch.setattr(tabulated, "batch_functions", None)
+    np.testing.assert_array_equal(tabulate(V, (0, 10), n_points=51, cache_dir=tmp_path)[0], energies)
+
+    # Other parameters give another table
+    V_other = potentials1D.harmonicOscillatorPotential(k=2)
+    monkeypatch.undo()
+    assert not np.array_equal(tabulate(V_other, (0, 10), n_points=51, cache_dir=tmp_path)[0], energies)
+    assert len(list(tmp_path.glob("*.npz"))) == 2
+
+
+def test_biased_potentials_are_rejected():
+    V = potentials1D.metadynamicsPotential(origPotential=double_well(), amplitude=0.3, sigma=0.2, n_trigger=10,
+                                           bias_grid_min=0, bias_grid_max=10, numbins=100)
+    with pytest.raises(ValueError):
+        TabulatedPotential(V, limits=(0, 10))
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ensembler.potentials import OneD as potentials1D
+from ensembler.potentials import TwoD as potentials2D
+from ensembler.samplers.stochastic import langevinIntegrator, langevinVelocityIntegrator
+from ensembler.system.basic_system import system
+from ensembler.system.perturbed_system import perturbedSystem
+
+from md_utils import ArrayTrajectory, BufferedPerturbedSystem, BufferedSystem
+
+
+def run(system_class, potential, sampler, start_position, steps, save_every_state=1, **kwargs):
+    np.random.seed(0)
+    sys = system_class(potential=potential, sampler=sampler, start_position=start_position, temperature=1.0,
+                       **kwargs)
+    sys.simulate(steps, save_every_state=save_every_state, verbosity=False)
+    return sys
+
+
+def assert_same_trajectory(buffered, reference, start=0):
+    assert list(buffered.columns) == list(reference.columns)
+    assert len(buffered) == len(reference)
+    for column in reference.columns:
+        for value, expected in zip(buffered[column][start:], reference[column][start:]):
+            # Missing values (None in ensembler) are stored as NaN
+            expected = np.nan if expected is None else expected
+            np.testing.assert_allclose(value, np.broadcast_to(np.asarray(expected, dtype=float), np.shape(value)),
+                                       equal_nan=True)
+
+
+@pytest.mark.parametrize("save_every_state", [1, 7])
+def test_buffered_system_matches_ensembler(save_every_state):
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    reference = run(system, V, langevinVelocityIntegrator(dt=0.1, gamma=1), 1.0, 50, save_every_state)
+    buffered = run(BufferedSystem, V, langevinVelocityIntegrator(dt=0.1, gamma=1), 1.0, 50, save_every_state)
+    assert_same_trajectory(buffered.trajectory, reference.trajectory)
+    assert buffered.trajectory_arrays["position"].shape == (len(reference.trajectory),)
+
+
+def test_buffered_system_2d():
+    V = potentials2D.wavePotential(amplitude=(1, 1), radians=True)
+    reference = run(system, V, langevinIntegrator(dt=0.1, gamma=1), [0.5, 0.5], 30)
+    buffered = run(BufferedSystem, V, langevinIntegrator(dt=0.1, gamma=1), [0.5, 0.5], 30)
+    assert_same_trajectory(buffered.trajectory, reference.trajectory)
+    assert buffered.trajectory_arrays["position"].shape == (len(reference.trajectory), 2)
+    assert isinstance(buffered.trajectory.position.iloc[-1], np.ndarray)
+
+
+def test_buffered_perturbed_system_matches_ensembler():
+    V = potentials1D.linearCoupledPotentials(Va=potentials1D.harmonicOscillatorPotential(k=1),
+                                             Vb=potentials1D.harmonicOscillatorPotential(k=3, x_shift=1))
+    reference = run(perturbedSystem, V, langevinIntegrator(dt=0.1, gamma=1), 0.0, 40, lam=0.3)
+    buffered = run(BufferedPerturbedSystem, V, langevinIntegrator(dt=0.1, gamma=1), 0.0, 40, lam=0.3)
+    # ensembler stores its first state before lam is set; the buffered system stores it at lam = 0.3
+    assert_same_trajectory(buffered.trajectory, reference.trajectory, start=1)
+    assert buffered.trajectory.total_potential_energy[0] == pytest.approx(V.ene(0.0))
+
+
+def test_simulate_appends_and_withdraws():
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    sys = run(BufferedSystem, V, langevinIntegrator(dt=0.1, gamma=1), 0.0, 10)
+    n_states = len(sys.trajectory)
+    sys.simulate(10, verbosity=False)
+    assert len(sys.trajectory) == 2 * n_states - 1
+    sys.simulate(10, withdraw_traj=True, verbosity=False)
+    assert len(sys.trajectory) == n_states
+
+
+def test_array_trajectory_list_interface():
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    sys = system(potential=V, sampler=langevinIntegrator(), start_position=0.0, temperature=1.0)
+    trajectory = ArrayTrajectory(sys.state, capacity=2)
+    states = [sys.state(**{field: float(i) for field in sys.state._fields}) for i in range(5)]
+    for state in states:
+        trajectory.append(state)
+    # The buffers grow past the initial capacity
+    assert trajectory.capacity >= 5
+    assert len(trajectory) == 5
+    assert trajectory[-1] == states[-1]
+    assert list(trajectory) == states
+    assert trajectory.pop() == states[-1]
+    assert len(trajectory.to_dataframe()) == 4
+    with pytest.raises(IndexError):
+        trajectory[4]
+    trajectory.clear()
+    assert len(trajectory) == 0
+    assert isinstance(trajectory.to_dataframe(), pd.DataFrame)
+
+
+def test_missing_values_widen_columns():
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    sys = system(potential=V, sampler=langevinIntegrator(), start_position=0.0, temperature=1.0)
+    trajectory = ArrayTrajectory(sys.state)
+    values = {field: 0.0 for field in sys.state._fields}
+    # e.g. no velocity in the first state of a 2D system
+    trajectory.append(sys.state(**{**values, "velocity": None}))
+    trajectory.append(sys.state(**{**values, "velocity": np.array([1.0, 2.0])}))
+    np.testing.assert_array_equal(trajectory.arrays()["velocity"], [[np.nan, np.nan], [1.0, 2.0]])
@@ -0,0 +1,96 @@
+from collections import namedtuple
+
+import numpy as np
+import pytest
+
+from ensembler.potentials import OneD as potentials1D
+from ensembler.potentials import TwoD as potentials2D
+from ensembler.samplers.stochastic import langevinIntegrator
+from ensembler.system.basic_system import system
+
+from md_utils import DiskSystem, TrajectoryFile, TrajectoryWriter, potential_energies
+
+
+def run(system_class, potential, start_position, steps, save_every_state=1, **kwargs):
+    np.random.seed(0)
+    sys = system_class(potential=potential, sampler=langevinIntegrator(dt=0.1, gamma=1),
+                       start_position=start_position, temperature=1.0, **kwargs)
+    sys.simulate(steps, save_every_state=save_every_state, verbosity=False)
+    return sys
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_disk_system_matches_ensembler(tmp_path, chunk_size):
+    V = potentials2D.wavePotential(amplitude=(1, 1), radians=True)
+    reference = run(system, V, [0.5, 0.5], 30, save_every_state=3).trajectory
+    sys = run(DiskSystem, V, [0.5, 0.5], 30, save_every_state=3, trajectory_path=tmp_path / "wave.traj",
+              chunk_size=chunk_size)
+
+    traj = TrajectoryFile(tmp_path / "wave.traj")
+    assert len(traj) == len(reference)
+    assert isinstance(traj["position"], np.memmap)
+    np.testing.assert_allclose(traj["position"], np.array(reference.position.tolist()))
+    np.testing.assert_allclose(traj["total_potential_energy"], reference.total_potential_energy.astype(float))
+    assert list(sys.trajectory.columns) == list(reference.columns)
+
+    frame = traj.to_dataframe(start=2, stride=3)
+    assert list(frame.index) == list(range(2, len(reference), 3))
+    np.testing.assert_allclose(np.array(frame.position.tolist()), np.array(reference.position[2::3].tolist()))
+
+
+def test_potential_energies(tmp_path):
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    V_other = potentials1D.harmonicOscillatorPotential(k=3, x_shift=1)
+    run(DiskSystem, V, 0.0, 50, trajectory_path=tmp_path / "ho.traj")
+    traj = TrajectoryFile(tmp_path / "ho.traj")
+    positions = np.array(traj["position"])
+    np.testing.assert_allclose(potential_energies(traj, V_other, chunk_size=8), V_other.ene(positions))
+    np.testing.assert_allclose(potential_energies(tmp_path / "ho.traj", V, start=10, stride=5),
+                               traj["total_potential_energy"][10::5])
+
+
+def test_as_system_uses_stored_potential(tmp_path):
+    V = potentials1D.harmonicOscillatorPotential(k=2)
+    run(DiskSystem, V, 1.0, 10, trajectory_path=tmp_path / "ho.traj")
+    view = TrajectoryFile(tmp_path / "ho.traj").as_system(stride=2)
+    assert view.nDimensions == 1
+    assert len(view.trajectory) == 6
+    assert view.potential.ene(1.0) == pytest.approx(V.ene(1.0))
+
+
+def test_writer_flush_append_and_pop(tmp_path):
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    sys = system(potential=V, sampler=langevinIntegrator(), start_position=0.0, temperature=1.0)
+    states = [sys.state(**{field: float(i) for field in sys.state._fields}) for i in range(5)]
+
+    writer = TrajectoryWriter(tmp_path / "t.traj", sys.state, chunk_size=2)
+    for state in states:
+        writer.append(state)
+    # Only full chunks are on disk
+    assert len(TrajectoryFile(tmp_path / "t.traj")) == 4
+    assert list(writer) == states
+    assert writer.pop() == states[4]
+    assert writer.pop() == states[3]
+    assert len(TrajectoryFile(tmp_path / "t.traj")) == 3
+
+    # Bytes written after the last metadata update (an interrupted flush) are dropped
+    with open(tmp_path / "t.traj" / "position.dat", "ab") as f:
+        f.write(b"\0" * 4)
+    writer = TrajectoryWriter(tmp_path / "t.traj", sys.state, append=True)
+    writer.append(states[4])
+    writer.flush()
+    traj = TrajectoryFile(tmp_path / "t.traj")
+    np.testing.assert_array_equal(traj["position"], [0.0, 1.0, 2.0, 4.0])
+
+    other_state = namedtuple("state", ["position"])
+    with pytest.raises(ValueError):
+        TrajectoryWriter(tmp_path / "t.traj", other_state, append=True)
+
+
+def test_continued_simulation_appends(tmp_path):
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    sys = run(DiskSystem, V, 0.0, 10, trajectory_path=tmp_path / "ho.traj")
+    sys.simulate(10, verbosity=False)
+    assert len(TrajectoryFile(tmp_path / "ho.traj")) == 21
+    sys.simulate(5, withdraw_traj=True, verbosity=False)
+    assert len(TrajectoryFile(tmp_path / "ho.traj")) == 6
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from ensembler.conditions.box_conditions import periodicBoundaryCondition
+from ensembler.potentials import OneD as potentials1D
+from ensembler.potentials import TwoD as potentials2D
+from ensembler.samplers.stochastic import langevinIntegrator, langevinVelocityIntegrator
+from ensembler.system import system
+
+from md_utils import batch_functions, simulate_walkers
+
+
+def test_batch_functions_match_ensembler():
+    V = potentials2D.wavePotential(amplitude=(1, 1), radians=True)
+    energy, gradient = batch_functions(V)
+    positions = np.random.default_rng(0).uniform(-3, 3, size=(20, 2))
+    np.testing.assert_allclose(energy(positions), [V.ene(x) for x in positions])
+    np.testing.assert_allclose(gradient(positions), [np.ravel(V.force(x)) for x in positions])
+
+    V = potentials1D.harmonicOscillatorPotential(k=2, x_shift=1)
+    energy, gradient = batch_functions(V)
+    np.testing.assert_allclose(energy(np.array([[0.0], [3.0]])), [1.0, 4.0])
+    np.testing.assert_allclose(gradient(np.array([[0.0], [3.0]])), [[-2.0], [4.0]])
+
+
+def test_walkers_sample_boltzmann_distribution():
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    traj = simulate_walkers(V, langevinIntegrator(dt=0.05, gamma=5), 0.0, steps=2000, n_walkers=500,
+                            temperature=2.0, save_every_state=100, random_seed=1, verbosity=False)
+    assert traj.position.shape == (21, 500, 1)
+    assert list(traj.step) == list(range(0, 2001, 100))
+    assert traj.velocity is None
+    # <x^2> = kT / k
+    assert np.var(traj.position[5:]) == pytest.approx(2.0, rel=0.1)
+    np.testing.assert_allclose(traj.total_potential_energy, 0.5 * traj.position[..., 0] ** 2)
+    assert len(traj.walker(3)) == 21
+
+
+def test_velocity_walkers_match_ensembler_system():
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    traj = simulate_walkers(V, langevinVelocityIntegrator(dt=0.05, gamma=5), 0.0, steps=2000, n_walkers=500,
+                            temperature=2.0, save_every_state=100, random_seed=1, verbosity=False)
+    assert traj.velocity.shape == traj.position.shape
+
+    np.random.seed(0)
+    reference_system = system(potential=V, sampler=langevinVelocityIntegrator(dt=0.05, gamma=5),
+                              start_position=0.0, temperature=2.0, verbose=False)
+    reference_system.simulate(20000, verbosity=False)
+    reference = np.var(np.array(reference_system.trajectory.position.tolist(), dtype=float)[1000:])
+    assert np.var(traj.position[5:]) == pytest.approx(reference, rel=0.15)
+
+
+def test_walkers_periodic_boundaries():
+    V = potentials2D.wavePotential(amplitude=(1, 1), radians=True)
+    condition = periodicBoundaryCondition(boundary=[[-np.pi, np.pi], [-np.pi, np.pi]])
+    traj = simulate_walkers(V, langevinIntegrator(dt=0.1, gamma=10), [0.0, 0.0], steps=200, n_walkers=50,
+                            temperature=5.0, conditions=[condition], random_seed=0, verbosity=False)
+    assert traj.position.min() >= -np.pi and traj.position.max() <= np.pi
+
+
+@pytest.mark.parametrize("steps, save_every_state, saved", [(0, 1, [0]), (5, 2, [0, 2, 4, 5]), (4, 2, [0, 2, 4])])
+def test_walkers_saved_steps(steps, save_every_state, saved):
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    traj = simulate_walkers(V, langevinIntegrator(dt=0.1, gamma=10), [[0.5], [1.0]], steps=steps,
+                            save_every_state=save_every_state, verbosity=False)
+    assert list(traj.step) == saved
+    np.testing.assert_allclose(traj.position[0, :, 0], [0.5, 1.0])
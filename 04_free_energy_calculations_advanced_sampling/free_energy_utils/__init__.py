@@ -0,0 +1,17 @@
+"""
+Helper functions for the free-energy notebooks.
+
+The notebooks live in ``04_free_energy_calculations_advanced_sampling`` itself,
+so the package can be imported directly:
+
+>>> from free_energy_utils import simulate_lambda_windows
+"""
+
+from .lambda_windows import simulate_lambda_windows
+from .mbar import MBAR, mbar_free_energies, reduced_potential_matrix, select_samples
+from .bar import LogBennettAcceptanceRatio, bar_free_energy, bar_from_work
+from .accumulators import (AccumulatingPerturbedSystem, AccumulatingSystem, BARAccumulator, RunningMoments,
+                           TIAccumulator, ZwanzigAccumulator, ti_free_energy)
+from .equilibration import (autocorrelation, decorrelated_indices, detect_equilibration, statistical_inefficiency,
+                            subsample_indices)
+from .monte_carlo import ChainTrajectory, simulate_chains, zwanzig_chains
@@ -0,0 +1,363 @@
+"""
+Free-energy estimates that are updated while a system is simulated.
+
+The notebook evaluates the Zwanzig/BAR/TI estimates after ``simulate`` from the
+stored trajectory. The accumulators here are fed one state after the other
+and keep only running sums: log-sum-exp sums of the exponential averages and
+Welford mean/variance of energy differences and dH/dlambda. Free energy and
+standard error can be read at any time; BAR keeps one work value per sample,
+the trajectory itself is not needed.
+
+``AccumulatingSystem``/``AccumulatingPerturbedSystem`` feed the accumulators
+during ``simulate`` and stop early once all of them reach ``target_error``.
+The standard errors assume uncorrelated samples, so ``accumulate_every``
+should be about the correlation time of the trajectory.
+
+Example
+-------
+>>> zwanzig = ZwanzigAccumulator(V_B)
+>>> systemA = AccumulatingSystem(potential=V_A, sampler=sampler, start_position=0, temperature=temperature)
+>>> systemA.simulate(steps, accumulators=[zwanzig], equilibration_steps=equilibration_steps,
+...                  target_error=0.05, store_trajectory=False)
+>>> zwanzig.free_energy, zwanzig.error, systemA.step
+"""
+
+import numpy as np
+from scipy.special import logsumexp
+from tqdm import tqdm
+
+from ensembler.system.basic_system import system
+from ensembler.system.perturbed_system import perturbedSystem
+
+from .bar import bar_from_work
+
+
+class RunningMoments:
+    """
+    Welford mean and variance of a stream of values, updated in batches.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, values):
+        """
+        Add one value or an array of values.
+        """
+        values = np.asarray(values, dtype=float).reshape(-1)
+        if values.size == 0:
+            return
+        n_new = values.size
+        mean_new = values.mean()
+        m2_new = np.sum((values - mean_new) ** 2)
+        # Chan et al.: combine the moments of the old and the new values
+        n = self.n + n_new
+        delta = mean_new - self.mean
+        self.mean += delta * n_new / n
+        self._m2 += m2_new + delta ** 2 * self.n * n_new / n
+        self.n = n
+
+    @property
+    def variance(self):
+        return self._m2 / (self.n - 1) if self.n > 1 else np.nan
+
+    @property
+    def error(self):
+        """
+        Standard error of the mean.
+        """
+        return np.sqrt(self.variance / self.n) if self.n > 1 else np.inf
+
+
+class ZwanzigAccumulator:
+    """
+    Running Zwanzig estimate F_j - F_i from samples of state i.
+
+    Parameters
+    ----------
+    potential_j: ensembler potential or None
+        The potential of the target state, evaluated at every state passed to
+        :meth:`add_state`. Not needed for :meth:`add`.
+    kT: float
+        k_B T in the energy units of the potential (1 for energies in kT).
+    """
+
+    def __init__(self, potential_j=None, kT=1.0):
+        self.potential_j = potential_j
+        self.kT = kT
+        # log sum exp(-w) and log sum exp(-2 w) of the reduced work w
+        self._log_sum = -np.inf
+        self._log_sum_squares = -np.inf
+        self.energy_difference = RunningMoments()
+
+    @property
+    def n(self):
+        return self.energy_difference.n
+
+    def add(self, Vi, Vj):
+        """
+        Add the energies of states i and j of one or several samples of state i.
+        """
+        delta = np.asarray(Vj, dtype=float).reshape(-1) - np.asarray(Vi, dtype=float).reshape(-1)
+        work = delta / self.kT
+        self._log_sum = np.logaddexp(self._log_sum, logsumexp(-work))
+        self._log_sum_squares = np.logaddexp(self._log_sum_squares, logsumexp(-2 * work))
+        self.energy_difference.add(delta)
+
+    def add_state(self, sys):
+        """
+        Add the current state of a system sampling state i.
+        """
+        state = sys.current_state
+        self.add(state.total_potential_energy, self.potential_j.ene(state.position))
+
+    @property
+    def free_energy(self):
+        if self.n == 0:
+            return np.nan
+        return -self.kT * (self._log_sum - np.log(self.n))
+
+    @property
+    def error(self):
+        """
+        Standard error of the free energy (delta method on the exponential average).
+        """
+        if self.n < 2:
+            return np.inf
+        # var(exp(-w)) / <exp(-w)>^2
+        relative_variance = np.exp(self._log_sum_squares + np.log(self.n) - 2 * self._log_sum) - 1.0
+        return self.kT * np.sqrt(max(relative_variance, 0.0) / self.n)
+
+
+class _WorkSeries:
+    """
+    Reduced work values of one direction of a :class:`BARAccumulator`.
+    """
+
+    def __init__(self, accumulator, potential_other):
+        self.accumulator = accumulator
+        self.potential_other = potential_other
+        self._chunks = []
+        self.n = 0
+
+    def add(self, V_own, V_other):
+        """
+        Add the energies of the sampled and of the other state of one or several samples.
+        """
+        work = (np.asarray(V_other, dtype=float).reshape(-1) - np.asarray(V_own, dtype=float).reshape(-1))
+        self._chunks.append(work / self.accumulator.kT)
+        self.n += work.size
+        self.accumulator._result = None
+
+    def add_state(self, sys):
+        state = sys.current_state
+        self.add(state.total_potential_energy, self.potential_other.ene(state.position))
+
+    def values(self):
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0] if self._chunks else np.zeros(0)
+
+    # Systems stop early on the error of the combined estimate
+    @property
+    def error(self):
+        return self.accumulator.error
+
+
+class BARAccumulator:
+    """
+    Running BAR estimate F_j - F_i from samples of both states.
+
+    All work values are kept. ``free_energy`` and ``error`` solve BAR on all of
+    them, which costs O(N); the result is reused until new samples arrive.
+
+    The two directions are fed separately, e.g. by two systems:
+    ``systemA.simulate(..., accumulators=[bar.forward])`` and
+    ``systemB.simulate(..., accumulators=[bar.backward])``. Early stopping
+    on either direction uses the error of the combined estimate, which is
+    infinite until both directions have samples.
+
+    Parameters
+    ----------
+    potential_i, potential_j: ensembler potential or None
+        Potentials of both states; ``potential_j`` is evaluated for the
+        samples of state i and vice versa.
+    kT: float
+        k_B T in the energy units of the potentials.
+    """
+
+    def __init__(self, potential_i=None, potential_j=None, kT=1.0):
+        self.kT = kT
+        self.forward = _WorkSeries(self, potential_j)
+        self.backward = _WorkSeries(self, potential_i)
+        self._result = None
+
+    def _solve(self):
+        if self._result is None:
+            if self.forward.n == 0 or self.backward.n == 0:
+                return np.nan, np.inf
+            df, ddf, _ = bar_from_work(self.forward.values(), self.backward.values(), tolerance=1e-8)
+            self._result = self.kT * df, self.kT * ddf
+        return self._result
+
+    @property
+    def free_energy(self):
+        return self._solve()[0]
+
+    @property
+    def error(self):
+        return self._solve()[1]
+
+
+class TIAccumulator:
+    """
+    Running mean of dH/dlambda of one lambda window.
+
+    :func:`ti_free_energy` integrates the means of several windows.
+    """
+
+    def __init__(self, lam=None):
+        self.lam = lam
+        self.dhdlam = RunningMoments()
+
+    @property
+    def n(self):
+        return self.dhdlam.n
+
+    def add(self, dhdlam):
+        self.dhdlam.add(dhdlam)
+
+    def add_state(self, sys):
+        if self.lam is None:
+            self.lam = sys.lam
+        self.add(sys.current_state.dhdlam)
+
+    @property
+    def mean(self):
+        return self.dhdlam.mean
+
+    @property
+    def error(self):
+        return self.dhdlam.error
+
+
+def ti_free_energy(accumulators):
+    """
+    Trapezoidal integral of dH/dlambda over the windows of TI accumulators.
+
+    Returns
+    -------
+    dF: float
+        Free-energy difference between the first and the last lambda.
+    ddF: float
+        Standard error, from the independent errors of the window means.
+    """
+    accumulators = sorted(accumulators, key=lambda accumulator: accumulator.lam)
+    lambdas = np.array([accumulator.lam for accumulator in accumulators], dtype=float)
+    means = np.array([accumulator.mean for accumulator in accumulators])
+    errors = np.array([accumulator.error for accumulator in accumulators])
+    # Weight of every window in the trapezoidal rule
+    weights = np.zeros(len(lambdas))
+    weights[1:] += np.diff(lambdas) / 2
+    weights[:-1] += np.diff(lambdas) / 2
+    return float(weights @ means), float(np.sqrt(np.sum((weights * errors) ** 2)))
+
+
+class AccumulatingMixin:
+    """
+    Feeds free-energy accumulators during ``simulate`` and stops at a target error.
+    """
+
+    def simulate(self, steps, withdraw_traj=False, save_every_state=1, init_system=False,
+                 verbosity=True, _progress_bar_prefix="Simulation: ", accumulators=(), equilibration_steps=0,
+                 accumulate_every=1, target_error=None, check_every=100, store_trajectory=True):
+        """
+        Simulate as ``system.simulate`` and add every state to the accumulators.
+
+        Parameters
+        ----------
+        steps: int
+            maximum number of integration steps
+        withdraw_traj: bool, optional
+            reset the current simulation trajectory. (default: False)
+        save_every_state: int, optional
+            save every n step. (and leave out the rest) (default: 1 - each step)
+        init_system: bool, optional
+            initialize the system. (default: False)
+        verbosity: bool, optional
+            change the verbosity of the simulation. (default: True)
+        accumulators: iterable
+            Objects with ``add_state(system)`` and ``error``, e.g.
+            :class:`ZwanzigAccumulator`, :class:`TIAccumulator` or
+            ``BARAccumulator.forward``.
+        equilibration_steps: int
+            Steps before the first state is accumulated.
+        accumulate_every: int
+            Accumulate every n-th step.
+        target_error: float or None
+            Stop once the error of every accumulator is at most target_error
+            (checked every ``check_every`` steps).
+        check_every: int
+            Minimum number of steps between two checks of the errors. The
+            interval grows to a tenth of the steps done so far, because every
+            check of a BAR error solves BAR on all work values.
+        store_trajectory: bool
+            Append the states to the trajectory. If False, only the final
+            state is appended.
+
+        Returns
+        -------
+        state
+            returns the last current state
+        """
+        accumulators = list(accumulators)
+        if init_system:
+            self._init_position()
+            self._init_velocities()
+        if withdraw_traj:
+            self._trajectory = []
+            self._trajectory.append(self.current_state)
+
+        self.update_current_state()
+        self.update_system_properties()
+
+        iteration_queue = tqdm(range(steps), desc=_progress_bar_prefix + " Simulation: ", mininterval=1.0,
+                               leave=verbosity) if verbosity else range(steps)
+        stored = False
+        next_check = check_every
+        for self.step in iteration_queue:
+            self.propagate()
+            self.apply_conditions()
+            self.update_system_properties()
+            self.update_current_state()
+
+            stored = store_trajectory and self.step % save_every_state == 0 and self.step != steps - 1
+            if stored:
+                self._trajectory.append(self.current_state)
+            if self.step >= equilibration_steps and (self.step - equilibration_steps) % accumulate_every == 0:
+                for accumulator in accumulators:
+                    accumulator.add_state(self)
+            if target_error is not None and accumulators and self.step + 1 >= next_check:
+                # At most 10 % more steps than needed, but only O(log(steps)) BAR solutions
+                next_check = self.step + 1 + max(check_every, (self.step + 1) // 10)
+                if all(accumulator.error <= target_error for accumulator in accumulators):
+                    break
+
+        # The final state, unless it was stored before the loop stopped early
+        if not stored:
+            self._trajectory.append(self.current_state)
+        return self.current_state
+
+
+class AccumulatingSystem(AccumulatingMixin, system):
+    """
+    ``system`` that feeds free-energy accumulators during ``simulate``.
+    """
+
+
+class AccumulatingPerturbedSystem(AccumulatingMixin, perturbedSystem):
+    """
+    ``perturbedSystem`` that feeds free-energy accumulators during ``simulate``.
+    """
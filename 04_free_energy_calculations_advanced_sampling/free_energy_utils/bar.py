@@ -0,0 +1,187 @@
+"""
+BAR solved as a root of log-space Fermi sums.
+
+``bennetAcceptanceRatio.calculate`` iterates the BAR fixed point with mpmath,
+evaluating the Fermi function sample by sample. :func:`bar_free_energy` writes
+the Bennett equation with log-sum-exp sums of log-Fermi terms (vectorized over
+the samples, no overflow at large energy gaps) and solves it with Brent's
+method in a bracket given by the forward and backward Zwanzig estimates. It
+also returns the asymptotic standard deviation of the estimate.
+
+:class:`LogBennettAcceptanceRatio` is a drop-in for ``bennetAcceptanceRatio``:
+
+Example
+-------
+>>> bar = LogBennettAcceptanceRatio(kT=True)
+>>> dF_AB_bar = bar.calculate(Vj_i=V21, Vi_i=V11, Vi_j=V12, Vj_j=V22, verbose=True)
+>>> dF_AB_bar, ddF_AB_bar = bar.calculate_with_error(Vj_i=V21, Vi_i=V11, Vi_j=V12, Vj_j=V22)
+"""
+
+import numpy as np
+from scipy import optimize
+from scipy.special import logsumexp
+
+from ensembler.analysis.freeEnergyCalculation import bennetAcceptanceRatio
+
+
+def _log_fermi(x):
+    """
+    log(1 / (1 + exp(x))), without overflow.
+    """
+    return -np.logaddexp(0.0, x)
+
+
+def bar_free_energy(Vi_i, Vj_i, Vi_j, Vj_j, beta=1.0, tolerance=1e-12, max_iterations=100):
+    """
+    BAR free-energy difference F_j - F_i and its asymptotic standard deviation.
+
+    Parameters
+    ----------
+    Vi_i, Vj_i: array-like
+        Energies of state i and j of the samples of state i.
+    Vi_j, Vj_j: array-like
+        Energies of state i and j of the samples of state j.
+    beta: float
+        1 / (k_B T) in the inverse energy units of the potential.
+    tolerance: float
+        Absolute tolerance of the reduced free energy.
+    max_iterations: int
+        Maximum number of Brent iterations.
+
+    Returns
+    -------
+    dF: float
+        Free-energy difference.
+    ddF: float
+        Asymptotic standard deviation of dF (assumes uncorrelated samples).
+    iterations: int
+        Number of iterations of the root finder.
+    """
+    # Reduced work of the forward (from i) and backward (from j) perturbation
+    w_forward = beta * (np.asarray(Vj_i, dtype=float) - np.asarray(Vi_i, dtype=float)).reshape(-1)
+    w_backward = beta * (np.asarray(Vi_j, dtype=float) - np.asarray(Vj_j, dtype=float)).reshape(-1)
+    df, ddf, iterations = bar_from_work(w_forward, w_backward, tolerance=tolerance, max_iterations=max_iterations)
+    return df / beta, ddf / beta, iterations
+
+
+def bar_from_work(w_forward, w_backward, tolerance=1e-12, max_iterations=100):
+    """
+    Reduced BAR free-energy difference from the reduced work of both directions.
+
+    Parameters
+    ----------
+    w_forward: array-like
+        beta * (V_j - V_i) of the samples of state i.
+    w_backward: array-like
+        beta * (V_i - V_j) of the samples of state j.
+    tolerance: float
+        Absolute tolerance of the reduced free energy.
+    max_iterations: int
+        Maximum number of Brent iterations.
+
+    Returns
+    -------
+    df: float
+        Reduced free-energy difference f_j - f_i.
+    ddf: float
+        Its asymptotic standard deviation.
+    iterations: int
+        Number of iterations of the root finder.
+    """
+    w_forward = np.asarray(w_forward, dtype=float).reshape(-1)
+    w_backward = np.asarray(w_backward, dtype=float).reshape(-1)
+    n_forward, n_backward = len(w_forward), len(w_backward)
+    if n_forward == 0 or n_backward == 0:
+        raise ValueError("BAR needs samples of both states")
+    M = np.log(n_forward / n_backward)
+
+    def bennett(df):
+        # log sum_F f(M + w_F - df) - log sum_B f(-M + w_B + df), increasing in df
+        return logsumexp(_log_fermi(M + w_forward - df)) - logsumexp(_log_fermi(-M + w_backward + df))
+
+    # The Zwanzig estimates of both directions usually enclose the BAR solution
+    df_forward = -(logsumexp(-w_forward) - np.log(n_forward))
+    df_backward = logsumexp(-w_backward) - np.log(n_backward)
+    lower, upper = min(df_forward, df_backward) - 1.0, max(df_forward, df_backward) + 1.0
+    while bennett(lower) > 0:
+        lower -= 2 * (upper - lower)
+    while bennett(upper) < 0:
+        upper += 2 * (upper - lower)
+    df, result = optimize.brentq(bennett, lower, upper, xtol=tolerance, maxiter=max_iterations, full_output=True)
+
+    # var(f) / <f>^2 of both directions, from the normalized log-Fermi terms
+    variance = 0.0
+    for log_f, n in ((_log_fermi(M + w_forward - df), n_forward), (_log_fermi(-M + w_backward + df), n_backward)):
+        ratio = np.exp(log_f - (logsumexp(log_f) - np.log(n)))
+        variance += max(np.mean(ratio ** 2) - 1.0, 0.0) / n
+    return df, np.sqrt(variance), result.iterations
+
+
+class LogBennettAcceptanceRatio(bennetAcceptanceRatio):
+    """
+    ``bennetAcceptanceRatio`` with the Bennett equation solved in log space.
+
+    Takes the same arguments as ``bennetAcceptanceRatio`` (``kT``, ``kJ``,
+    ``kCal``, ``T``, ``k``). ``convergence_radius`` is the tolerance of the
+    root finder on the free energy and ``max_iterations`` its iteration limit;
+    the initial guess ``C`` is not needed.
+    """
+
+    def _reduced_beta(self):
+        return 1.0 / (float(self.constants[self.k]) * float(self.constants[self.T]))
+
+    def calculate_with_error(self, Vi_i, Vj_i, Vi_j, Vj_j, verbose=False):
+        """
+        Free-energy difference F_j - F_i and its asymptotic standard deviation.
+
+        Parameters
+        ----------
+        Vi_i : np.array
+            potential energies of stateI while sampling stateI
+        Vj_i : np.array
+             potential energies of stateJ while sampling stateI
+        Vi_j : np.array
+             potential energies of stateI while sampling stateJ
+        Vj_j : np.array
+             potential energies of stateJ while sampling stateJ
+        verbose: bool
+            Print the number of iterations and the result.
+
+        Returns
+        -------
+        dF: float
+            Free-energy difference.
+        ddF: float
+            Standard deviation of dF.
+        """
+        beta = self._reduced_beta()
+        dF, ddF, iterations = bar_free_energy(Vi_i, Vj_i, Vi_j, Vj_j, beta=beta,
+                                              tolerance=self.convergence_radius * beta,
+                                              max_iterations=self.max_iterations)
+        if verbose:
+            print("Final Iterations: ", iterations, " Result: ", dF, " Error: ", ddF)
+        return dF, ddF
+
+    def calculate(self, Vi_i, Vj_i, Vi_j, Vj_j, verbose=False):
+        """
+        Free-energy difference F_j - F_i with the BAR method.
+
+        Parameters
+        ----------
+        Vi_i : np.array
+            potential energies of stateI while sampling stateI
+        Vj_i : np.array
+             potential energies of stateJ while sampling stateI
+        Vi_j : np.array
+             potential energies of stateI while sampling stateJ
+        Vj_j : np.array
+             potential energies of stateJ while sampling stateJ
+        verbose: bool
+            Print the number of iterations and the result.
+
+        Returns
+        -------
+        float
+            free energy difference
+        """
+        return self.calculate_with_error(Vi_i, Vj_i, Vi_j, Vj_j, verbose=verbose)[0]
@@ -0,0 +1,176 @@
+"""
+Equilibration detection and decorrelated subsampling of time series.
+
+Consecutive Monte-Carlo samples are correlated, so a trajectory of N steps
+contains only about N / g independent samples, with the statistical
+inefficiency g. :func:`statistical_inefficiency` obtains g from the
+autocorrelation function, computed with the FFT in O(N log N).
+:func:`detect_equilibration` chooses the start of the production part as the
+origin t0 that maximizes the number of independent samples (N - t0) / g(t0)
+(Chodera, J. Chem. Theory Comput. 2016, 12, 1799), instead of a fixed fraction
+of the trajectory. The t0 are searched on ``n_candidates`` origins of the
+block means of at most ``max_samples`` points, so the search costs a fixed
+number of small FFTs and one FFT of the full series.
+
+Example
+-------
+>>> indices = decorrelated_indices(stateA_traj.total_potential_energy)
+>>> dF = zwanz.calculate(Vi=stateA_traj.total_potential_energy.values[indices],
+...                      Vj=V_B.ene(stateA_traj.position.values[indices]))
+>>> t0, g, n_effective = detect_equilibration(stateA_traj.total_potential_energy)
+"""
+
+import numpy as np
+
+
+def autocorrelation(x, max_lag=None):
+    """
+    Normalized autocorrelation function of a time series, via the FFT.
+
+    Parameters
+    ----------
+    x: array-like
+        The time series.
+    max_lag: int or None
+        Largest lag returned (default: len(x) - 1).
+
+    Returns
+    -------
+    numpy.ndarray
+        C(t) for t = 0 ... max_lag, with C(0) = 1 (zeros for a constant series).
+    """
+    x = np.asarray(x, dtype=float).reshape(-1)
+    n = len(x)
+    max_lag = n - 1 if max_lag is None else min(max_lag, n - 1)
+    fluctuation = x - x.mean()
+    # Zero padding to at least 2n avoids the circular wrap-around of the FFT
+    size = 2 ** int(np.ceil(np.log2(2 * n)))
+    spectrum = np.fft.rfft(fluctuation, size)
+    covariance = np.fft.irfft(spectrum * np.conj(spectrum), size)[:max_lag + 1]
+    # Unbiased estimate: every lag t has n - t pairs
+    covariance /= np.arange(n, n - max_lag - 1, -1)
+    if covariance[0] <= 0:
+        return np.zeros(max_lag + 1)
+    return covariance / covariance[0]
+
+
+def statistical_inefficiency(x, minimum=1.0):
+    """
+    Statistical inefficiency g = 1 + 2 sum_t (1 - t/N) C(t) of a time series.
+
+    The sum is truncated at the first lag where C(t) is no longer positive.
+
+    Parameters
+    ----------
+    x: array-like
+        The time series.
+    minimum: float
+        Lower bound of g.
+
+    Returns
+    -------
+    float
+        g, the number of steps per independent sample.
+    """
+    x = np.asarray(x, dtype=float).reshape(-1)
+    n = len(x)
+    if n < 2:
+        return minimum
+    correlation = autocorrelation(x)[1:]
+    non_positive = np.flatnonzero(correlation <= 0)
+    cut = non_positive[0] if len(non_positive) else len(correlation)
+    lags = np.arange(1, cut + 1)
+    g = 1.0 + 2.0 * np.sum((1.0 - lags / n) * correlation[:cut])
+    return max(float(g), minimum)
+
+
+def detect_equilibration(x, n_candidates=100, max_samples=100000):
+    """
+    Start of the equilibrated region that maximizes the number of independent samples.
+
+    Parameters
+    ----------
+    x: array-like
+        The time series, e.g. ``trajectory.total_potential_energy``.
+    n_candidates: int
+        Number of evenly spaced origins t0 in the first half of the series
+        that are tried.
+    max_samples: int
+        Longer series are averaged in blocks to at most max_samples points for
+        the search of t0; g is then computed from the full series x[t0:].
+
+    Returns
+    -------
+    t0: int
+        First index of the equilibrated region.
+    g: float
+        Statistical inefficiency of x[t0:].
+    n_effective: float
+        Number of independent samples (len(x) - t0) / g; (0, 1.0, 0.0) for an
+        empty series.
+    """
+    x = np.asarray(x, dtype=float).reshape(-1)
+    n = len(x)
+    if n == 0:
+        return 0, 1.0, 0.0
+    block = int(np.ceil(n / max_samples))
+    blocks = x[:n // block * block].reshape(-1, block).mean(axis=1)
+
+    n_blocks = len(blocks)
+    candidates = np.unique(np.linspace(0, max(n_blocks // 2, 1) - 1, n_candidates).astype(int))
+    best_t0, best_n_effective = 0, 0.0
+    for t0 in candidates:
+        n_effective = (n_blocks - t0) / statistical_inefficiency(blocks[t0:])
+        if n_effective > best_n_effective:
+            best_t0, best_n_effective = int(t0), n_effective
+
+    t0 = best_t0 * block
+    g = statistical_inefficiency(x[t0:])
+    return t0, g, (n - t0) / g
+
+
+def subsample_indices(n, g, start=0):
+    """
+    Indices of approximately uncorrelated samples: every g-th index from ``start``.
+
+    Parameters
+    ----------
+    n: int
+        Length of the series.
+    g: float
+        Statistical inefficiency.
+    start: int
+        First index (e.g. t0 of :func:`detect_equilibration`).
+
+    Returns
+    -------
+    numpy.ndarray
+        Increasing indices.
+    """
+    return np.unique(np.floor(np.arange(start, n, max(g, 1.0))).astype(int))
+
+
+def decorrelated_indices(x, detect=True, n_candidates=100):
+    """
+    Indices of the equilibrated, uncorrelated samples of a time series.
+
+    Parameters
+    ----------
+    x: array-like
+        The time series, e.g. ``trajectory.total_potential_energy``.
+    detect: bool
+        Detect the end of the equilibration; otherwise all samples are used.
+    n_candidates: int
+        Origins tried by :func:`detect_equilibration`.
+
+    Returns
+    -------
+    numpy.ndarray
+        Indices into x.
+    """
+    x = np.asarray(x, dtype=float).reshape(-1)
+    if detect:
+        t0, g, _ = detect_equilibration(x, n_candidates=n_candidates)
+    else:
+        t0, g = 0, statistical_inefficiency(x)
+    return subsample_indices(len(x), g, start=t0)
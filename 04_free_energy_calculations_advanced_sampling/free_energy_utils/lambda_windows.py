@@ -0,0 +1,233 @@
+"""
+Parallel sampling of the lambda windows of a perturbed system.
+
+The lambda windows of a free-energy calculation are independent simulations,
+but looping over them with one shared ``perturbedSystem`` runs them one after
+another. :func:`simulate_lambda_windows` gives every window its own copy of the
+system and propagates the windows in a pool of worker processes, which keep
+their windows in memory until all steps are done.
+
+Optionally, the configurations of neighbouring windows are swapped every
+``exchange_every`` steps with the Metropolis criterion (Hamiltonian replica
+exchange). Only the configurations travel between the main process and the
+workers for this: the position together with the velocities and the old position
+of the Langevin samplers, so that a swapped configuration keeps its dynamics.
+
+Example
+-------
+>>> perturbed_system = perturbedSystem(potential=V_perturbed, sampler=sampler, temperature=temperature)
+>>> system_trajs, exchanges = simulate_lambda_windows(perturbed_system, lambda_windows, steps)
+>>> system_trajs, exchanges = simulate_lambda_windows(perturbed_system, lambda_windows, steps,
+...                                                   exchange_every=100)
+>>> exchanges.groupby("lam_i").accepted.mean()
+"""
+
+import copy
+import multiprocessing as mp
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.constants as const
+from tqdm import tqdm
+
+from ensembler.samplers.stochastic import metropolisMonteCarloIntegrator
+
+
+def _configuration(window):
+    """
+    Position of a window with the sampler state that belongs to it.
+    """
+    return window._currentPosition, window._currentVelocities, getattr(window.sampler, "_oldPosition", None)
+
+
+def _set_configuration(window, configuration):
+    """
+    Continue a window from a configuration of another window.
+    """
+    window._currentPosition, window._currentVelocities, old_position = configuration
+    if hasattr(window.sampler, "_oldPosition"):
+        # The position Langevin step uses 2 x - x_old, i.e. the old position is the velocity
+        window.sampler._oldPosition = old_position
+    if hasattr(window.sampler, "_first_step"):
+        # The velocity Langevin sampler keeps the forces of its last position
+        window.sampler._first_step = True
+
+
+def _sampler_kT(sampler, temperature):
+    """
+    k_B T in the energy units of the ensembler samplers.
+    """
+    if isinstance(sampler, metropolisMonteCarloIntegrator):
+        # Metropolis criterion with beta = 1 / (R T), energies in kJ/mol
+        return const.gas_constant / 1000.0 * temperature
+    # The Langevin samplers expect energies in units of k_B
+    return temperature
+
+
+def _window_worker(connection, windows, seed):
+    """
+    Keep the systems of some lambda windows resident and propagate them on request.
+    """
+    # Otherwise all forked workers would draw the same random numbers
+    np.random.seed(seed)
+    while True:
+        command, arguments = connection.recv()
+        try:
+            if command == "simulate":
+                steps, configurations, withdraw_traj, init_system = arguments
+                for lam, configuration in configurations.items():
+                    _set_configuration(windows[lam], configuration)
+                for lam, window in windows.items():
+                    window.simulate(steps, withdraw_traj=withdraw_traj, init_system=init_system, verbosity=False)
+                connection.send({lam: _configuration(window) for lam, window in windows.items()})
+            elif command == "trajectories":
+                connection.send({lam: window.trajectory for lam, window in windows.items()})
+            elif command == "close":
+                connection.send(None)
+                break
+        except Exception as error:
+            # Hand the error to the main process, which raises it
+            connection.send(error)
+            break
+    connection.close()
+
+
+def _receive(connection):
+    """
+    Answer of a worker; errors raised in the worker are raised again here.
+    """
+    answer = connection.recv()
+    if isinstance(answer, Exception):
+        raise answer
+    return answer
+
+
+def _close_workers(workers):
+    """
+    Stop the worker processes without hiding an exception that is being raised.
+    """
+    for process, connection, _ in workers:
+        try:
+            # A worker that failed has already exited and closed its end of the pipe
+            if process.is_alive():
+                connection.send(("close", None))
+                connection.recv()
+        except (OSError, EOFError):
+            process.terminate()
+        process.join()
+        connection.close()
+
+
+def _segments(steps, exchange_every):
+    """
+    Number of steps between two exchange attempts.
+    """
+    if not exchange_every:
+        return [steps]
+    segments = [exchange_every] * (steps // exchange_every)
+    if steps % exchange_every:
+        segments.append(steps % exchange_every)
+    return segments
+
+
+def simulate_lambda_windows(perturbed_system, lambda_windows, steps, exchange_every=None, init_system=True,
+                            kT=None, n_workers=None, random_seed=None, verbosity=True):
+    """
+    Simulate every lambda window with its own copy of a perturbed system, in parallel.
+
+    Parameters
+    ----------
+    perturbed_system: perturbedSystem
+        The system to copy for every window (e.g. with ``linearCoupledPotentials``).
+    lambda_windows: iterable of float
+        The lambda values of the windows.
+    steps: int
+        Number of steps per window.
+    exchange_every: int or None
+        Attempt to swap the configurations of neighbouring windows every
+        ``exchange_every`` steps (alternating between even and odd pairs). If
+        None, the windows are independent.
+    init_system: bool
+        Draw a new start position for every window, as
+        ``simulate(steps, withdraw_traj=True, init_system=True)``.
+    kT: float or None
+        k_B T in the energy units of the potential, for the exchange criterion.
+        If None, it is taken from the sampler: ``R/1000 * temperature`` for
+        the Metropolis Monte Carlo sampler (kJ/mol) and ``temperature`` for
+        the Langevin samplers (energies in k_B).
+    n_workers: int or None
+        Number of worker processes. If None, one per window (at most one per core).
+    random_seed: int or None
+        Seed for the workers and the exchange decisions.
+    verbosity: bool
+        Show a progress bar over the exchange segments.
+
+    Returns
+    -------
+    system_trajs: dict
+        Trajectory DataFrame of every lambda window.
+    exchanges: pandas.DataFrame
+        One row per exchange attempt with the columns segment, lam_i, lam_j,
+        delta (reduced energy change of the swap) and accepted.
+    """
+    lambda_windows = list(lambda_windows)
+    n_workers = min(n_workers or os.cpu_count(), len(lambda_windows))
+    seeds = np.random.SeedSequence(random_seed).generate_state(n_workers + 1)
+    rng = np.random.default_rng(seeds[-1])
+
+    workers = []
+    for index in range(n_workers):
+        windows = {}
+        for lam in lambda_windows[index::n_workers]:
+            window = copy.deepcopy(perturbed_system)
+            window.lam = lam
+            windows[lam] = window
+        connection, worker_connection = mp.Pipe()
+        process = mp.Process(target=_window_worker, args=(worker_connection, windows, int(seeds[index])),
+                             daemon=True)
+        process.start()
+        worker_connection.close()
+        workers.append((process, connection, list(windows)))
+
+    # Energies of swapped configurations, in the units the sampler uses for the Boltzmann distribution
+    potential = copy.deepcopy(perturbed_system.potential)
+    if kT is None:
+        kT = _sampler_kT(perturbed_system.sampler, perturbed_system.temperature)
+    beta = 1.0 / kT
+
+    def energy(lam, position):
+        potential.set_lambda(lam)
+        return float(np.squeeze(potential.ene(position)))
+
+    exchanges = []
+    configurations = {}
+    segments = _segments(steps, exchange_every)
+    try:
+        for segment, segment_steps in enumerate(tqdm(segments, desc="Lambda windows: ") if verbosity else segments):
+            for _, connection, lams in workers:
+                swapped = {lam: configurations[lam] for lam in lams if lam in configurations}
+                connection.send(("simulate", (segment_steps, swapped, segment == 0, init_system and segment == 0)))
+            for _, connection, _ in workers:
+                configurations.update(_receive(connection))
+
+            if exchange_every and segment < len(segments) - 1:
+                for lam_i, lam_j in zip(lambda_windows[segment % 2::2], lambda_windows[segment % 2 + 1::2]):
+                    x_i, x_j = configurations[lam_i][0], configurations[lam_j][0]
+                    delta = beta * (energy(lam_i, x_j) + energy(lam_j, x_i) - energy(lam_i, x_i) - energy(lam_j, x_j))
+                    accepted = bool(delta <= 0 or rng.random() < np.exp(-delta))
+                    if accepted:
+                        # Velocities and old positions go with their configuration, at the same temperature
+                        configurations[lam_i], configurations[lam_j] = configurations[lam_j], configurations[lam_i]
+                    exchanges.append({"segment": segment, "lam_i": lam_i, "lam_j": lam_j, "delta": delta,
+                                      "accepted": accepted})
+
+        system_trajs = {}
+        for _, connection, _ in workers:
+            connection.send(("trajectories", None))
+            system_trajs.update(_receive(connection))
+    finally:
+        _close_workers(workers)
+
+    system_trajs = {lam: system_trajs[lam] for lam in lambda_windows}
+    return system_trajs, pd.DataFrame(exchanges, columns=["segment", "lam_i", "lam_j", "delta", "accepted"])
@@ -0,0 +1,299 @@
+"""
+MBAR estimate over all lambda windows from one reduced-potential matrix.
+
+Chaining ``zwanzigEquation``/``bennetAcceptanceRatio`` over neighbouring
+windows only uses the overlap of adjacent lambdas and re-evaluates the
+potential for every pair. :func:`reduced_potential_matrix` evaluates the samples
+of all windows under every lambda once (one vectorized ``ene`` call per lambda)
+and :class:`MBAR` solves the self-consistent MBAR equations on that K x N
+matrix with a log-sum-exp stable Newton (or L-BFGS) solver.
+
+The matrix always contains all frames and can be cached in ``cache_dir``, so
+different equilibration cuts (:func:`select_samples`) need no new energy
+evaluations.
+
+Example
+-------
+>>> u_kn, n_k = reduced_potential_matrix(V_perturbed, system_trajs, cache_dir="mbar_cache")
+>>> u_kn, n_k = select_samples(u_kn, n_k, start=equilibration_steps)
+>>> mbar = MBAR(u_kn, n_k)
+>>> dF, ddF = mbar.free_energy_differences()
+>>> mbar_free_energies(V_perturbed, system_trajs, equilibration_steps=equilibration_steps)
+"""
+
+import hashlib
+import os
+from os import path
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import optimize
+from scipy.special import logsumexp
+
+
+def _positions(trajectory):
+    """
+    All positions of a trajectory DataFrame as a float array.
+    """
+    return np.asarray(trajectory.position.tolist(), dtype=float)
+
+
+def reduced_potential_matrix(potential, system_trajs, kT=1.0, cache_dir=None):
+    """
+    Reduced potential energies of the samples of all windows in all lambda states.
+
+    Parameters
+    ----------
+    potential: ensembler perturbed potential
+        e.g. ``linearCoupledPotentials``; its lambda is restored afterwards.
+    system_trajs: dict
+        Trajectory DataFrame of every lambda window, as returned by
+        ``simulate_lambda_windows``. The windows are sorted by lambda.
+    kT: float
+        k_B T in the energy units of the potential (1 for energies in kT, as
+        ``kT=True`` of the ensembler estimators).
+    cache_dir: str or pathlib.Path or None
+        Directory in which the matrix is stored, keyed by the potential, the
+        lambdas, kT and the sampled positions.
+
+    Returns
+    -------
+    u_kn: numpy.ndarray
+        u_kn[k, n] = V_k(x_n) / kT, shape (K lambdas, N samples). The samples
+        are the frames of the windows one after another.
+    n_k: numpy.ndarray
+        Number of samples of every window.
+    """
+    lambdas = sorted(system_trajs)
+    positions = [_positions(system_trajs[lam]) for lam in lambdas]
+    n_k = np.array([len(window_positions) for window_positions in positions])
+    samples = np.concatenate(positions)
+
+    original_lambda = potential.constants[potential.lam]
+    expressions = []
+    for lam in lambdas:
+        potential.set_lambda(lam)
+        expressions.append(str(potential.V))
+
+    cache_file = None
+    if cache_dir is not None:
+        key = hashlib.sha1("|".join([potential.name, str(kT), str(lambdas)] + expressions).encode())
+        key.update(samples.tobytes())
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        cache_file = path.join(cache_dir, f"{key.hexdigest()}.npz")
+        if path.exists(cache_file):
+            potential.set_lambda(original_lambda)
+            with np.load(cache_file) as matrix:
+                return matrix["u_kn"], matrix["n_k"]
+
+    u_kn = np.empty((len(lambdas), len(samples)))
+    try:
+        for k, lam in enumerate(lambdas):
+            potential.set_lambda(lam)
+            u_kn[k] = np.reshape(potential.ene(samples), -1) / kT
+    finally:
+        potential.set_lambda(original_lambda)
+
+    if cache_file is not None:
+        temporary = f"{cache_file}.{os.getpid()}.tmp.npz"
+        np.savez(temporary, u_kn=u_kn, n_k=n_k)
+        os.replace(temporary, cache_file)
+    return u_kn, n_k
+
+
+def select_samples(u_kn, n_k, start=0, stop=None, stride=1, indices=None):
+    """
+    Cut every window of a reduced-potential matrix to ``[start:stop:stride]`` or to given frames.
+
+    Parameters
+    ----------
+    u_kn: numpy.ndarray
+        Reduced potential energies, as from :func:`reduced_potential_matrix`.
+    n_k: array-like
+        Number of samples of every window.
+    start, stop, stride: int or None
+        Frames kept of every window (e.g. ``start=equilibration_steps``).
+    indices: list of array-like or None
+        Frames kept of every window instead, e.g. from ``decorrelated_indices``.
+
+    Returns
+    -------
+    u_kn: numpy.ndarray
+        The columns of the kept frames.
+    n_k: numpy.ndarray
+        Number of kept samples of every window.
+    """
+    offsets = np.concatenate([[0], np.cumsum(n_k)])
+    if indices is None:
+        columns = [np.arange(offsets[k], offsets[k + 1])[start:stop:stride] for k in range(len(n_k))]
+    else:
+        columns = [offsets[k] + np.asarray(window_indices, dtype=int) for k, window_indices in enumerate(indices)]
+    return u_kn[:, np.concatenate(columns)], np.array([len(window_columns) for window_columns in columns])
+
+
+class MBAR:
+    """
+    Multistate Bennett acceptance ratio on a reduced-potential matrix.
+
+    The dimensionless free energies f_k minimize the convex function
+
+        phi(f) = sum_n log sum_k N_k exp(f_k - u_kn) - sum_k N_k f_k
+
+    with f_0 = 0, whose stationary point is the MBAR self-consistency
+    condition. All sums over states are done with log-sum-exp.
+
+    Parameters
+    ----------
+    u_kn: numpy.ndarray
+        Reduced potential energies, shape (K states, N samples).
+    n_k: array-like
+        Number of samples from every state; states without samples are
+        evaluated from the samples of the others.
+    method: str
+        "newton" (Newton-Raphson with backtracking line search) or "L-BFGS-B"
+        (scipy.optimize.minimize).
+    tolerance: float
+        Convergence threshold on the relative normalization error of the weights.
+    max_iterations: int
+        Maximum number of iterations of the solver.
+    """
+
+    def __init__(self, u_kn, n_k, method="newton", tolerance=1e-10, max_iterations=100):
+        self.u_kn = np.asarray(u_kn, dtype=float)
+        self.n_k = np.asarray(n_k, dtype=float)
+        if self.u_kn.shape != (len(self.n_k), int(self.n_k.sum())):
+            raise ValueError(f"u_kn must have the shape (K, sum(n_k)) = ({len(self.n_k)}, {int(self.n_k.sum())}), "
+                             f"not {self.u_kn.shape}")
+        self.method = method
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.iterations = 0
+
+        # The sampled states determine the mixture distribution of all samples
+        self._sampled = self.n_k > 0
+        self._log_n = np.log(self.n_k[self._sampled])
+        f_sampled = self._solve()
+        self.f_k = self._free_energies(f_sampled)
+
+    def _log_denominator(self, f_sampled):
+        """
+        log sum_k N_k exp(f_k - u_kn) over the sampled states, for every sample n.
+        """
+        return logsumexp((self._log_n + f_sampled)[:, np.newaxis] - self.u_kn[self._sampled], axis=0)
+
+    def _objective(self, f_sampled):
+        """
+        phi(f), its gradient and its Hessian with respect to the sampled f_k.
+        """
+        log_denominator = self._log_denominator(f_sampled)
+        n_sampled = self.n_k[self._sampled]
+        # N_k W_kn: probability of sample n in state k relative to the mixture
+        weights = np.exp((self._log_n + f_sampled)[:, np.newaxis] - self.u_kn[self._sampled] - log_denominator)
+        value = log_denominator.sum() - n_sampled @ f_sampled
+        gradient = weights.sum(axis=1) - n_sampled
+        hessian = np.diag(weights.sum(axis=1)) - weights @ weights.T
+        return value, gradient, hessian
+
+    def _solve(self):
+        """
+        Dimensionless free energies of the sampled states, with f_0 = 0.
+        """
+        n_sampled = self.n_k[self._sampled]
+        f_sampled = np.zeros(len(n_sampled))
+
+        if self.method == "L-BFGS-B":
+            def objective(f_reduced):
+                value, gradient, _ = self._objective(np.concatenate([[0.0], f_reduced]))
+                return value, gradient[1:]
+            result = optimize.minimize(objective, f_sampled[1:], jac=True, method="L-BFGS-B",
+                                       options={"maxiter": self.max_iterations, "gtol": self.tolerance})
+            self.iterations = result.nit
+            return np.concatenate([[0.0], result.x])
+        if self.method != "newton":
+            raise ValueError(f"unknown method {self.method}, use 'newton' or 'L-BFGS-B'")
+
+        value, gradient, hessian = self._objective(f_sampled)
+        for self.iterations in range(1, self.max_iterations + 1):
+            if np.max(np.abs(gradient / n_sampled)) < self.tolerance:
+                break
+            step = np.zeros(len(n_sampled))
+            step[1:] = np.linalg.solve(hessian[1:, 1:], -gradient[1:])
+            # Backtracking keeps the iteration stable far from the solution
+            scale = 1.0
+            while True:
+                new_value, new_gradient, new_hessian = self._objective(f_sampled + scale * step)
+                if new_value <= value or scale < 1e-8:
+                    break
+                scale /= 2
+            f_sampled = f_sampled + scale * step
+            value, gradient, hessian = new_value, new_gradient, new_hessian
+        return f_sampled
+
+    def _free_energies(self, f_sampled):
+        """
+        f_k of all states from the converged mixture, relative to the first state.
+        """
+        log_denominator = self._log_denominator(f_sampled)
+        f_k = -logsumexp(-self.u_kn - log_denominator, axis=1)
+        return f_k - f_k[0]
+
+    def weights(self):
+        """
+        MBAR weights W_nk of every sample in every state, shape (N, K).
+        """
+        log_denominator = self._log_denominator(self.f_k[self._sampled])
+        return np.exp(self.f_k[:, np.newaxis] - self.u_kn - log_denominator).T
+
+    def free_energy_differences(self):
+        """
+        Reduced free-energy differences of all pairs of states and their uncertainties.
+
+        Returns
+        -------
+        delta_f: numpy.ndarray
+            delta_f[i, j] = f_j - f_i (in kT).
+        d_delta_f: numpy.ndarray
+            Asymptotic standard deviation of delta_f (assumes uncorrelated samples).
+        """
+        weights = self.weights()
+        # Theta = W^T (I - W N W^T)^+ W, evaluated in the K-dimensional space of the thin SVD of W
+        _, singular_values, vt = np.linalg.svd(weights, full_matrices=False)
+        sigma_v = vt.T * singular_values
+        inner = np.eye(len(singular_values)) - sigma_v.T @ np.diag(self.n_k) @ sigma_v
+        # inner has one zero eigenvalue (the f_k are only defined up to a constant); round-off of
+        # the solver makes it slightly nonzero, so it is cut off explicitly
+        theta = sigma_v @ np.linalg.pinv(inner, rcond=1e-10, hermitian=True) @ sigma_v.T
+        variance = np.diag(theta)[:, np.newaxis] + np.diag(theta)[np.newaxis, :] - 2 * theta
+        delta_f = self.f_k[np.newaxis, :] - self.f_k[:, np.newaxis]
+        return delta_f, np.sqrt(np.maximum(variance, 0.0))
+
+
+def mbar_free_energies(potential, system_trajs, equilibration_steps=0, kT=1.0, cache_dir=None, method="newton"):
+    """
+    MBAR free energies of all lambda windows relative to the first one.
+
+    Parameters
+    ----------
+    potential: ensembler perturbed potential
+        The potential the windows were sampled with.
+    system_trajs: dict
+        Trajectory DataFrame of every lambda window.
+    equilibration_steps: int
+        Frames discarded at the start of every window.
+    kT: float
+        k_B T in the energy units of the potential.
+    cache_dir: str or pathlib.Path or None
+        Directory for the reduced-potential matrix (see :func:`reduced_potential_matrix`).
+    method: str
+        Solver of :class:`MBAR`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns lam, dF and ddF (in the energy units of the potential).
+    """
+    u_kn, n_k = reduced_potential_matrix(potential, system_trajs, kT=kT, cache_dir=cache_dir)
+    u_kn, n_k = select_samples(u_kn, n_k, start=equilibration_steps)
+    delta_f, d_delta_f = MBAR(u_kn, n_k, method=method).free_energy_differences()
+    return pd.DataFrame({"lam": sorted(system_trajs), "dF": kT * delta_f[0], "ddF": kT * d_delta_f[0]})
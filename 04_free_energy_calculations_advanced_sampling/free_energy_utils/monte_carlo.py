@@ -0,0 +1,227 @@
+"""
+Metropolis Monte Carlo of many independent chains at once.
+
+``metropolisMonteCarloIntegrator`` proposes and accepts one move of one system
+per Python-level step. :func:`simulate_chains` keeps all chains in one
+(n_chains x n_dimensions) array: every step draws the proposals of all chains,
+evaluates their energies with one ``ene`` call and accepts them with one
+Metropolis mask, so thousands of chains cost about as much wall time as one.
+During the first ``adapt_steps`` steps, the step size of every chain is tuned
+toward ``target_acceptance``; afterwards it is fixed, so that the production
+part samples the Boltzmann distribution exactly.
+
+The Metropolis criterion uses beta = 1 / (R/1000 T) as the ensembler sampler.
+Rejected moves keep the old position (ensembler instead retries until a move
+is accepted).
+
+Example
+-------
+>>> sampler = metropolisMonteCarloIntegrator(step_size_coefficient=1)
+>>> traj = simulate_chains(V_A, sampler, 0, steps=steps, n_chains=1000, temperature=temperature,
+...                        adapt_steps=equilibration_steps)
+>>> start = np.searchsorted(traj.step, equilibration_steps)  # first frame with traj.step >= equilibration_steps
+>>> VA_sampled = traj.total_potential_energy[start:]
+>>> VB_sampled = traj.energies(V_B, start=start)
+>>> dF, ddF = zwanzig_chains(VA_sampled, VB_sampled)
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import scipy.constants as const
+from scipy.special import logsumexp
+from tqdm import tqdm
+
+from ensembler.samplers.stochastic import metropolisMonteCarloIntegrator
+
+
+@dataclass
+class ChainTrajectory:
+    """
+    Stacked trajectory of many Monte Carlo chains.
+
+    Parameters
+    ----------
+    step: numpy.ndarray
+        Step number of every saved frame, shape (n_frames,).
+    position: numpy.ndarray
+        Positions, shape (n_frames, n_chains, n_dimensions).
+    total_potential_energy: numpy.ndarray
+        Potential energies, shape (n_frames, n_chains).
+    step_size: numpy.ndarray
+        Final step size of every chain, shape (n_chains,).
+    acceptance: numpy.ndarray
+        Acceptance rate of every chain after the adaptation, shape (n_chains,).
+    temperature: float
+        Temperature of the simulation.
+    """
+    step: np.ndarray
+    position: np.ndarray
+    total_potential_energy: np.ndarray
+    step_size: np.ndarray = None
+    acceptance: np.ndarray = None
+    temperature: float = None
+
+    @property
+    def n_chains(self):
+        return self.position.shape[1]
+
+    def energies(self, potential, start=0):
+        """
+        Energies of the saved frames from frame index ``start`` on under another potential, shape (n_frames, n_chains).
+        """
+        positions = self.position[start:]
+        return _batch_energy(potential, positions.reshape(-1, positions.shape[2])).reshape(positions.shape[:2])
+
+    def chain(self, index):
+        """
+        Trajectory of one chain as DataFrame with the columns of ``system.trajectory``.
+        """
+        position = self.position[:, index]
+        return pd.DataFrame({
+            "position": list(position) if position.shape[1] > 1 else position[:, 0],
+            "temperature": self.temperature,
+            "total_potential_energy": self.total_potential_energy[:, index],
+        }, index=self.step)
+
+
+def _batch_energy(potential, positions):
+    """
+    Energies of an (n, n_dimensions) array of positions with one ``ene`` call.
+    """
+    energies = potential.ene(positions[:, 0] if positions.shape[1] == 1 else positions)
+    # Constant potentials return a single number
+    return np.broadcast_to(np.reshape(energies, -1), positions.shape[:1]).astype(float)
+
+
+def simulate_chains(potential, sampler, start_positions, steps, n_chains=None, temperature=298,
+                    target_acceptance=0.5, adapt_steps=0, adapt_every=50, save_every_state=1, random_seed=None,
+                    verbosity=True):
+    """
+    Propagate many independent Metropolis Monte Carlo chains on the same potential.
+
+    Parameters
+    ----------
+    potential: ensembler potential
+        The potential to sample (e.g. a perturbed potential at a set lambda).
+    sampler: metropolisMonteCarloIntegrator
+        Provides the initial step size (``step_size_coefficient``, or
+        ``fixed_step_size``) and the allowed ``space_range``.
+    start_positions: float or array-like
+        Start position of every chain, shape (n_chains, n_dimensions), or one
+        start position shared by ``n_chains`` chains.
+    steps: int
+        Number of Monte Carlo steps.
+    n_chains: int or None
+        Number of chains if only one start position is given.
+    temperature: float
+        Temperature of the Metropolis criterion (as for ensembler systems).
+    target_acceptance: float
+        Acceptance rate the step sizes are tuned toward.
+    adapt_steps: int
+        Number of initial steps during which the step sizes are adapted
+        (e.g. the equilibration steps).
+    adapt_every: int
+        Steps between two step size updates.
+    save_every_state: int
+        Save every n-th step.
+    random_seed: int or None
+        Seed of the random number generator.
+    verbosity: bool
+        Show a progress bar.
+
+    Returns
+    -------
+    trajectory: ChainTrajectory
+        The saved frames of all chains.
+    """
+    if not isinstance(sampler, metropolisMonteCarloIntegrator):
+        raise ValueError("simulate_chains needs a metropolisMonteCarloIntegrator")
+    n_dimensions = potential.constants[potential.nDimensions]
+    rng = np.random.default_rng(random_seed)
+    beta = 1.0 / (const.gas_constant / 1000.0 * temperature)
+
+    position = np.array(start_positions, dtype=float)
+    if n_chains is not None:
+        position = np.broadcast_to(position.reshape(1, n_dimensions), (n_chains, n_dimensions))
+    position = position.reshape(-1, n_dimensions).copy()
+    n_chains = position.shape[0]
+    energy = _batch_energy(potential, position)
+
+    initial_step_size = sampler.fixedStepSize if sampler.fixedStepSize is not None else sampler.step_size_coefficient
+    step_size = np.full(n_chains, float(np.max(initial_step_size)))
+    lower = upper = None
+    if sampler.spaceRange is not None:
+        lower, upper = np.min(sampler.spaceRange), np.max(sampler.spaceRange)
+
+    # The last step is always saved
+    saved_steps = list(range(0, steps + 1, save_every_state))
+    if saved_steps[-1] != steps:
+        saved_steps.append(steps)
+    frames = np.empty((len(saved_steps), n_chains, n_dimensions))
+    energies = np.empty((len(saved_steps), n_chains))
+    frames[0] = position
+    energies[0] = energy
+    frame = 1
+
+    accepted_window = np.zeros(n_chains)
+    accepted_production = np.zeros(n_chains)
+    iteration_queue = tqdm(range(1, steps + 1), desc="Chains: ", mininterval=1.0) if verbosity else range(1, steps + 1)
+    for step in iteration_queue:
+        # Uniform proposals in [-step_size, step_size] in every dimension, as the random shifts of ensembler
+        proposal = position + step_size[:, np.newaxis] * rng.uniform(-1.0, 1.0, size=position.shape)
+        new_energy = _batch_energy(potential, proposal)
+        with np.errstate(over="ignore"):
+            accept = np.log(rng.random(n_chains)) <= -beta * (new_energy - energy)
+        if lower is not None:
+            accept &= np.all((proposal >= lower) & (proposal <= upper), axis=1)
+        position[accept] = proposal[accept]
+        energy[accept] = new_energy[accept]
+
+        if step <= adapt_steps:
+            accepted_window += accept
+            if step % adapt_every == 0:
+                # Larger steps for chains that accept too often, smaller ones for the others
+                step_size *= np.exp(accepted_window / adapt_every - target_acceptance)
+                accepted_window[:] = 0
+        else:
+            accepted_production += accept
+
+        if frame < len(saved_steps) and step == saved_steps[frame]:
+            frames[frame] = position
+            energies[frame] = energy
+            frame += 1
+
+    acceptance = accepted_production / max(steps - adapt_steps, 1)
+    return ChainTrajectory(step=np.array(saved_steps), position=frames, total_potential_energy=energies,
+                           step_size=step_size, acceptance=acceptance, temperature=temperature)
+
+
+def zwanzig_chains(Vi, Vj, kT=1.0):
+    """
+    Zwanzig estimate over all chains and its standard error from the spread between the chains.
+
+    Parameters
+    ----------
+    Vi: array-like
+        Energies of the sampled state i, shape (n_frames, n_chains).
+    Vj: array-like
+        Energies of state j of the same frames.
+    kT: float
+        k_B T in the energy units of the potential (1 for energies in kT).
+
+    Returns
+    -------
+    dF: float
+        Free-energy difference F_j - F_i from all frames of all chains.
+    ddF: float
+        Standard error of dF: standard deviation of the estimates of the
+        single chains divided by sqrt(n_chains).
+    """
+    work = (np.asarray(Vj, dtype=float) - np.asarray(Vi, dtype=float)) / kT
+    n_frames, n_chains = work.shape
+    dF = -kT * (logsumexp(-work) - np.log(work.size))
+    per_chain = -kT * (logsumexp(-work, axis=0) - np.log(n_frames))
+    ddF = np.std(per_chain, ddof=1) / np.sqrt(n_chains) if n_chains > 1 else np.nan
+    return float(dF), float(ddF)
@@ -0,0 +1,40 @@
+import sys
+from os import path
+
+import numpy as np
+import pytest
+import scipy.constants as const
+
+# Make free_energy_utils importable without installing it
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# Temperature at which the ensembler Monte Carlo sampler uses beta = 1, i.e.
+# energies in kT. The Langevin samplers use temperature=1 for this.
+UNIT_TEMPERATURE = 1000.0 / const.gas_constant
+
+# F_B - F_A of the two harmonic oscillators of the notebook, in kT
+EXACT_DF = 1.0 + 0.5 * np.log(3.0)
+
+
+def make_coupled_potential():
+    """
+    V_A = x^2 / 2 and V_B = 3 (x - 3)^2 / 2 + 1, linearly coupled as in the notebook.
+    """
+    from ensembler.potentials import OneD as potentials1D
+    V_A = potentials1D.harmonicOscillatorPotential(k=1)
+    V_B = potentials1D.harmonicOscillatorPotential(k=3, x_shift=3, y_shift=1)
+    return V_A, V_B, potentials1D.linearCoupledPotentials(Va=V_A, Vb=V_B)
+
+
+def make_sampler():
+    """
+    Langevin sampler; ensembler's Monte Carlo sampler retries rejected moves and
+    so does not sample the Boltzmann distribution exactly.
+    """
+    from ensembler.samplers.stochastic import langevinIntegrator
+    return langevinIntegrator(dt=0.1, gamma=1)
+
+
+@pytest.fixture
+def coupled_potential():
+    return make_coupled_potential()
@@ -0,0 +1,163 @@
+import numpy as np
+import pytest
+from conftest import EXACT_DF, make_sampler
+
+from ensembler.analysis.freeEnergyCalculation import zwanzigEquation
+from ensembler.system.basic_system import system
+
+from free_energy_utils import (AccumulatingPerturbedSystem, AccumulatingSystem, BARAccumulator, RunningMoments,
+                               TIAccumulator, ZwanzigAccumulator, bar_from_work, ti_free_energy)
+
+
+def make_system(potential, system_class=AccumulatingSystem):
+    return system_class(potential=potential, sampler=make_sampler(), start_position=0.0, temperature=1.0)
+
+
+class CountingAccumulator:
+    """
+    Reaches the target error after ``n_needed`` states and counts the checks.
+    """
+
+    def __init__(self, n_needed):
+        self.n = 0
+        self.n_needed = n_needed
+        self.checks = 0
+
+    def add_state(self, sys):
+        self.n += 1
+
+    @property
+    def error(self):
+        self.checks += 1
+        return 0.0 if self.n >= self.n_needed else 1.0
+
+
+def test_running_moments():
+    values = np.random.default_rng(0).normal(3.0, 2.0, 1000)
+    moments = RunningMoments()
+    moments.add(values[0])
+    for chunk in np.array_split(values[1:], 7):
+        moments.add(chunk)
+    moments.add([])
+    assert moments.n == 1000
+    assert moments.mean == pytest.approx(values.mean())
+    assert moments.variance == pytest.approx(values.var(ddof=1))
+    assert moments.error == pytest.approx(values.std(ddof=1) / np.sqrt(1000))
+
+
+def test_zwanzig_accumulator():
+    rng = np.random.default_rng(1)
+    Vi, Vj = rng.normal(0, 1, 500), rng.normal(0.5, 1, 500)
+    zwanzig = ZwanzigAccumulator(kT=2.0)
+    assert np.isnan(zwanzig.free_energy) and zwanzig.error == np.inf
+    for chunk in np.array_split(np.arange(500), 9):
+        zwanzig.add(Vi[chunk], Vj[chunk])
+    reference = zwanzigEquation(kT=True).calculate(Vi=Vi / 2, Vj=Vj / 2)
+    assert zwanzig.free_energy == pytest.approx(2.0 * float(reference))
+    assert 0 < zwanzig.error < 0.2
+
+
+def test_bar_accumulator():
+    rng = np.random.default_rng(2)
+    w_forward, w_backward = rng.normal(1.0, 1.0, 300), rng.normal(-0.5, 1.0, 200)
+    bar = BARAccumulator()
+    assert bar.error == np.inf
+    bar.forward.add(np.zeros(300), w_forward)
+    for chunk in np.array_split(w_backward, 4):
+        bar.backward.add(np.zeros(len(chunk)), chunk)
+    df, ddf, _ = bar_from_work(w_forward, w_backward, tolerance=1e-8)
+    assert bar.free_energy == pytest.approx(df, abs=1e-7)
+    assert bar.forward.error == bar.backward.error == pytest.approx(ddf)
+
+
+def test_ti_free_energy():
+    accumulators = []
+    for lam in [1.0, 0.0, 0.5]:
+        accumulator = TIAccumulator(lam)
+        # dH/dlambda = 2 lambda integrates to 1
+        accumulator.add([2 * lam - 0.1, 2 * lam + 0.1])
+        accumulators.append(accumulator)
+    dF, ddF = ti_free_energy(accumulators)
+    assert dF == pytest.approx(0.25 * (0 + 1) + 0.25 * (1 + 2))
+    assert ddF == pytest.approx(np.sqrt((0.25 * 0.1) ** 2 + (0.5 * 0.1) ** 2 + (0.25 * 0.1) ** 2))
+
+
+def test_accumulating_system_matches_ensembler(coupled_potential):
+    V_A, V_B, _ = coupled_potential
+    np.random.seed(0)
+    reference = make_system(V_A, system)
+    reference.simulate(3000, verbosity=False)
+    np.random.seed(0)
+    accumulating = make_system(V_A)
+    zwanzig = ZwanzigAccumulator(V_B)
+    accumulating.simulate(3000, accumulators=[zwanzig], equilibration_steps=300, verbosity=False)
+
+    trajectory = accumulating.trajectory
+    assert len(trajectory) == len(reference.trajectory)
+    np.testing.assert_allclose(trajectory.position.to_numpy(dtype=float),
+                               reference.trajectory.position.to_numpy(dtype=float))
+    # Steps 300 ... 2999 are the rows 301 ... 3000
+    Vi = trajectory.total_potential_energy[301:].to_numpy(dtype=float)
+    Vj = V_B.ene(trajectory.position[301:].to_numpy(dtype=float))
+    assert zwanzig.n == 2700
+    assert zwanzig.free_energy == pytest.approx(float(zwanzigEquation(kT=True).calculate(Vi=Vi, Vj=Vj)))
+
+
+def test_early_stop_stores_the_final_state_once(coupled_potential):
+    V_A, _, _ = coupled_potential
+    accumulating = make_system(V_A)
+    accumulating.simulate(1000, accumulators=[CountingAccumulator(200)], target_error=0.1, check_every=100,
+                          verbosity=False)
+    assert accumulating.step == 199
+    # The start state and the states of steps 0 ... 199
+    assert len(accumulating.trajectory) == 201
+
+    accumulating = make_system(V_A)
+    accumulating.simulate(1000, accumulators=[CountingAccumulator(200)], target_error=0.1, check_every=100,
+                          store_trajectory=False, verbosity=False)
+    assert len(accumulating.trajectory) == 2
+
+
+def test_check_interval_grows():
+    from ensembler.potentials import OneD as potentials1D
+    accumulating = make_system(potentials1D.harmonicOscillatorPotential(k=1))
+    accumulator = CountingAccumulator(10 ** 9)
+    accumulating.simulate(20000, accumulators=[accumulator], target_error=0.1, check_every=100,
+                          store_trajectory=False, verbosity=False)
+    assert accumulating.step == 19999
+    # Every 100 steps up to step 1000, then every tenth of the steps done
+    assert 10 <= accumulator.checks <= 45
+
+
+def test_bar_and_ti_with_early_stopping(coupled_potential):
+    V_A, V_B, V = coupled_potential
+    np.random.seed(1)
+    bar = BARAccumulator(V_A, V_B)
+    systemA, systemB = make_system(V_A), make_system(V_B)
+    systemB._currentPosition = 3.0
+    # About one uncorrelated sample every 20 steps
+    systemA.simulate(10000, accumulators=[bar.forward], equilibration_steps=200, accumulate_every=20,
+                     store_trajectory=False, verbosity=False)
+    systemB.simulate(40000, accumulators=[bar.backward], equilibration_steps=200, accumulate_every=20,
+                     target_error=0.2, store_trajectory=False, verbosity=False)
+    assert systemB.step < 39999
+    assert bar.error <= 0.2
+    assert bar.free_energy == pytest.approx(EXACT_DF, abs=3 * bar.error)
+
+    accumulators = []
+    for lam in np.linspace(0, 1, 6):
+        window = make_system(V, AccumulatingPerturbedSystem)
+        window.lam = lam
+        accumulator = TIAccumulator()
+        window.simulate(4000, accumulators=[accumulator], equilibration_steps=200, accumulate_every=20,
+                        store_trajectory=False, verbosity=False)
+        assert accumulator.lam == lam
+        accumulators.append(accumulator)
+    dF, ddF = ti_free_energy(accumulators)
+    # The windows sample Gaussians with k = 1 + 2 lambda around 9 lambda / k, so
+    # <V_B - V_A> is known exactly; compare with the same trapezoidal rule
+    lambdas = np.linspace(0, 1, 6)
+    k = 1 + 2 * lambdas
+    center = 9 * lambdas / k
+    mean_dhdlam = 1.5 * (1 / k + (center - 3) ** 2) + 1 - 0.5 * (1 / k + center ** 2)
+    assert dF == pytest.approx(np.trapz(mean_dhdlam, lambdas), abs=3 * ddF)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from conftest import EXACT_DF
+
+from ensembler.analysis.freeEnergyCalculation import bennetAcceptanceRatio
+
+from free_energy_utils import LogBennettAcceptanceRatio, bar_free_energy, bar_from_work
+
+
+def harmonic_samples(coupled_potential, n, seed=0):
+    """
+    Exact Boltzmann samples (kT = 1) of V_A and V_B and their energies in both states.
+    """
+    V_A, V_B, _ = coupled_potential
+    rng = np.random.default_rng(seed)
+    x_A = rng.normal(0.0, 1.0, n)
+    x_B = rng.normal(3.0, 1.0 / np.sqrt(3.0), n)
+    return V_A.ene(x_A), V_B.ene(x_A), V_A.ene(x_B), V_B.ene(x_B)
+
+
+def test_bar_against_exact_result(coupled_potential):
+    dF, ddF, _ = bar_free_energy(*harmonic_samples(coupled_potential, 5000))
+    assert 0 < ddF < 0.1
+    assert dF == pytest.approx(EXACT_DF, abs=3 * ddF)
+
+
+def test_analytical_error_against_bootstrap(coupled_potential):
+    Vi_i, Vj_i, Vi_j, Vj_j = (np.asarray(V) for V in harmonic_samples(coupled_potential, 2000))
+    _, ddF, _ = bar_free_energy(Vi_i, Vj_i, Vi_j, Vj_j)
+    rng = np.random.default_rng(1)
+    estimates = []
+    for _ in range(200):
+        i = rng.integers(0, len(Vi_i), len(Vi_i))
+        j = rng.integers(0, len(Vi_j), len(Vi_j))
+        estimates.append(bar_free_energy(Vi_i[i], Vj_i[i], Vi_j[j], Vj_j[j])[0])
+    assert ddF == pytest.approx(np.std(estimates), rel=0.25)
+
+
+def test_bar_against_ensembler(coupled_potential):
+    samples = harmonic_samples(coupled_potential, 300)
+    expected = float(bennetAcceptanceRatio(kT=True, convergence_radius=1e-8).calculate(*samples))
+    assert bar_free_energy(*samples)[0] == pytest.approx(expected, abs=1e-5)
+
+
+def test_drop_in_for_ensembler(coupled_potential):
+    Vi_i, Vj_i, Vi_j, Vj_j = harmonic_samples(coupled_potential, 300)
+    T = 300
+    expected = float(bennetAcceptanceRatio(kJ=True, T=T, convergence_radius=1e-8).calculate(Vi_i, Vj_i, Vi_j, Vj_j))
+    bar = LogBennettAcceptanceRatio(kJ=True, T=T, convergence_radius=1e-8)
+    assert bar.calculate(Vi_i, Vj_i, Vi_j, Vj_j) == pytest.approx(expected, abs=1e-5)
+    dF, ddF = bar.calculate_with_error(Vi_i, Vj_i, Vi_j, Vj_j)
+    assert dF == bar.calculate(Vi_i, Vj_i, Vi_j, Vj_j)
+    # Energies in kJ/mol: beta = 1 / (R/1000 T)
+    beta = 1.0 / (8.31446261815324e-3 * T)
+    assert dF == pytest.approx(bar_free_energy(Vi_i, Vj_i, Vi_j, Vj_j, beta=beta)[0])
+    assert ddF > 0
+
+
+def test_large_energy_gap():
+    # exp(-w) overflows double precision; the log-space sums do not
+    rng = np.random.default_rng(0)
+    w_forward = 2000.0 + rng.normal(size=500)
+    w_backward = -2000.0 + rng.normal(size=500)
+    df, ddf, _ = bar_from_work(w_forward, w_backward)
+    assert df == pytest.approx(2000.0, abs=0.5)
+    assert np.isfinite(ddf)
+
+
+def test_bar_needs_both_states():
+    with pytest.raises(ValueError):
+        bar_from_work([1.0, 2.0], [])
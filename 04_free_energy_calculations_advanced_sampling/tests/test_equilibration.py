@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from free_energy_utils import (autocorrelation, decorrelated_indices, detect_equilibration, statistical_inefficiency,
+                               subsample_indices)
+
+
+def ar1(n, phi, seed=0):
+    """
+    AR(1) series x_t = phi x_(t-1) + noise, with g = (1 + phi) / (1 - phi).
+    """
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(size=n)
+    x = np.empty(n)
+    x[0] = noise[0] / np.sqrt(1 - phi ** 2)
+    for t in range(1, n):
+        x[t] = phi * x[t - 1] + noise[t]
+    return x
+
+
+def test_autocorrelation_matches_direct_sum():
+    x = ar1(500, 0.8)
+    fluctuation = x - x.mean()
+    direct = np.array([np.mean(fluctuation[:len(x) - t] * fluctuation[t:]) for t in range(20)])
+    np.testing.assert_allclose(autocorrelation(x, max_lag=19), direct / direct[0], atol=1e-12)
+
+
+def test_autocorrelation_of_constant_series():
+    np.testing.assert_array_equal(autocorrelation(np.full(10, 3.0)), np.zeros(10))
+    assert statistical_inefficiency(np.full(10, 3.0)) == 1.0
+
+
+@pytest.mark.parametrize("phi", [0.0, 0.5, 0.9])
+def test_statistical_inefficiency_of_ar1(phi):
+    g = statistical_inefficiency(ar1(100000, phi))
+    assert g == pytest.approx((1 + phi) / (1 - phi), rel=0.1)
+
+
+def test_detect_equilibration_skips_transient():
+    x = ar1(20000, 0.5)
+    x[:1000] += np.linspace(50, 0, 1000)
+    t0, g, n_effective = detect_equilibration(x)
+    assert 900 <= t0 <= 3000
+    assert g == pytest.approx(3.0, rel=0.2)
+    assert n_effective == pytest.approx((len(x) - t0) / g)
+
+
+def test_detect_equilibration_with_blocks():
+    x = ar1(20000, 0.5)
+    x[:1000] += 50
+    t0, _, _ = detect_equilibration(x, max_samples=1000)
+    # The origins are multiples of the block length
+    assert t0 % 20 == 0
+    assert 1000 <= t0 <= 3000
+
+
+@pytest.mark.parametrize("x", [[], [1.0]])
+def test_detect_equilibration_of_short_series(x):
+    t0, g, n_effective = detect_equilibration(x)
+    assert (t0, g, n_effective) == (0, 1.0, float(len(x)))
+    np.testing.assert_array_equal(decorrelated_indices(x), np.arange(len(x)))
+
+
+def test_subsample_indices():
+    np.testing.assert_array_equal(subsample_indices(10, 2.5, start=1), [1, 3, 6, 8])
+    np.testing.assert_array_equal(subsample_indices(5, 0.3), np.arange(5))
+
+
+def test_decorrelated_indices():
+    x = ar1(20000, 0.9)
+    indices = decorrelated_indices(x)
+    assert len(indices) == pytest.approx(20000 / 19, rel=0.2)
+    # Every 19th sample of the AR(1) series is correlated with 0.9 ** 19 = 0.14 instead of 0.9
+    assert abs(autocorrelation(x[indices], max_lag=1)[1]) < 0.3
+    all_indices = decorrelated_indices(x, detect=False)
+    assert all_indices[0] == 0
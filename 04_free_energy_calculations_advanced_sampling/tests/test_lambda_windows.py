@@ -0,0 +1,117 @@
+import multiprocessing as mp
+
+import numpy as np
+import pytest
+from conftest import EXACT_DF, UNIT_TEMPERATURE, make_sampler
+
+from ensembler.samplers.stochastic import metropolisMonteCarloIntegrator
+from ensembler.system.perturbed_system import perturbedSystem
+
+from free_energy_utils import bar_free_energy, simulate_lambda_windows
+
+LAMBDAS = np.linspace(0, 1, 5)
+
+
+def make_system(potential, system_class=perturbedSystem):
+    return system_class(potential=potential, sampler=make_sampler(), temperature=1.0)
+
+
+def bar_chain(potential, system_trajs, start=200, stride=20):
+    dF = 0.0
+    variance = 0.0
+    for lam_i, lam_j in zip(LAMBDAS, LAMBDAS[1:]):
+        traj_i, traj_j = system_trajs[lam_i][start::stride], system_trajs[lam_j][start::stride]
+        positions_i = traj_i.position.to_numpy(dtype=float)
+        positions_j = traj_j.position.to_numpy(dtype=float)
+        potential.set_lambda(lam_i)
+        Vi_i, Vi_j = potential.ene(positions_i), potential.ene(positions_j)
+        potential.set_lambda(lam_j)
+        Vj_i, Vj_j = potential.ene(positions_i), potential.ene(positions_j)
+        dF_ij, ddF_ij, _ = bar_free_energy(Vi_i, Vj_i, Vi_j, Vj_j)
+        dF += dF_ij
+        variance += ddF_ij ** 2
+    return dF, np.sqrt(variance)
+
+
+def assert_exchange_energies(potential, system_trajs, exchanges, exchange_every, kT=1.0):
+    """
+    delta of every exchange attempt is the reduced energy change of the swap.
+    """
+    for row in exchanges.itertuples():
+        frame = exchange_every * (row.segment + 1)
+        x_i = system_trajs[row.lam_i].position[frame]
+        x_j = system_trajs[row.lam_j].position[frame]
+        potential.set_lambda(row.lam_i)
+        delta = potential.ene(x_j) - potential.ene(x_i)
+        potential.set_lambda(row.lam_j)
+        delta += potential.ene(x_i) - potential.ene(x_j)
+        assert row.delta == pytest.approx(float(np.squeeze(delta)) / kT)
+
+
+def test_independent_windows(coupled_potential):
+    _, _, V = coupled_potential
+    system_trajs, exchanges = simulate_lambda_windows(make_system(V), LAMBDAS, 8000, n_workers=2, random_seed=0,
+                                                      verbosity=False)
+    assert list(system_trajs) == list(LAMBDAS)
+    assert len(exchanges) == 0
+    for lam, traj in system_trajs.items():
+        assert len(traj) == 8001
+        assert (traj.lam[1:] == lam).all()
+    dF, ddF = bar_chain(V, system_trajs)
+    assert dF == pytest.approx(EXACT_DF, abs=3 * ddF)
+
+
+def test_replica_exchange_langevin(coupled_potential):
+    _, _, V = coupled_potential
+    system_trajs, exchanges = simulate_lambda_windows(make_system(V), LAMBDAS, 8000, exchange_every=10,
+                                                      random_seed=0, verbosity=False)
+    assert 0 < exchanges.accepted.mean() < 1
+    # The Langevin samplers use energies in k_B, kT = temperature = 1
+    assert_exchange_energies(V, system_trajs, exchanges, 10)
+    # A swapped configuration keeps its Langevin velocity, so the windows stay in equilibrium
+    positions = system_trajs[0.0].position[200:].to_numpy(dtype=float)
+    assert np.mean(positions) == pytest.approx(0.0, abs=0.15)
+    assert np.var(positions) == pytest.approx(1.0, abs=0.15)
+    dF, ddF = bar_chain(V, system_trajs)
+    assert dF == pytest.approx(EXACT_DF, abs=3 * ddF)
+
+
+def test_replica_exchange_monte_carlo(coupled_potential):
+    _, _, V = coupled_potential
+    # The Monte Carlo sampler uses kT = R T / 1000, i.e. kT = 1 at UNIT_TEMPERATURE
+    system = perturbedSystem(potential=V, sampler=metropolisMonteCarloIntegrator(step_size_coefficient=1),
+                             temperature=UNIT_TEMPERATURE)
+    system_trajs, exchanges = simulate_lambda_windows(system, LAMBDAS, 2000, exchange_every=100,
+                                                      random_seed=0, verbosity=False)
+    # 19 exchange steps, alternating between the two even and the two odd pairs
+    assert len(exchanges) == 19 * 2
+    assert set(exchanges.segment) == set(range(19))
+    assert 0 < exchanges.accepted.mean() < 1
+    assert_exchange_energies(V, system_trajs, exchanges, 100)
+    for lam, traj in system_trajs.items():
+        assert len(traj) == 2001
+        # The swapped configurations are simulated with the energies of their new window
+        V.set_lambda(lam)
+        np.testing.assert_allclose(V.ene(traj.position[1:].to_numpy(dtype=float)),
+                                   traj.total_potential_energy[1:].to_numpy(dtype=float))
+
+
+def test_exchange_temperature(coupled_potential):
+    _, _, V = coupled_potential
+    system_trajs, exchanges = simulate_lambda_windows(make_system(V), LAMBDAS, 100, exchange_every=10, kT=2.0,
+                                                      random_seed=0, verbosity=False)
+    assert_exchange_energies(V, system_trajs, exchanges, 10, kT=2.0)
+
+
+class FailingSystem(perturbedSystem):
+    def simulate(self, *args, **kwargs):
+        if self.lam > 0.5:
+            raise RuntimeError(f"window {self.lam} failed")
+        return super().simulate(*args, **kwargs)
+
+
+def test_worker_error_is_raised(coupled_potential):
+    _, _, V = coupled_potential
+    with pytest.raises(RuntimeError, match="window .* failed"):
+        simulate_lambda_windows(make_system(V, FailingSystem), LAMBDAS, 100, n_workers=5, verbosity=False)
+    assert mp.active_children() == []
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from conftest import EXACT_DF, make_coupled_potential, make_sampler
+
+from ensembler.system.perturbed_system import perturbedSystem
+
+from free_energy_utils import MBAR, mbar_free_energies, reduced_potential_matrix, select_samples, simulate_lambda_windows
+
+LAMBDAS = np.linspace(0, 1, 5)
+
+
+@pytest.fixture(scope="module")
+def lambda_windows():
+    _, _, V = make_coupled_potential()
+    system = perturbedSystem(potential=V, sampler=make_sampler(), temperature=1.0)
+    system_trajs, _ = simulate_lambda_windows(system, LAMBDAS, 8000, random_seed=0, verbosity=False)
+    return V, system_trajs
+
+
+def harmonic_samples(spring_constants, centers, n_samples, seed=0):
+    """
+    Exact samples of harmonic states u_k(x) = k (x - x_k)^2 / 2 and their exact f_k.
+    """
+    rng = np.random.default_rng(seed)
+    samples = np.concatenate([rng.normal(center, 1 / np.sqrt(k), n) for k, center, n
+                              in zip(spring_constants, centers, n_samples)])
+    u_kn = 0.5 * np.asarray(spring_constants)[:, np.newaxis] * (samples - np.asarray(centers)[:, np.newaxis]) ** 2
+    f_k = -0.5 * np.log(2 * np.pi / np.asarray(spring_constants))
+    return u_kn, np.array(n_samples), f_k - f_k[0]
+
+
+@pytest.mark.parametrize("method", ["newton", "L-BFGS-B"])
+def test_mbar_recovers_exact_free_energies(method):
+    u_kn, n_k, f_k = harmonic_samples([1.0, 2.0, 4.0, 8.0], [0.0, 0.5, 1.0, 1.5], [2000, 2000, 2000, 2000])
+    mbar = MBAR(u_kn, n_k, method=method)
+    delta_f, d_delta_f = mbar.free_energy_differences()
+    # Within three standard errors of the exact result
+    assert np.all(np.abs(delta_f[0] - f_k) <= 3 * d_delta_f[0] + 1e-12)
+    assert np.all(d_delta_f[0, 1:] > 0)
+    np.testing.assert_allclose(np.diag(d_delta_f), 0.0, atol=1e-6)
+    # Every state's weights are normalized over all samples
+    np.testing.assert_allclose(mbar.weights().sum(axis=0), 1.0)
+
+
+def test_solvers_give_the_same_uncertainties():
+    u_kn, n_k, _ = harmonic_samples([1.0, 1.5, 3.0], [0.0, 1.0, 2.0], [1000, 500, 1500])
+    delta_f, d_delta_f = MBAR(u_kn, n_k).free_energy_differences()
+    delta_f_lbfgs, d_delta_f_lbfgs = MBAR(u_kn, n_k, method="L-BFGS-B").free_energy_differences()
+    np.testing.assert_allclose(delta_f_lbfgs, delta_f, atol=1e-5)
+    assert np.all(d_delta_f_lbfgs[0, 1:] > 0)
+    np.testing.assert_allclose(d_delta_f_lbfgs, d_delta_f, rtol=1e-4, atol=1e-8)
+
+
+def test_unsampled_state():
+    u_kn, n_k, f_k = harmonic_samples([1.0, 2.0, 4.0], [0.0, 0.2, 0.4], [3000, 0, 3000])
+    mbar = MBAR(u_kn, n_k)
+    assert mbar.f_k[1] == pytest.approx(f_k[1], abs=0.05)
+
+
+def test_shape_is_checked():
+    with pytest.raises(ValueError, match="shape"):
+        MBAR(np.zeros((2, 5)), [2, 2])
+
+
+def test_select_samples():
+    u_kn = np.arange(14, dtype=float).reshape(2, 7)
+    selected, n_k = select_samples(u_kn, [3, 4], start=1, stride=2)
+    assert list(n_k) == [1, 2]
+    assert list(selected[0]) == [1, 4, 6]
+    selected, n_k = select_samples(u_kn, [3, 4], indices=[[0, 2], [3]])
+    assert list(n_k) == [2, 1]
+    assert list(selected[1]) == [7, 9, 13]
+
+
+def test_reduced_potential_matrix_and_cache(lambda_windows, tmp_path):
+    V, system_trajs = lambda_windows
+    V.set_lambda(0.3)
+    u_kn, n_k = reduced_potential_matrix(V, system_trajs, cache_dir=tmp_path)
+    assert V.constants[V.lam] == 0.3
+    assert list(n_k) == [8001] * 5
+    positions = system_trajs[LAMBDAS[2]].position.to_numpy(dtype=float)
+    V.set_lambda(LAMBDAS[4])
+    np.testing.assert_allclose(u_kn[4, 2 * 8001:3 * 8001], V.ene(positions))
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+
+    # The second call is read from the cache
+    cached, _ = reduced_potential_matrix(V, system_trajs, cache_dir=tmp_path)
+    np.testing.assert_array_equal(cached, u_kn)
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+    # Other kT, other windows and other samples get their own entries
+    halved, _ = reduced_potential_matrix(V, system_trajs, kT=2.0, cache_dir=tmp_path)
+    np.testing.assert_allclose(halved, u_kn / 2)
+    reduced_potential_matrix(V, {lam: system_trajs[lam] for lam in LAMBDAS[:3]}, cache_dir=tmp_path)
+    reduced_potential_matrix(V, {lam: traj[:100] for lam, traj in system_trajs.items()}, cache_dir=tmp_path)
+    assert len(list(tmp_path.glob("*.npz"))) == 4
+
+
+def test_mbar_free_energies_of_lambda_windows(lambda_windows):
+    V, system_trajs = lambda_windows
+    result = mbar_free_energies(V, system_trajs, equilibration_steps=200)
+    assert list(result.lam) == list(LAMBDAS)
+    assert result.dF.iloc[0] == 0.0
+    lbfgs = mbar_free_energies(V, system_trajs, equilibration_steps=200, method="L-BFGS-B")
+    np.testing.assert_allclose(lbfgs.ddF, result.ddF, rtol=1e-4)
+
+    # The error estimate assumes uncorrelated samples, so compare on every 20th frame
+    u_kn, n_k = select_samples(*reduced_potential_matrix(V, system_trajs), start=200, stride=20)
+    delta_f, d_delta_f = MBAR(u_kn, n_k).free_energy_differences()
+    assert delta_f[0, -1] == pytest.approx(result.dF.iloc[-1], abs=3 * d_delta_f[0, -1])
+    assert delta_f[0, -1] == pytest.approx(EXACT_DF, abs=3 * d_delta_f[0, -1])
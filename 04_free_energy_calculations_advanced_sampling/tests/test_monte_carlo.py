@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from conftest import EXACT_DF, UNIT_TEMPERATURE, make_sampler
+
+from ensembler.potentials import OneD as potentials1D
+from ensembler.samplers.stochastic import metropolisMonteCarloIntegrator
+
+from free_energy_utils import ChainTrajectory, simulate_chains, zwanzig_chains
+
+
+def test_steps_zero_saves_start():
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    traj = simulate_chains(V, metropolisMonteCarloIntegrator(), [[0.0], [1.0]], steps=0, verbosity=False)
+    np.testing.assert_array_equal(traj.step, [0])
+    np.testing.assert_array_equal(traj.position[:, :, 0], [[0.0, 1.0]])
+    np.testing.assert_allclose(traj.total_potential_energy, [[0.0, 0.5]])
+
+
+def test_saved_steps():
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    traj = simulate_chains(V, metropolisMonteCarloIntegrator(), 0.0, steps=7, n_chains=3, save_every_state=3,
+                           random_seed=0, verbosity=False)
+    np.testing.assert_array_equal(traj.step, [0, 3, 6, 7])
+    assert traj.position.shape == (4, 3, 1)
+    assert traj.n_chains == 3
+    np.testing.assert_allclose(traj.total_potential_energy, V.ene(traj.position[..., 0]))
+
+
+def test_boltzmann_distribution_and_adaptation():
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    traj = simulate_chains(V, metropolisMonteCarloIntegrator(step_size_coefficient=0.1), 0.0, steps=3000,
+                           n_chains=500, temperature=UNIT_TEMPERATURE, adapt_steps=2000, random_seed=0,
+                           verbosity=False)
+    # The step sizes are tuned toward the target acceptance during the adaptation
+    assert traj.step_size.mean() > 1.0
+    assert traj.acceptance.mean() == pytest.approx(0.5, abs=0.1)
+    start = np.searchsorted(traj.step, 2000)
+    positions = traj.position[start:, :, 0]
+    # <x^2> = kT / k = 1
+    assert np.mean(positions ** 2) == pytest.approx(1.0, abs=0.03)
+
+
+def test_space_range():
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    sampler = metropolisMonteCarloIntegrator(step_size_coefficient=1, space_range=[-0.5, 0.5])
+    traj = simulate_chains(V, sampler, 0.0, steps=200, n_chains=100, temperature=UNIT_TEMPERATURE,
+                           random_seed=0, verbosity=False)
+    assert np.all(np.abs(traj.position) <= 0.5)
+
+
+def test_zwanzig_chains_against_exact_result(coupled_potential):
+    V_A, V_B, _ = coupled_potential
+    equilibration_steps = 200
+    traj = simulate_chains(V_A, metropolisMonteCarloIntegrator(step_size_coefficient=1), 0.0, steps=1000,
+                           n_chains=200, temperature=UNIT_TEMPERATURE, adapt_steps=equilibration_steps,
+                           random_seed=0, verbosity=False)
+    start = np.searchsorted(traj.step, equilibration_steps)
+    VA_sampled = traj.total_potential_energy[start:]
+    VB_sampled = traj.energies(V_B, start=start)
+    assert VA_sampled.shape == VB_sampled.shape == (801, 200)
+    dF, ddF = zwanzig_chains(VA_sampled, VB_sampled)
+    assert dF == pytest.approx(EXACT_DF, abs=3 * ddF)
+    assert 0 < ddF < 0.1
+
+
+def test_zwanzig_chains_units():
+    rng = np.random.default_rng(0)
+    Vi = rng.normal(size=(100, 4))
+    Vj = Vi + 1.0
+    assert zwanzig_chains(Vi, Vj) == pytest.approx((1.0, 0.0))
+    assert zwanzig_chains(2 * Vi, 2 * Vj, kT=2.0)[0] == pytest.approx(2.0)
+    assert np.isnan(zwanzig_chains(Vi[:, :1], Vj[:, :1])[1])
+
+
+def test_chain_dataframe():
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    traj = simulate_chains(V, metropolisMonteCarloIntegrator(), 0.0, steps=10, n_chains=2, save_every_state=5,
+                           temperature=300, random_seed=0, verbosity=False)
+    chain = traj.chain(1)
+    assert list(chain.index) == [0, 5, 10]
+    assert list(chain.columns) == ["position", "temperature", "total_potential_energy"]
+    np.testing.assert_array_equal(chain.position, traj.position[:, 1, 0])
+    assert (chain.temperature == 300).all()
+
+    traj_2d = ChainTrajectory(step=np.arange(2), position=np.zeros((2, 1, 2)), total_potential_energy=np.zeros((2, 1)))
+    assert traj_2d.chain(0).position.iloc[0].shape == (2,)
+
+
+def test_other_samplers_are_rejected():
+    V = potentials1D.harmonicOscillatorPotential(k=1)
+    with pytest.raises(ValueError):
+        simulate_chains(V, make_sampler(), 0.0, steps=1, n_chains=1, verbosity=False)
@@ -0,0 +1,25 @@
+"""
+Helper functions for the molecular docking and virtual screening notebooks.
+
+The notebooks live in sub-folders of ``05_molecular_docking``, so add the
+parent folder to the Python path before importing:
+
+>>> import sys
+>>> sys.path.append('..')
+>>> from docking_utils import run_smina, dock_dataframe
+"""
+
+from .cache import DockingCache, smina_version
+from .evaluation import (auc_confidence_intervals, bedroc, bootstrap_auc, delong_auc, enrichment_factors,
+                         evaluate_screening, roc_auc, roc_points)
+from .explorer import draw_depictions, write_explorer
+from .filters import RULE_SETS, compute_descriptors, filter_ligands
+from .library import ResultWriter, dock_batch, iter_ligand_batches, read_results, screen_library
+from .ligand_prep import generate_conformers, prepare_dataframe, prepare_ligands, save_sdf
+from .pipeline import JobLedger, ScreeningPipeline
+from .receptor import PreparedReceptor, prepare_receptor, read_box_config, trim_receptor, write_box_config
+from .rmsd import atom_mappings, cross_docking_rmsd, load_poses, pose_pair_rmsd, rmsd_matrix
+from .runner import DockingJob, DockingResult, dock_dataframe, dock_ligands, split_cores
+from .scheduler import compare_protocols, select_for_refinement, two_pass_docking
+from .scores import collect_scores, collect_scores_dir, extract_docking_score, parse_smina_log, read_sd_tags
+from .smina import run_smina, smina_command
@@ -0,0 +1,237 @@
+"""
+On-disk cache for smina docking results.
+
+Each docking run is identified by a hash over everything that influences its
+result: the receptor file, the ligand file, the binding box, the docking
+settings and the smina version. If the same run was done before, the stored
+poses and log are copied to the requested location instead of running smina
+again. The cache keeps at most ``max_size`` bytes and evicts the least recently
+used entries first.
+
+Example
+-------
+>>> cache = DockingCache('output/cache')
+>>> log_text = cache.run_smina(ligand=prepared_ligand, protein=protein_path,
+...                            output=docked_ligand, pocket_center=pocket_center,
+...                            pocket_size=pocket_size, log=log_file)
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+from .smina import run_smina
+
+
+@lru_cache(maxsize=None)
+def smina_version(executable="smina"):
+    """
+    Return the version string of the installed smina executable.
+
+    Parameters
+    ----------
+    executable: str
+        Name or path of the smina executable.
+
+    Returns
+    -------
+    version: str
+        The first line printed by ``smina --version``.
+    """
+    output = subprocess.run([executable, "--version"], stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, universal_newlines=True).stdout
+    return output.strip().splitlines()[0] if output.strip() else "unknown"
+
+
+def _file_digest(file_path):
+    """
+    SHA-256 digest of the content of a file.
+    """
+    stat = os.stat(file_path)
+    return _file_digest_cached(str(file_path), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=1024)
+def _file_digest_cached(file_path, mtime_ns, size):
+    # The receptor is hashed for every ligand, so remember digests of files
+    # that did not change since they were last read
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DockingCache:
+    """
+    Content-addressed store of docking poses and smina logs.
+
+    Parameters
+    ----------
+    cache_dir: str or pathlib.Path
+        Directory in which the cached results are stored.
+    max_size: int
+        Maximal total size of the cache in bytes.
+    """
+
+    def __init__(self, cache_dir, max_size=2**30):
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, ligand, protein, pocket_center=None, pocket_size=None, num_poses=10,
+            exhaustiveness=8, seed=None, ligand_key=None, config=None):
+        """
+        Compute the cache key of a docking run.
+
+        Parameters
+        ----------
+        ligand: str or pathlib.Path
+            Path to the prepared ligand file.
+        protein: str or pathlib.Path
+            Path to the receptor file.
+        pocket_center: iterable of float or int
+            Coordinates defining the center of the binding site.
+        pocket_size: iterable of float or int
+            Lengths of edges defining the binding site.
+        num_poses: int
+            Maximum number of poses to generate.
+        exhaustiveness: int
+            Accuracy of docking calculations.
+        seed: int or None
+            Random seed of the docking run.
+        ligand_key: str or None
+            Identifier used instead of the ligand file content, e.g. the
+            SMILES string if the conformer generation is not deterministic.
+        config: str or pathlib.Path or None
+            Path to the smina config file with the binding box, hashed instead
+            of ``pocket_center`` and ``pocket_size``.
+
+        Returns
+        -------
+        key: str
+            Hexadecimal SHA-256 hash.
+        """
+        ligand_id = ligand_key if ligand_key is not None else _file_digest(ligand)
+        if config is not None:
+            box = [_file_digest(config)]
+        else:
+            box = [" ".join(f"{float(x):.4f}" for x in pocket_center),
+                   " ".join(f"{float(x):.4f}" for x in pocket_size)]
+        fields = [
+            smina_version(),
+            _file_digest(protein),
+            str(ligand_id),
+            *box,
+            str(num_poses),
+            str(exhaustiveness),
+            str(seed),
+        ]
+        return hashlib.sha256("\n".join(fields).encode()).hexdigest()
+
+    def _paths(self, key, suffix):
+        return self.cache_dir / f"{key}{suffix}", self.cache_dir / f"{key}.log"
+
+    def get(self, key, output, log=None):
+        """
+        Copy a cached result to ``output`` (and ``log``).
+
+        Returns
+        -------
+        log_text: str or None
+            The stored smina output, or None if the key is not in the cache.
+        """
+        poses_path, log_path = self._paths(key, Path(output).suffix)
+        try:
+            shutil.copyfile(poses_path, output)
+            log_text = log_path.read_text()
+        except FileNotFoundError:
+            return None
+
+        # Mark the entry as recently used
+        os.utime(poses_path)
+        os.utime(log_path)
+        if log is not None:
+            with open(log, "w") as f:
+                f.writelines(log_text)
+        return log_text
+
+    def put(self, key, output, log_text):
+        """
+        Store the poses in ``output`` and the smina output under ``key``.
+        """
+        poses_path, log_path = self._paths(key, Path(output).suffix)
+
+        # Write to temporary files first so that parallel workers never read
+        # half-written entries
+        for source, target in ((output, poses_path), (None, log_path)):
+            handle, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(handle, "w" if source is None else "wb") as f:
+                if source is None:
+                    f.write(log_text)
+                else:
+                    with open(source, "rb") as poses:
+                        shutil.copyfileobj(poses, f)
+            os.replace(tmp_path, target)
+        self.evict()
+
+    def size(self):
+        """
+        Total size of the cached files in bytes.
+        """
+        return sum(entry.stat().st_size for entry in self.cache_dir.iterdir() if entry.is_file())
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits ``max_size``.
+        """
+        entries = {}
+        for entry in self.cache_dir.iterdir():
+            if entry.suffix == ".tmp" or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            last_used, size = entries.get(entry.stem, (0.0, 0))
+            entries[entry.stem] = (max(last_used, stat.st_mtime), size + stat.st_size)
+
+        total = sum(size for _, size in entries.values())
+        for key, (_, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+            if total <= self.max_size:
+                break
+            for entry in self.cache_dir.glob(f"{key}.*"):
+                try:
+                    entry.unlink()
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def run_smina(self, ligand, protein, output, pocket_center=None, pocket_size=None, log=None,
+                  num_poses=10, exhaustiveness=8, cpu=None, seed=None, ligand_key=None, config=None):
+        """
+        Perform docking with Smina unless the result is already cached.
+
+        Takes the same parameters as :func:`docking_utils.smina.run_smina`,
+        plus ``ligand_key`` (see :meth:`key`).
+
+        Returns
+        -------
+        log_text: str
+            The output of the Smina calculation.
+        """
+        key = self.key(ligand, protein, pocket_center, pocket_size, num_poses=num_poses,
+                       exhaustiveness=exhaustiveness, seed=seed, ligand_key=ligand_key, config=config)
+        log_text = self.get(key, output, log)
+        if log_text is not None:
+            return log_text
+
+        log_text = run_smina(ligand, protein, output, pocket_center, pocket_size, log=log,
+                             num_poses=num_poses, exhaustiveness=exhaustiveness,
+                             cpu=cpu, seed=seed, config=config)
+        self.put(key, output, log_text)
+        return log_text
@@ -0,0 +1,383 @@
+"""
+Evaluation of virtual screening results.
+
+The ROC notebook computes every ROC point separately: for each threshold, all
+predictions are recomputed and a confusion matrix is built. With N ligands and
+T thresholds this costs O(N*T). Here, the ligands are sorted by score once;
+the number of true and false positives above every threshold is then a
+cumulative sum over the sorted labels. All metrics (ROC curve, AUC, BEDROC and
+enrichment factors) follow from these sums in O(N log N).
+
+Throughout this module, lower docking scores are better and actives are the
+positive class, i.e. ligands are ranked from the lowest to the highest score.
+
+Example
+-------
+>>> metrics = evaluate_screening(information, affinity_threshold=1.)
+>>> fpr, tpr, thresholds = roc_points(information['Affinity[µM]'] < 1., -information['score'])
+>>> auc_confidence_intervals(information, ["score_screen", "score"], method="delong")
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+EF_FRACTIONS = (0.005, 0.01, 0.02, 0.05)
+
+
+def _ranked_labels(y_true, y_score):
+    """
+    Labels sorted from the highest to the lowest score, and the sorted scores.
+    """
+    y_true = np.asarray(y_true, dtype=bool)
+    y_score = np.asarray(y_score, dtype=float)
+    order = np.argsort(-y_score, kind="mergesort")
+    return y_true[order], y_score[order]
+
+
+def roc_points(y_true, y_score):
+    """
+    ROC curve from one sort and cumulative sums.
+
+    Parameters
+    ----------
+    y_true: array-like of bool
+        True for positives (actives).
+    y_score: array-like of float
+        Scores, higher values mean "more likely positive" (as for
+        ``sklearn.metrics.roc_curve``).
+
+    Returns
+    -------
+    fpr: numpy.ndarray
+        False positive rate for every threshold.
+    tpr: numpy.ndarray
+        True positive rate for every threshold.
+    thresholds: numpy.ndarray
+        The distinct scores in decreasing order, preceded by ``inf``.
+    """
+    labels, scores = _ranked_labels(y_true, y_score)
+    # The last position of every group of equal scores is a threshold
+    distinct = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    true_positives = np.cumsum(labels)[distinct]
+    false_positives = (distinct + 1) - true_positives
+
+    tpr = np.r_[0, true_positives] / max(true_positives[-1], 1)
+    fpr = np.r_[0, false_positives] / max(false_positives[-1], 1)
+    thresholds = np.r_[np.inf, scores[distinct]]
+    return fpr, tpr, thresholds
+
+
+def roc_auc(fpr, tpr):
+    """
+    Area under a ROC curve (trapezoidal rule).
+    """
+    return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+
+def enrichment_factors(y_true, y_score, fractions=EF_FRACTIONS):
+    """
+    Enrichment factors of the top fractions of a ranked library.
+
+    The enrichment factor at fraction ``f`` is the fraction of actives among
+    the ``ceil(f * N)`` best-ranked ligands divided by the fraction of actives
+    in the whole library.
+
+    Parameters
+    ----------
+    y_true: array-like of bool
+        True for actives.
+    y_score: array-like of float
+        Scores, higher values rank first.
+    fractions: iterable of float
+        Fractions of the library, e.g. 0.01 for EF1%.
+
+    Returns
+    -------
+    factors: numpy.ndarray
+        One enrichment factor per fraction.
+    """
+    labels, _ = _ranked_labels(y_true, y_score)
+    n_total = len(labels)
+    n_actives = labels.sum()
+    if n_actives == 0:
+        return np.zeros(len(fractions))
+    found = np.cumsum(labels)
+    n_top = np.maximum(np.ceil(np.asarray(fractions) * n_total).astype(int), 1)
+    return (found[n_top - 1] / n_top) / (n_actives / n_total)
+
+
+def bedroc(y_true, y_score, alpha=20.):
+    """
+    Boltzmann-enhanced discrimination of ROC (Truchon & Bayly, 2007).
+
+    Parameters
+    ----------
+    y_true: array-like of bool
+        True for actives.
+    y_score: array-like of float
+        Scores, higher values rank first.
+    alpha: float
+        Early recognition parameter. With 20, the first 8% of the ranked
+        library account for 80% of the score.
+
+    Returns
+    -------
+    bedroc: float
+        Value between 0 and 1.
+    """
+    labels, _ = _ranked_labels(y_true, y_score)
+    n_total = len(labels)
+    n_actives = labels.sum()
+    if n_actives == 0:
+        return 0.0
+    ranks = np.flatnonzero(labels) + 1
+    ratio = n_actives / n_total
+
+    random_sum = n_actives / n_total * (1 - np.exp(-alpha)) / (np.exp(alpha / n_total) - 1)
+    rie = np.exp(-alpha * ranks / n_total).sum() / random_sum
+    rie_max = (1 - np.exp(-alpha * ratio)) / (ratio * (1 - np.exp(-alpha)))
+    rie_min = (1 - np.exp(alpha * ratio)) / (ratio * (1 - np.exp(alpha)))
+    if rie_max == rie_min:
+        return 1.0
+    return float((rie - rie_min) / (rie_max - rie_min))
+
+
+def evaluate_screening(information, score_column="score", affinity_column="Affinity[µM]",
+                       affinity_threshold=1., alpha=20., fractions=EF_FRACTIONS):
+    """
+    All screening metrics for a scored ligand table.
+
+    Parameters
+    ----------
+    information: pandas.DataFrame
+        The ligands with their docking scores and measured affinities (as the
+        ``information`` frame of the VirtualScreening notebook).
+    score_column: str
+        Column with the docking scores (lower is better).
+    affinity_column: str
+        Column with the measured affinities.
+    affinity_threshold: float
+        Ligands with an affinity (µM) below this value are active.
+    alpha: float
+        Early recognition parameter of BEDROC.
+    fractions: iterable of float
+        Fractions of the library for the enrichment factors.
+
+    Returns
+    -------
+    metrics: pandas.Series
+        Number of ligands and actives, AUC, BEDROC and one ``EF<percent>%``
+        entry per fraction. Ligands without a score are ignored.
+    """
+    scored = information[information[score_column].notna()]
+    actives = (scored[affinity_column] < affinity_threshold).to_numpy()
+    ranking = -scored[score_column].to_numpy(dtype=float)
+
+    fpr, tpr, _ = roc_points(actives, ranking)
+    metrics = {"n_ligands": len(scored), "n_actives": int(actives.sum()),
+               "auc": roc_auc(fpr, tpr), "bedroc": bedroc(actives, ranking, alpha=alpha)}
+    for fraction, factor in zip(fractions, enrichment_factors(actives, ranking, fractions)):
+        metrics[f"EF{fraction * 100:g}%"] = factor
+    return pd.Series(metrics)
+
+
+def _score_matrix(y_score):
+    y_score = np.asarray(y_score, dtype=float)
+    return y_score[np.newaxis] if y_score.ndim == 1 else y_score
+
+
+def _weighted_auc(labels, group_starts, weights):
+    """
+    Mann-Whitney AUC for many weightings of the same ranked ligands.
+
+    ``labels`` and the columns of ``weights`` (one row per resample) are
+    sorted by increasing score; ``group_starts`` are the first positions of
+    every group of equal scores. A bootstrap resample is a weighting in which
+    every ligand counts as often as it was drawn.
+    """
+    positives = np.add.reduceat(weights * labels, group_starts, axis=1)
+    negatives = np.add.reduceat(weights * ~labels, group_starts, axis=1)
+    # Negatives ranked below every group, ties count half
+    below = np.cumsum(negatives, axis=1) - negatives
+    wins = (positives * (below + 0.5 * negatives)).sum(axis=1)
+    return wins / (positives.sum(axis=1) * negatives.sum(axis=1))
+
+
+def bootstrap_auc(y_true, y_score, n_resamples=2000, random_seed=0, stratified=True,
+                  max_elements=2 ** 24):
+    """
+    AUCs of bootstrap resamples of a screening.
+
+    All resamples are drawn as one array of indices and converted to counts
+    per ligand; the AUCs of a whole block of resamples then follow from one
+    sort of the scores and cumulative sums, without calling ``roc_curve``.
+
+    Parameters
+    ----------
+    y_true: array-like of bool
+        True for actives.
+    y_score: array-like of float
+        Scores, higher values rank first. A 2D array (one row per protocol)
+        evaluates several protocols on the same resamples, so that their
+        differences are paired.
+    n_resamples: int
+        Number of bootstrap resamples.
+    random_seed: int
+        Seed of the random number generator.
+    stratified: bool
+        Resample actives and inactives separately, so that every resample
+        has the original number of actives.
+    max_elements: int
+        Upper limit for the size of the count array processed at once.
+
+    Returns
+    -------
+    aucs: numpy.ndarray
+        Shape (n_resamples,) or (n_resamples, n_protocols).
+    """
+    y_true = np.asarray(y_true, dtype=bool)
+    scores = _score_matrix(y_score)
+    n_total = len(y_true)
+    rng = np.random.default_rng(random_seed)
+    orders = [np.argsort(score, kind="mergesort") for score in scores]
+    groups = [np.r_[0, np.flatnonzero(np.diff(score[order])) + 1]
+              for score, order in zip(scores, orders)]
+
+    aucs = np.empty((n_resamples, len(scores)))
+    block = max(1, max_elements // n_total)
+    for start in range(0, n_resamples, block):
+        size = min(block, n_resamples - start)
+        if stratified:
+            actives = np.flatnonzero(y_true)
+            inactives = np.flatnonzero(~y_true)
+            indices = np.hstack([rng.choice(actives, (size, len(actives))),
+                                 rng.choice(inactives, (size, len(inactives)))])
+        else:
+            indices = rng.integers(0, n_total, (size, n_total))
+        # Offset every row so that one bincount gives the counts of all resamples
+        offsets = (np.arange(size) * n_total)[:, np.newaxis]
+        counts = np.bincount((indices + offsets).ravel(), minlength=size * n_total)
+        counts = counts.reshape(size, n_total).astype(float)
+        for k, (order, group_starts) in enumerate(zip(orders, groups)):
+            with np.errstate(invalid="ignore", divide="ignore"):
+                aucs[start:start + size, k] = _weighted_auc(y_true[order], group_starts,
+                                                            counts[:, order])
+    return aucs[:, 0] if np.ndim(y_score) == 1 else aucs
+
+
+def delong_auc(y_true, y_score):
+    """
+    AUCs and their covariance after DeLong et al. (1988).
+
+    Parameters
+    ----------
+    y_true: array-like of bool
+        True for actives.
+    y_score: array-like of float
+        Scores, higher values rank first, one row per protocol for 2D arrays.
+
+    Returns
+    -------
+    aucs: numpy.ndarray
+        AUC of every protocol.
+    covariance: numpy.ndarray
+        Covariance matrix of the AUCs (n_protocols x n_protocols).
+    """
+    y_true = np.asarray(y_true, dtype=bool)
+    scores = _score_matrix(y_score)
+    n_actives = y_true.sum()
+    n_inactives = len(y_true) - n_actives
+
+    # Structural components: for every active, the fraction of inactives it
+    # outranks, and for every inactive, the fraction of actives outranking it
+    v10 = np.empty((len(scores), n_actives))
+    v01 = np.empty((len(scores), n_inactives))
+    for k, score in enumerate(scores):
+        # Keep the ligand order, the components of different protocols are paired
+        actives = score[y_true]
+        inactives = score[~y_true]
+        sorted_actives = np.sort(actives)
+        sorted_inactives = np.sort(inactives)
+        below = (np.searchsorted(sorted_inactives, actives, "left")
+                 + np.searchsorted(sorted_inactives, actives, "right")) / 2
+        above = n_actives - (np.searchsorted(sorted_actives, inactives, "left")
+                             + np.searchsorted(sorted_actives, inactives, "right")) / 2
+        v10[k] = below / n_inactives
+        v01[k] = above / n_actives
+
+    aucs = v10.mean(axis=1)
+    covariance = (np.atleast_2d(np.cov(v10)) / n_actives
+                  + np.atleast_2d(np.cov(v01)) / n_inactives)
+    return aucs, covariance
+
+
+def auc_confidence_intervals(information, score_columns=("score",), affinity_column="Affinity[µM]",
+                             affinity_threshold=1., method="bootstrap", confidence=0.95,
+                             n_resamples=2000, random_seed=0):
+    """
+    AUC with confidence interval for one or more docking protocols.
+
+    Parameters
+    ----------
+    information: pandas.DataFrame
+        The ligands with their docking scores and measured affinities.
+    score_columns: iterable of str
+        Score columns (lower is better) of the protocols to compare. Only
+        ligands scored by all protocols are used.
+    affinity_column: str
+        Column with the measured affinities.
+    affinity_threshold: float
+        Ligands with an affinity (µM) below this value are active.
+    method: str
+        "bootstrap" (percentile intervals) or "delong" (normal approximation).
+    confidence: float
+        Confidence level of the intervals.
+    n_resamples: int
+        Number of bootstrap resamples.
+    random_seed: int
+        Seed of the bootstrap.
+
+    Returns
+    -------
+    report: pandas.DataFrame
+        One row per protocol with ``auc``, ``lower`` and ``upper``, and one
+        row per pair of protocols with their AUC difference and its
+        interval. For DeLong, pairs also get a two-sided ``p_value``.
+    """
+    score_columns = list(score_columns)
+    scored = information.dropna(subset=score_columns)
+    y_true = (scored[affinity_column] < affinity_threshold).to_numpy()
+    scores = -scored[score_columns].to_numpy(dtype=float).T
+    fpr_tpr = [roc_points(y_true, score)[:2] for score in scores]
+    aucs = np.array([roc_auc(fpr, tpr) for fpr, tpr in fpr_tpr])
+
+    tail = (1 - confidence) / 2
+    rows = []
+    pairs = [(i, j) for i in range(len(score_columns)) for j in range(i + 1, len(score_columns))]
+    if method == "bootstrap":
+        resampled = bootstrap_auc(y_true, scores, n_resamples=n_resamples, random_seed=random_seed)
+        for i, column in enumerate(score_columns):
+            lower, upper = np.nanquantile(resampled[:, i], [tail, 1 - tail])
+            rows.append({"protocol": column, "auc": aucs[i], "lower": lower, "upper": upper})
+        for i, j in pairs:
+            lower, upper = np.nanquantile(resampled[:, i] - resampled[:, j], [tail, 1 - tail])
+            rows.append({"protocol": f"{score_columns[i]} - {score_columns[j]}",
+                         "auc": aucs[i] - aucs[j], "lower": lower, "upper": upper})
+    elif method == "delong":
+        _, covariance = delong_auc(y_true, scores)
+        z = norm.ppf(1 - tail)
+        for i, column in enumerate(score_columns):
+            error = np.sqrt(covariance[i, i])
+            rows.append({"protocol": column, "auc": aucs[i],
+                         "lower": aucs[i] - z * error, "upper": aucs[i] + z * error})
+        for i, j in pairs:
+            difference = aucs[i] - aucs[j]
+            error = np.sqrt(covariance[i, i] + covariance[j, j] - 2 * covariance[i, j])
+            rows.append({"protocol": f"{score_columns[i]} - {score_columns[j]}",
+                         "auc": difference, "lower": difference - z * error,
+                         "upper": difference + z * error,
+                         "p_value": 2 * norm.sf(abs(difference) / error) if error > 0 else np.nan})
+    else:
+        raise ValueError(f"Unknown method {method!r}, use 'bootstrap' or 'delong'")
+    return pd.DataFrame(rows)
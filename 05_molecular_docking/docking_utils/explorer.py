@@ -0,0 +1,208 @@
+"""
+Static interactive score plots with 2D depictions of the ligands.
+
+``molplotly.add_molecules`` starts a Dash server that draws the molecule under
+the mouse pointer on every hover event. Here, all depictions are drawn in
+advance in a process pool and stored as SVG files named after the canonical
+SMILES, so they are drawn only once across plots and sessions. The plot is
+written as one HTML file with a WebGL scatter plot and plotly.js embedded; it
+opens in any browser, without a server or internet connection.
+
+With ``embed=True`` (default) the depictions are stored inside the HTML file.
+For very large libraries use ``embed=False``: the HTML file then only refers to
+the SVG files in ``cache_dir`` and stays small.
+
+Example
+-------
+>>> information["active"] = information['Affinity[µM]'] < 1.
+>>> write_explorer(information, 'output/explorer.html', x="Affinity[µM]", y="score",
+...                color="active")
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+from pathlib import Path
+
+import pandas as pd
+import plotly.express as px
+from rdkit import Chem
+from rdkit.Chem.Draw import rdMolDraw2D
+
+# Shows the depiction of the point under the mouse pointer in a fixed panel.
+# The ligand name is set as text, so that names with < or & are shown as they are.
+_HOVER_SCRIPT = """
+var plot = document.getElementById('{plot_id}');
+var panel = document.createElement('div');
+panel.style.cssText = 'position:fixed;top:10px;right:10px;background:white;' +
+    'border:1px solid #ccc;padding:4px;display:none;font-family:sans-serif;z-index:1000';
+var title = document.createElement('div');
+title.style.fontWeight = 'bold';
+var image = document.createElement('div');
+panel.appendChild(title);
+panel.appendChild(image);
+document.body.appendChild(panel);
+var depictions = DEPICTIONS;
+plot.on('plotly_hover', function(data) {
+    var point = data.points[0];
+    var key = point.customdata[0];
+    title.textContent = point.customdata[1];
+    if (key === null) {
+        // The SMILES could not be parsed, there is no depiction
+        image.innerHTML = '';
+    } else if (depictions === null) {
+        var img = document.createElement('img');
+        img.src = key;
+        image.innerHTML = '';
+        image.appendChild(img);
+    } else {
+        image.innerHTML = depictions[key] || '';
+    }
+    panel.style.display = 'block';
+});
+plot.on('plotly_unhover', function() { panel.style.display = 'none'; });
+"""
+
+
+def canonical_smiles(smiles):
+    """
+    Canonical SMILES of a molecule, or None if it cannot be parsed.
+    """
+    molecule = Chem.MolFromSmiles(smiles)
+    if molecule is None:
+        return None
+    return Chem.MolToSmiles(molecule)
+
+
+def depiction_file(smiles, cache_dir):
+    """
+    File name of the cached depiction of a canonical SMILES.
+    """
+    digest = hashlib.sha1(smiles.encode()).hexdigest()
+    return path.join(cache_dir, f"{digest}.svg")
+
+
+def _draw_depiction(task):
+    """
+    Draw one molecule as SVG inside a worker process.
+    """
+    smiles, output, width, height = task
+    drawer = rdMolDraw2D.MolDraw2DSVG(width, height)
+    rdMolDraw2D.PrepareAndDrawMolecule(drawer, Chem.MolFromSmiles(smiles))
+    drawer.FinishDrawing()
+    svg = drawer.GetDrawingText()
+    # Write to a temporary file first, so that an interrupted run leaves no broken files
+    temporary = f"{output}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        f.write(svg[svg.find("<svg"):])
+    os.replace(temporary, output)
+    return output
+
+
+def draw_depictions(smiles, cache_dir=path.join("output", "depictions"), width=250, height=200,
+                    n_workers=None, chunksize=64):
+    """
+    Draw 2D depictions of all molecules that are not cached yet.
+
+    Parameters
+    ----------
+    smiles: iterable of str
+        SMILES strings of the molecules.
+    cache_dir: str or pathlib.Path
+        Directory holding one SVG file per canonical SMILES.
+    width: int
+        Width of the depictions in pixels.
+    height: int
+        Height of the depictions in pixels.
+    n_workers: int or None
+        Number of worker processes. If None, all cores are used.
+    chunksize: int
+        Number of molecules per task.
+
+    Returns
+    -------
+    files: list of str or None
+        Depiction file of every molecule (None for invalid SMILES).
+    """
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    canonical = [canonical_smiles(smi) for smi in smiles]
+    files = [None if smi is None else depiction_file(smi, cache_dir) for smi in canonical]
+
+    # Duplicates and cached molecules are drawn only once
+    missing = {file: smi for smi, file in zip(canonical, files)
+               if file is not None and not path.exists(file)}
+    if missing:
+        tasks = [(smi, file, width, height) for file, smi in missing.items()]
+        with ProcessPoolExecutor(max_workers=n_workers or os.cpu_count()) as pool:
+            list(pool.map(_draw_depiction, tasks, chunksize=chunksize))
+    return files
+
+
+def write_explorer(information, output=path.join("output", "explorer.html"), x="Affinity[µM]",
+                   y="score", color=None, smiles_column="Smiles", title_column="Name",
+                   cache_dir=path.join("output", "depictions"), embed=True, n_workers=None,
+                   **kwargs):
+    """
+    Write a self-contained interactive scatter plot with ligand depictions.
+
+    Parameters
+    ----------
+    information: pandas.DataFrame
+        The ligands with the columns to plot and their SMILES.
+    output: str or pathlib.Path
+        HTML file to write.
+    x: str
+        Column shown on the x axis.
+    y: str
+        Column shown on the y axis.
+    color: str or None
+        Column used for coloring the points.
+    smiles_column: str
+        Column containing the SMILES strings.
+    title_column: str
+        Column shown above the depiction.
+    cache_dir: str or pathlib.Path
+        Directory of the depiction cache.
+    embed: bool
+        Store the depictions in the HTML file. Otherwise, the HTML file
+        refers to the files in ``cache_dir`` by relative path.
+    n_workers: int or None
+        Number of processes drawing depictions.
+    **kwargs
+        Further arguments for ``plotly.express.scatter`` (e.g. ``log_x=True``).
+
+    Returns
+    -------
+    fig: plotly.graph_objects.Figure
+        The figure written to ``output``.
+    """
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    files = draw_depictions(information[smiles_column], cache_dir=cache_dir, n_workers=n_workers)
+
+    if embed:
+        depictions = {}
+        for file in set(files) - {None}:
+            with open(file) as f:
+                depictions[path.basename(file)] = f.read()
+        keys = [None if file is None else path.basename(file) for file in files]
+    else:
+        depictions = None
+        html_dir = path.dirname(path.abspath(output))
+        keys = [None if file is None else Path(path.relpath(file, html_dir)).as_posix()
+                for file in files]
+
+    data = pd.DataFrame({x: information[x].to_numpy(), y: information[y].to_numpy(),
+                         "_depiction": keys, "_title": information[title_column].astype(str).to_numpy()})
+    if color is not None:
+        data[color] = information[color].astype(str).to_numpy()
+
+    fig = px.scatter(data, x=x, y=y, color=color, custom_data=["_depiction", "_title"],
+                     render_mode="webgl", **kwargs)
+    fig.update_traces(hovertemplate=f"%{{customdata[1]}}<br>{x}=%{{x}}<br>{y}=%{{y}}<extra></extra>")
+
+    # "</" would end the script element early
+    script = _HOVER_SCRIPT.replace("DEPICTIONS", json.dumps(depictions).replace("</", "<\\/"))
+    fig.write_html(output, include_plotlyjs=True, full_html=True, post_script=script)
+    return fig
@@ -0,0 +1,167 @@
+"""
+Property filters applied before docking.
+
+Ligands that are not drug-like do not need to be docked. The filters work on
+whole columns at once (as the Lipinski mask in ``09_numpy_arrays.py``) and
+report how many ligands each rule removes. Descriptors that are missing from
+the library are computed with RDKit first.
+
+Example
+-------
+>>> information = compute_descriptors(information)
+>>> passed, report = filter_ligands(information, rules=("Lipinski", "Veber"))
+>>> passed = dock_dataframe(passed, receptor)
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from rdkit import Chem
+from rdkit.Chem import Crippen, Descriptors, rdMolDescriptors
+
+# Allowed ranges (minimum, maximum) per descriptor, None means unbounded.
+# The column names are the ones used in input/ligands.csv.
+RULE_SETS = {
+    # Lipinski's Rule of 5: MW <= 500, logP <= 5, HBD <= 5, HBA <= 10
+    "Lipinski": {"MW": (None, 500), "logP": (None, 5), "HBD": (None, 5), "HBA": (None, 10)},
+    # Veber: rotatable bonds <= 10, polar surface area <= 140
+    "Veber": {"nrotb": (None, 10), "PSA": (None, 140)},
+}
+
+DESCRIPTORS = {
+    "MW": Descriptors.MolWt,
+    "logP": Crippen.MolLogP,
+    "nrotb": rdMolDescriptors.CalcNumRotatableBonds,
+    "HBA": rdMolDescriptors.CalcNumHBA,
+    "HBD": rdMolDescriptors.CalcNumHBD,
+    "PSA": rdMolDescriptors.CalcTPSA,
+    "n_atoms": lambda molecule: molecule.GetNumHeavyAtoms(),
+}
+
+
+def _descriptor_rows(task):
+    """
+    Compute descriptors for a chunk of SMILES inside a worker process.
+    """
+    smiles, columns = task
+    rows = np.full((len(smiles), len(columns)), np.nan)
+    for i, smi in enumerate(smiles):
+        molecule = Chem.MolFromSmiles(smi)
+        if molecule is None:
+            continue
+        for j, column in enumerate(columns):
+            rows[i, j] = DESCRIPTORS[column](molecule)
+    return rows
+
+
+def compute_descriptors(information, columns=None, smiles_column="Smiles",
+                        n_workers=None, chunksize=1000):
+    """
+    Fill in missing descriptor columns (or missing values) with RDKit.
+
+    Parameters
+    ----------
+    information: pandas.DataFrame
+        The ligands, with a column of SMILES strings.
+    columns: iterable of str or None
+        Descriptors to provide, see ``DESCRIPTORS``. If None, all are provided.
+    smiles_column: str
+        Column containing the SMILES strings.
+    n_workers: int or None
+        Number of worker processes. If None, all cores are used.
+    chunksize: int
+        Number of molecules per task.
+
+    Returns
+    -------
+    information: pandas.DataFrame
+        The same data frame with the descriptor columns filled in.
+    """
+    columns = list(DESCRIPTORS if columns is None else columns)
+    for column in columns:
+        if column not in information:
+            information[column] = np.nan
+
+    # Only molecules with at least one missing value need RDKit
+    missing = information[columns].isna().any(axis=1).to_numpy()
+    if not missing.any():
+        return information
+
+    smiles = list(information.loc[missing, smiles_column])
+    tasks = [(smiles[i:i + chunksize], columns) for i in range(0, len(smiles), chunksize)]
+    with ProcessPoolExecutor(max_workers=n_workers or os.cpu_count()) as pool:
+        computed = np.concatenate(list(pool.map(_descriptor_rows, tasks)))
+
+    values = information.loc[missing, columns].to_numpy(dtype=float)
+    values = np.where(np.isnan(values), computed, values)
+    information.loc[missing, columns] = values
+    return information
+
+
+def _rule_ranges(rule):
+    if isinstance(rule, str):
+        return RULE_SETS[rule]
+    return rule
+
+
+def filter_ligands(information, rules=("Lipinski",), max_violations=0, verbose=True):
+    """
+    Remove ligands that violate property rules.
+
+    Parameters
+    ----------
+    information: pandas.DataFrame
+        The ligands with their descriptor columns.
+    rules: iterable of str or dict, or dict of str to dict
+        Rule sets to apply. Either names from ``RULE_SETS`` or custom ranges
+        such as ``{"MW": (250, 450)}``. A dict maps rule names to ranges.
+    max_violations: int
+        Number of criteria of a rule set a ligand may violate and still pass
+        (e.g. 1 for the common reading of the Rule of 5).
+    verbose: bool
+        Print how many ligands each rule removes.
+
+    Returns
+    -------
+    passed: pandas.DataFrame
+        The ligands that pass all rule sets.
+    report: pandas.DataFrame
+        One row per criterion with the number of ligands violating it, and
+        one row per rule set with the number of ligands the rule set fails
+        and the number it removes after the previous rule sets were applied.
+    """
+    if isinstance(rules, dict):
+        named_rules = list(rules.items())
+    else:
+        named_rules = [(rule if isinstance(rule, str) else f"custom_{i}", rule)
+                       for i, rule in enumerate(rules)]
+
+    keep = np.ones(len(information), dtype=bool)
+    report = []
+    for rule_name, rule in named_rules:
+        violations = np.zeros(len(information), dtype=int)
+        for column, (minimum, maximum) in _rule_ranges(rule).items():
+            values = information[column].to_numpy(dtype=float)
+            violated = np.isnan(values)
+            if minimum is not None:
+                violated |= values < minimum
+            if maximum is not None:
+                violated |= values > maximum
+            violations += violated
+            report.append({"rule": rule_name, "criterion": column,
+                           "failed": int(violated.sum()), "removed": np.nan})
+
+        failed = violations > max_violations
+        report.append({"rule": rule_name, "criterion": "all",
+                       "failed": int(failed.sum()), "removed": int((failed & keep).sum())})
+        keep &= ~failed
+
+    report = pd.DataFrame(report)
+    report["removed"] = report["removed"].astype("Int64")
+    if verbose:
+        for row in report[report["criterion"] == "all"].itertuples():
+            print(f"{row.rule}: {row.failed} ligands fail, {row.removed} removed")
+        print(f"{keep.sum()} of {len(information)} ligands pass")
+    return information[keep], report
@@ -0,0 +1,362 @@
+"""
+Streaming ligand libraries that do not fit into memory.
+
+``pd.read_csv('input/ligands.csv')`` loads the whole library before the first
+ligand is docked. The functions below read CSV, SMILES and SDF libraries in
+batches of fixed size, pass each batch through preparation and docking, and
+append the results to a columnar output file (Parquet if ``pyarrow`` is
+installed, CSV otherwise). Only one batch is held in memory at any time.
+
+Example
+-------
+>>> screen_library('enamine.smi', receptor, output='output/results.parquet',
+...                batch_size=5000)
+>>> results = read_results('output/results.parquet')
+"""
+
+import os
+from os import path
+from pathlib import Path
+
+import pandas as pd
+from rdkit import Chem
+from tqdm.auto import tqdm
+
+from .filters import compute_descriptors, filter_ligands
+from .ligand_prep import prepare_ligands
+from .runner import DockingJob, dock_ligands, split_cores
+from .scores import read_sd_tags
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+def _library_format(source):
+    suffix = Path(source).suffix.lower()
+    if suffix in (".smi", ".smiles", ".ism"):
+        return "smi"
+    if suffix in (".sdf", ".sd"):
+        return "sdf"
+    return "csv"
+
+
+def _smiles_batches(source, batch_size):
+    names = []
+    smiles = []
+    with open(source) as f:
+        for number, line in enumerate(f):
+            fields = line.split()
+            if len(fields) == 0 or fields[0].startswith("#"):
+                continue
+            smiles.append(fields[0])
+            names.append(fields[1] if len(fields) > 1 else f"ligand_{number}")
+            if len(names) == batch_size:
+                yield pd.DataFrame({"Name": names, "Smiles": smiles})
+                names = []
+                smiles = []
+    if names:
+        yield pd.DataFrame({"Name": names, "Smiles": smiles})
+
+
+def _sdf_batches(source, batch_size, sd_tags=None):
+    columns = None if sd_tags is None else ["Name", "Smiles"] + list(sd_tags)
+    rows = []
+    for number, molecule in enumerate(Chem.ForwardSDMolSupplier(str(source))):
+        if molecule is None:
+            continue
+        row = molecule.GetPropsAsDict()
+        name = molecule.GetProp("_Name") if molecule.HasProp("_Name") else ""
+        row["Name"] = name.strip() or f"ligand_{number}"
+        row["Smiles"] = Chem.MolToSmiles(Chem.RemoveHs(molecule))
+        rows.append(row)
+        if len(rows) == batch_size:
+            batch = pd.DataFrame(rows)
+            # The records of later batches may carry other tags than the first one
+            columns = columns or ["Name", "Smiles"] + [column for column in batch if column not in ("Name", "Smiles")]
+            yield batch.reindex(columns=columns)
+            rows = []
+    if rows:
+        batch = pd.DataFrame(rows)
+        yield batch if columns is None else batch.reindex(columns=columns)
+
+
+def iter_ligand_batches(source, batch_size=10000, library_format=None, sd_tags=None):
+    """
+    Read a ligand library in batches.
+
+    Parameters
+    ----------
+    source: str or pathlib.Path
+        Library file. CSV files need the columns ``Name`` and ``Smiles``,
+        SMILES files contain one ``SMILES name`` pair per line and SDF files
+        may contain any number of records.
+    batch_size: int
+        Number of ligands per batch.
+    library_format: str or None
+        One of "csv", "smi" or "sdf". If None, it is guessed from the file
+        extension.
+    sd_tags: list of str or None
+        SD data tags read as columns from SDF libraries. If None, the tags
+        found in the first batch are used for all batches.
+
+    Yields
+    ------
+    batch: pandas.DataFrame
+        Up to ``batch_size`` ligands with (at least) the columns ``Name`` and
+        ``Smiles``.
+    """
+    library_format = library_format or _library_format(source)
+    if library_format == "smi":
+        yield from _smiles_batches(source, batch_size)
+    elif library_format == "sdf":
+        yield from _sdf_batches(source, batch_size, sd_tags=sd_tags)
+    else:
+        for batch in pd.read_csv(source, chunksize=batch_size, dtype={"Name": str}):
+            yield batch
+
+
+class ResultWriter:
+    """
+    Append result batches to one Parquet (or CSV) file.
+
+    The columns of the file are the columns of the first batch. Later batches
+    are aligned to them: missing columns are written empty and additional
+    columns are left out.
+
+    Parameters
+    ----------
+    output: str or pathlib.Path
+        Output file. Files ending with ``.parquet`` are written with pyarrow,
+        all others as CSV.
+    """
+
+    def __init__(self, output):
+        self.output = str(output)
+        self.parquet = self.output.endswith(".parquet")
+        if self.parquet and pq is None:
+            raise ImportError("Writing Parquet files requires pyarrow, use a .csv output instead")
+        Path(self.output).parent.mkdir(parents=True, exist_ok=True)
+        self._writer = None
+        self.columns = None
+        self.n_rows = 0
+
+    def write(self, batch):
+        """
+        Append a batch of results.
+
+        Parameters
+        ----------
+        batch: pandas.DataFrame
+            The results of one batch.
+        """
+        first = self.columns is None
+        if first:
+            self.columns = list(batch.columns)
+        else:
+            batch = batch.reindex(columns=self.columns)
+
+        if self.parquet:
+            if first:
+                table = pa.Table.from_pandas(batch, preserve_index=False)
+                self._writer = pq.ParquetWriter(self.output, table.schema)
+            else:
+                table = pa.Table.from_pandas(batch, schema=self._writer.schema, preserve_index=False)
+            self._writer.write_table(table)
+        else:
+            batch.to_csv(self.output, mode="w" if first else "a", header=first, index=False)
+        self.n_rows += len(batch)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_results(output, columns=None):
+    """
+    Read a result file written by :class:`ResultWriter`.
+
+    Parameters
+    ----------
+    output: str or pathlib.Path
+        The result file.
+    columns: list of str or None
+        Read only these columns (only the needed columns are loaded from
+        Parquet files).
+
+    Returns
+    -------
+    results: pandas.DataFrame
+        The results of all batches.
+    """
+    if str(output).endswith(".parquet"):
+        return pd.read_parquet(output, columns=columns)
+    return pd.read_csv(output, usecols=columns, dtype={"Name": str})
+
+
+def dock_batch(batch, protein, pocket_center=None, pocket_size=None, output_dir="output",
+               num_confs=1, num_poses=10, exhaustiveness=8, cpu_per_job=1, n_workers=None,
+               prepare_workers=1, cache=None):
+    """
+    Prepare and dock one batch of ligands.
+
+    Conformer generation and docking run at the same time: every prepared
+    ligand is handed to the docking pool right away. Conformer generation gets
+    its own ``prepare_workers`` processes, the docking pool the remaining cores.
+
+    Parameters
+    ----------
+    batch: pandas.DataFrame
+        Ligands with the columns ``Name`` and ``Smiles``.
+    protein: str or pathlib.Path or PreparedReceptor
+        Receptor to dock to.
+    pocket_center: iterable of float or int
+        Coordinates defining the center of the binding site.
+    pocket_size: iterable of float or int
+        Lengths of edges defining the binding site.
+    output_dir: str or pathlib.Path
+        Directory for prepared (``ligands``) and docked (``docked``) files.
+    num_confs: int
+        Number of conformers per ligand.
+    num_poses: int
+        Maximum number of poses to generate.
+    exhaustiveness: int
+        Accuracy of docking calculations.
+    cpu_per_job: int
+        Number of threads each smina process may use.
+    n_workers: int or None
+        Number of smina processes running at the same time. If None, the
+        cores not used for conformer generation are split according to
+        ``cpu_per_job``.
+    prepare_workers: int
+        Number of processes generating conformers while docking runs. Docking
+        takes much longer than conformer generation, so one process usually
+        keeps the docking pool busy.
+    cache: DockingCache or None
+        Docking result cache.
+
+    Returns
+    -------
+    batch: pandas.DataFrame
+        The batch with the columns ``input_sdf``, ``docked_sdf``, ``score``,
+        ``docking_time`` and ``error`` added.
+    """
+    ligand_dir = path.join(output_dir, "ligands")
+    docked_dir = path.join(output_dir, "docked")
+    Path(docked_dir).mkdir(parents=True, exist_ok=True)
+
+    names = [str(name) for name in batch["Name"]]
+    input_sdf = dict.fromkeys(names)
+    errors = dict.fromkeys(names, "")
+
+    def jobs():
+        for name, sdf_path, _, _ in prepare_ligands(names, batch["Smiles"], output_dir=ligand_dir,
+                                                    num_confs=num_confs, n_workers=prepare_workers):
+            input_sdf[name] = sdf_path
+            if sdf_path is None:
+                errors[name] = "conformer generation failed"
+                continue
+            yield DockingJob(name=name, ligand=sdf_path, output=path.join(docked_dir, f"{name}.sdf"))
+
+    if n_workers is None:
+        n_workers, cpu_per_job = split_cores(cpu_per_job, max(1, (os.cpu_count() or 1) - prepare_workers))
+    docked_sdf = dict.fromkeys(names)
+    scores = dict.fromkeys(names, float("nan"))
+    docking_time = dict.fromkeys(names, float("nan"))
+    results = dock_ligands(jobs(), protein, pocket_center, pocket_size, num_poses=num_poses,
+                           exhaustiveness=exhaustiveness, cpu_per_job=cpu_per_job,
+                           n_workers=n_workers, cache=cache)
+    for result in results:
+        docking_time[result.name] = result.elapsed
+        if result.error is not None:
+            errors[result.name] = result.error
+            continue
+        docked_sdf[result.name] = result.output
+        # Best score over the poses of all conformers
+        affinities = [float(affinity) for affinity in read_sd_tags(result.output)["minimizedAffinity"]
+                      if affinity is not None]
+        if affinities:
+            scores[result.name] = min(affinities)
+
+    batch = batch.copy()
+    batch["Name"] = names
+    batch["input_sdf"] = [input_sdf[name] or "" for name in names]
+    batch["docked_sdf"] = [docked_sdf[name] or "" for name in names]
+    batch["score"] = [scores[name] for name in names]
+    batch["docking_time"] = [docking_time[name] for name in names]
+    batch["error"] = [errors[name] for name in names]
+    return batch
+
+
+def screen_library(source, protein, pocket_center=None, pocket_size=None,
+                   output=path.join("output", "results.parquet"), batch_size=10000,
+                   library_format=None, output_dir="output", filter_rules=None,
+                   max_violations=0, sd_tags=None, **kwargs):
+    """
+    Dock a whole ligand library batch by batch and stream the results to disk.
+
+    Parameters
+    ----------
+    source: str or pathlib.Path
+        Library file (CSV, SMILES or SDF), see :func:`iter_ligand_batches`.
+    protein: str or pathlib.Path or PreparedReceptor
+        Receptor to dock to.
+    pocket_center: iterable of float or int
+        Coordinates defining the center of the binding site.
+    pocket_size: iterable of float or int
+        Lengths of edges defining the binding site.
+    output: str or pathlib.Path
+        Result file (``.parquet`` or ``.csv``).
+    batch_size: int
+        Number of ligands per batch.
+    library_format: str or None
+        Format of the library, guessed from the extension if None.
+    output_dir: str or pathlib.Path
+        Directory for prepared and docked files.
+    filter_rules: iterable or dict or None
+        Property rules applied to every batch before docking, see
+        :func:`docking_utils.filters.filter_ligands`. Ligands that fail are
+        not docked and not written to ``output``.
+    max_violations: int
+        Number of criteria of a rule set a ligand may violate.
+    sd_tags: list of str or None
+        SD data tags of an SDF library written to ``output``. If None, the
+        tags of the first batch are written.
+    **kwargs
+        Further settings handed to :func:`dock_batch`.
+
+    Returns
+    -------
+    n_ligands: int
+        Number of ligands written to ``output``.
+    """
+    removed = None
+    with ResultWriter(output) as writer:
+        batches = iter_ligand_batches(source, batch_size=batch_size, library_format=library_format,
+                                      sd_tags=sd_tags)
+        for batch in tqdm(batches, unit="batch"):
+            if filter_rules is not None:
+                batch = compute_descriptors(batch)
+                batch, report = filter_ligands(batch, filter_rules, max_violations=max_violations,
+                                               verbose=False)
+                counts = report[report["criterion"] == "all"].set_index("rule")["removed"]
+                removed = counts if removed is None else removed + counts
+                if len(batch) == 0:
+                    continue
+            writer.write(dock_batch(batch, protein, pocket_center, pocket_size,
+                                    output_dir=output_dir, **kwargs))
+
+    if removed is not None:
+        for rule, count in removed.items():
+            print(f"{rule}: {count} ligands removed")
+    return writer.n_rows
@@ -0,0 +1,188 @@
+"""
+Batch preparation of ligands from SMILES strings.
+
+The notebooks generate one conformer per ligand in a loop. For larger
+libraries, the ligands are distributed over a pool of worker processes and
+each worker embeds several conformers per molecule with RDKit's multithreaded
+ETKDG. The conformers of a ligand are written to one multi-record SDF file,
+which smina docks conformer by conformer.
+
+Example
+-------
+>>> from docking_utils import prepare_dataframe
+>>> information = prepare_dataframe(information, num_confs=3, minimize=True)
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+from pathlib import Path
+
+from rdkit import Chem
+from rdkit.Chem import AllChem
+from tqdm.auto import tqdm
+
+
+def generate_conformers(smiles, num_confs=1, num_threads=1, minimize=False,
+                        random_seed=0xf00d, sanitize=True):
+    """
+    Convert a SMILES string to one or more 3D conformations using ETKDG.
+
+    Parameters
+    ----------
+    smiles: str
+        SMILES string.
+    num_confs: int
+        Number of conformers to generate.
+    num_threads: int
+        Number of threads RDKit uses for embedding and minimization.
+        0 uses all available cores.
+    minimize: bool
+        Minimize the conformers with the MMFF94 force field.
+    random_seed: int
+        Seed for the embedding. A fixed seed makes the generated files
+        reproducible, which lets the docking cache recognize them.
+    sanitize: bool
+        Sanitize the molecule by fixing small errors.
+
+    Returns
+    -------
+    molecule: Chem.rdchem.Mol or None
+        The molecule with the generated conformers, or None if the SMILES
+        could not be parsed or no conformer could be embedded.
+    """
+    molecule = Chem.MolFromSmiles(smiles, sanitize=sanitize)
+    if molecule is None:
+        return None
+    molecule = Chem.AddHs(molecule)
+
+    # Initiate the ETKDG parameters of the third version
+    params = AllChem.ETKDGv3()
+    params.useSmallRingTorsions = True
+    params.randomSeed = random_seed
+    params.numThreads = num_threads
+
+    conformer_ids = AllChem.EmbedMultipleConfs(molecule, numConfs=num_confs, params=params)
+    if len(conformer_ids) == 0:
+        return None
+
+    if minimize and AllChem.MMFFHasAllMoleculeParams(molecule):
+        AllChem.MMFFOptimizeMoleculeConfs(molecule, numThreads=num_threads)
+    return molecule
+
+
+def save_sdf(m, target_path):
+    """
+    Saves all conformers of a RD-Kit molecule as one SDF file.
+
+    Parameters
+    ----------
+    m: Chem.rdchem.Mol
+        The molecule to save
+    target_path: str or pathlib.Path
+        Location where file is saved
+    """
+    with Chem.SDWriter(str(target_path)) as writer:
+        for conformer in m.GetConformers():
+            writer.write(m, confId=conformer.GetId())
+
+
+def _prepare_ligand(task):
+    """
+    Generate and save the conformers of a single ligand inside a worker process.
+    """
+    name, smiles, target_path, settings = task
+    start = time.perf_counter()
+    molecule = generate_conformers(smiles, **settings)
+    if molecule is None:
+        return name, None, 0, time.perf_counter() - start
+    save_sdf(molecule, target_path)
+    return name, target_path, molecule.GetNumConformers(), time.perf_counter() - start
+
+
+def prepare_ligands(names, smiles, output_dir=path.join('output', 'ligands'),
+                    num_confs=1, minimize=False, n_workers=None, threads_per_ligand=1,
+                    random_seed=0xf00d, chunksize=8):
+    """
+    Prepare many ligands in parallel and yield one result per ligand.
+
+    Parameters
+    ----------
+    names: iterable of str
+        Names of the ligands, used as file names.
+    smiles: iterable of str
+        SMILES strings of the ligands.
+    output_dir: str or pathlib.Path
+        Directory to which the SDF files are written.
+    num_confs: int
+        Number of conformers per ligand.
+    minimize: bool
+        Minimize the conformers with the MMFF94 force field.
+    n_workers: int or None
+        Number of worker processes. If None, the cores are split according
+        to ``threads_per_ligand``.
+    threads_per_ligand: int
+        Number of RDKit threads per ligand.
+    random_seed: int
+        Seed for the embedding.
+    chunksize: int
+        Number of ligands sent to a worker at once.
+
+    Yields
+    ------
+    name: str
+        Name of the ligand.
+    sdf_path: str or None
+        Path to the written SDF file, None if preparation failed.
+    num_confs: int
+        Number of conformers that were generated.
+    elapsed: float
+        Wall time of the preparation of this ligand in seconds.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // max(1, threads_per_ligand))
+
+    settings = {"num_confs": num_confs, "num_threads": threads_per_ligand,
+                "minimize": minimize, "random_seed": random_seed}
+    tasks = ((name, smi, path.join(output_dir, f"{name}.sdf"), settings)
+             for name, smi in zip(names, smiles))
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        yield from pool.map(_prepare_ligand, tasks, chunksize=chunksize)
+
+
+def prepare_dataframe(information, output_dir=path.join('output', 'ligands'),
+                      smiles_column="Smiles", **kwargs):
+    """
+    Prepare all ligands of the VirtualScreening data frame.
+
+    Parameters
+    ----------
+    information: pandas.DataFrame
+        The ligands to prepare, with the columns ``Name`` and ``Smiles``.
+    output_dir: str or pathlib.Path
+        Directory to which the SDF files are written.
+    smiles_column: str
+        Column containing the SMILES strings.
+    **kwargs
+        Further settings handed to :func:`prepare_ligands`.
+
+    Returns
+    -------
+    information: pandas.DataFrame
+        The same data frame with the columns ``input_sdf`` (None for failed
+        ligands) and ``n_conformers`` filled in.
+    """
+    results = prepare_ligands(information["Name"], information[smiles_column],
+                              output_dir=output_dir, **kwargs)
+    sdf_paths = []
+    n_conformers = []
+    for _, sdf_path, num_confs, _ in tqdm(results, total=len(information)):
+        sdf_paths.append(sdf_path)
+        n_conformers.append(num_confs)
+
+    information["input_sdf"] = sdf_paths
+    information["n_conformers"] = n_conformers
+    return information
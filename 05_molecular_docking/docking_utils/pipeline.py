@@ -0,0 +1,291 @@
+"""
+Resumable virtual screening pipeline.
+
+The stages of the VirtualScreening notebook (loading the ligands, conformer
+generation, docking, score extraction and writing ``output/stats.csv``) are run
+as separate steps. A small SQLite database (the job ledger) records for every
+ligand and stage whether it is done, how long it took and where its output is.
+If the run is interrupted, starting it again skips all finished work and only
+repeats ligands that failed or were still running.
+
+Example
+-------
+>>> pipeline = ScreeningPipeline('input/ligands.csv', protein_path,
+...                              pocket_center, pocket_size)
+>>> information = pipeline.run()
+>>> pipeline.ledger.summary()
+"""
+
+import sqlite3
+import time
+from os import path
+from pathlib import Path
+
+import pandas as pd
+
+from .ligand_prep import prepare_ligands
+from .runner import DockingJob, dock_ligands
+from .scores import collect_scores
+
+DONE = "done"
+FAILED = "failed"
+RUNNING = "running"
+
+
+class JobLedger:
+    """
+    SQLite record of the status of every ligand in every pipeline stage.
+
+    Parameters
+    ----------
+    db_path: str or pathlib.Path
+        Location of the SQLite database. It is created if it does not exist.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                       name TEXT NOT NULL,
+                       stage TEXT NOT NULL,
+                       status TEXT NOT NULL,
+                       attempts INTEGER NOT NULL DEFAULT 0,
+                       started REAL,
+                       finished REAL,
+                       elapsed REAL,
+                       output TEXT,
+                       value REAL,
+                       error TEXT,
+                       PRIMARY KEY (name, stage))""")
+
+    def start(self, names, stage):
+        """
+        Mark ligands as running in a stage and count the attempt.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                """INSERT INTO jobs (name, stage, status, attempts, started)
+                   VALUES (?, ?, ?, 1, ?)
+                   ON CONFLICT (name, stage) DO UPDATE SET
+                       status = excluded.status, attempts = attempts + 1,
+                       started = excluded.started, finished = NULL, error = NULL""",
+                [(str(name), stage, RUNNING, now) for name in names])
+
+    def finish(self, name, stage, output=None, value=None, elapsed=None):
+        """
+        Mark a ligand as done in a stage.
+        """
+        self._close_job(name, stage, DONE, output=output, value=value, elapsed=elapsed)
+
+    def fail(self, name, stage, error, elapsed=None):
+        """
+        Mark a ligand as failed in a stage.
+        """
+        self._close_job(name, stage, FAILED, error=str(error), elapsed=elapsed)
+
+    def _close_job(self, name, stage, status, output=None, value=None, error=None, elapsed=None):
+        now = time.time()
+        with self.connection:
+            self.connection.execute(
+                """UPDATE jobs SET status = ?, finished = ?, output = ?, value = ?, error = ?,
+                       elapsed = COALESCE(?, ? - started)
+                   WHERE name = ? AND stage = ?""",
+                (status, now, output, value, error, elapsed, now, str(name), stage))
+
+    def completed(self, stage):
+        """
+        Outputs of all ligands that are done in a stage.
+
+        Returns
+        -------
+        outputs: dict of str to tuple
+            ``(output, value)`` for every finished ligand.
+        """
+        rows = self.connection.execute(
+            "SELECT name, output, value FROM jobs WHERE stage = ? AND status = ?", (stage, DONE))
+        return {name: (output, value) for name, output, value in rows}
+
+    def todo(self, names, stage):
+        """
+        Ligands of ``names`` that are not yet done in a stage.
+        """
+        completed = self.completed(stage)
+        return [name for name in names if str(name) not in completed]
+
+    def jobs(self, stage=None):
+        """
+        The full ledger (or the rows of one stage) as data frame.
+        """
+        query = "SELECT * FROM jobs"
+        parameters = ()
+        if stage is not None:
+            query += " WHERE stage = ?"
+            parameters = (stage,)
+        return pd.read_sql_query(query, self.connection, params=parameters)
+
+    def summary(self):
+        """
+        Number of ligands per stage and status.
+        """
+        return pd.read_sql_query(
+            "SELECT stage, status, COUNT(*) AS n, SUM(elapsed) AS total_time "
+            "FROM jobs GROUP BY stage, status ORDER BY stage, status", self.connection)
+
+    def close(self):
+        self.connection.close()
+
+
+class ScreeningPipeline:
+    """
+    Virtual screening split into resumable stages.
+
+    Parameters
+    ----------
+    ligand_file: str or pathlib.Path
+        CSV file with the columns ``Name`` and ``Smiles`` (as ``input/ligands.csv``).
+    protein: str or pathlib.Path or PreparedReceptor
+        Receptor to dock to.
+    pocket_center: iterable of float or int
+        Coordinates defining the center of the binding site.
+    pocket_size: iterable of float or int
+        Lengths of edges defining the binding site.
+    output_dir: str or pathlib.Path
+        Directory for all outputs, including the ledger ``ledger.sqlite``.
+    num_confs: int
+        Number of conformers per ligand.
+    num_poses: int
+        Maximum number of poses to generate.
+    exhaustiveness: int
+        Accuracy of docking calculations.
+    cpu_per_job: int
+        Number of threads each smina process may use.
+    n_workers: int or None
+        Number of smina processes running at the same time.
+    cache: DockingCache or None
+        Docking result cache.
+    """
+
+    def __init__(self, ligand_file, protein, pocket_center=None, pocket_size=None,
+                 output_dir="output", num_confs=1, num_poses=10, exhaustiveness=8,
+                 cpu_per_job=1, n_workers=None, cache=None):
+        self.ligand_file = ligand_file
+        self.protein = protein
+        self.pocket_center = pocket_center
+        self.pocket_size = pocket_size
+        self.output_dir = output_dir
+        self.num_confs = num_confs
+        self.num_poses = num_poses
+        self.exhaustiveness = exhaustiveness
+        self.cpu_per_job = cpu_per_job
+        self.n_workers = n_workers
+        self.cache = cache
+
+        self.ligand_dir = path.join(output_dir, "ligands")
+        self.docked_dir = path.join(output_dir, "docked")
+        self.stats_file = path.join(output_dir, "stats.csv")
+        for directory in (self.ligand_dir, self.docked_dir):
+            Path(directory).mkdir(parents=True, exist_ok=True)
+        self.ledger = JobLedger(path.join(output_dir, "ledger.sqlite"))
+
+    def run(self):
+        """
+        Run all stages, skipping work that is already done.
+
+        Returns
+        -------
+        information: pandas.DataFrame
+            The ligands with their file paths and docking scores.
+        """
+        information = self.load()
+        self.prepare(information)
+        self.dock(information)
+        self.score(information)
+        return self.write_stats(information)
+
+    def load(self):
+        """
+        Read the ligand library.
+        """
+        start = time.perf_counter()
+        self.ledger.start(["library"], "load")
+        information = pd.read_csv(self.ligand_file, dtype={"Name": str})
+        self.ledger.finish("library", "load", output=str(self.ligand_file),
+                           value=len(information), elapsed=time.perf_counter() - start)
+        return information
+
+    def prepare(self, information):
+        """
+        Generate the conformers of all ligands that are not prepared yet.
+        """
+        smiles = dict(zip(information["Name"], information["Smiles"]))
+        names = self.ledger.todo(information["Name"], "prepare")
+        self.ledger.start(names, "prepare")
+        results = prepare_ligands(names, [smiles[name] for name in names],
+                                  output_dir=self.ligand_dir, num_confs=self.num_confs)
+        for name, sdf_path, num_confs, elapsed in results:
+            if sdf_path is None:
+                self.ledger.fail(name, "prepare", "conformer generation failed", elapsed=elapsed)
+            else:
+                self.ledger.finish(name, "prepare", output=sdf_path, value=num_confs, elapsed=elapsed)
+
+    def dock(self, information):
+        """
+        Dock all prepared ligands that are not docked yet.
+        """
+        prepared = self.ledger.completed("prepare")
+        names = self.ledger.todo([name for name in information["Name"] if name in prepared], "dock")
+        self.ledger.start(names, "dock")
+        jobs = (DockingJob(name=name, ligand=prepared[name][0],
+                           output=path.join(self.docked_dir, f"{name}.sdf"))
+                for name in names)
+        results = dock_ligands(jobs, self.protein, self.pocket_center, self.pocket_size,
+                               num_poses=self.num_poses, exhaustiveness=self.exhaustiveness,
+                               cpu_per_job=self.cpu_per_job, n_workers=self.n_workers,
+                               cache=self.cache)
+        for result in results:
+            if result.error is None:
+                self.ledger.finish(result.name, "dock", output=result.output, elapsed=result.elapsed)
+            else:
+                self.ledger.fail(result.name, "dock", result.error, elapsed=result.elapsed)
+
+    def score(self, information):
+        """
+        Read the best docking score (over all poses) of all docked ligands that are not scored yet.
+        """
+        docked = self.ledger.completed("dock")
+        names = self.ledger.todo([name for name in information["Name"] if name in docked], "score")
+        self.ledger.start(names, "score")
+        files = {docked[name][0]: name for name in names}
+
+        scores = collect_scores(list(files))
+        # Every conformer has its own poses, so the first pose is not necessarily the best
+        best = scores.groupby("file")["minimizedAffinity"].min()
+        for docked_sdf, name in files.items():
+            if docked_sdf in best.index and pd.notna(best[docked_sdf]):
+                self.ledger.finish(name, "score", output=docked_sdf, value=float(best[docked_sdf]))
+            else:
+                self.ledger.fail(name, "score", "no minimizedAffinity found")
+
+    def write_stats(self, information):
+        """
+        Collect the results of all stages and write them to ``stats.csv``.
+        """
+        self.ledger.start(["library"], "stats")
+        prepared = self.ledger.completed("prepare")
+        docked = self.ledger.completed("dock")
+        scored = self.ledger.completed("score")
+
+        information["input_sdf"] = [prepared.get(name, (None, None))[0] for name in information["Name"]]
+        information["docked_sdf"] = [docked.get(name, (None, None))[0] for name in information["Name"]]
+        information["score"] = [scored.get(name, (None, None))[1] for name in information["Name"]]
+        information["score"] = information["score"].astype(float)
+
+        # Before saving the final dataframe, let's sort the rows according to the docking score
+        information.sort_values("score", inplace=True)
+        information.to_csv(self.stats_file)
+        self.ledger.finish("library", "stats", output=self.stats_file, value=information["score"].notna().sum())
+        return information
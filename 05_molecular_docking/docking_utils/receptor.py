@@ -0,0 +1,196 @@
+"""
+One-time receptor preparation for screening many ligands into the same pocket.
+
+For every ligand, smina reads the receptor PDB file, converts and types all
+atoms and builds its scoring grids for the binding box. Smina cannot store these
+grids between runs, but most of the fixed cost can still be paid only once:
+
+* only residues close to the box contribute to the scoring grids, so the
+  receptor is trimmed to the box plus a margin,
+* the trimmed receptor is converted to PDBQT once, so smina does not have to
+  convert and type the full PDB file for every ligand,
+* the box is stored next to the receptor in a Vina/smina config file, which
+  is handed to smina with ``--config``.
+
+Example
+-------
+>>> receptor = prepare_receptor(protein_path, pocket_center, pocket_size)
+>>> information = dock_dataframe(information, receptor)
+"""
+
+from dataclasses import dataclass
+from os import path
+from pathlib import Path
+
+import numpy as np
+from openbabel import pybel
+
+
+@dataclass
+class PreparedReceptor:
+    """
+    A receptor file prepared for docking together with its binding box.
+
+    Parameters
+    ----------
+    receptor: str
+        Path to the prepared receptor file (pdbqt or pdb).
+    config: str
+        Path to the smina config file with the box definition, which is
+        passed to smina with ``--config``.
+    center: list of float
+        Coordinates defining the center of the binding site, as in ``config``.
+    size: list of float
+        Lengths of edges defining the binding site, as in ``config``.
+    """
+    receptor: str
+    config: str
+    center: list
+    size: list
+
+    @classmethod
+    def load(cls, directory, name="receptor"):
+        """
+        Load a receptor previously written by :func:`prepare_receptor`.
+        """
+        config = path.join(directory, f"{name}_box.txt")
+        receptor = path.join(directory, f"{name}.pdbqt")
+        if not path.exists(receptor):
+            receptor = path.join(directory, f"{name}.pdb")
+        center, size = read_box_config(config)
+        return cls(receptor=receptor, config=config, center=center, size=size)
+
+
+def write_box_config(pocket_center, pocket_size, config_path):
+    """
+    Write the binding box as smina/Vina config file (usable with ``--config``).
+
+    Parameters
+    ----------
+    pocket_center: iterable of float or int
+        Coordinates defining the center of the binding site.
+    pocket_size: iterable of float or int
+        Lengths of edges defining the binding site.
+    config_path: str or pathlib.Path
+        Location where the config file is saved.
+    """
+    with open(config_path, "w") as f:
+        for axis, value in zip("xyz", pocket_center):
+            f.write(f"center_{axis} = {float(value)}\n")
+        for axis, value in zip("xyz", pocket_size):
+            f.write(f"size_{axis} = {float(value)}\n")
+
+
+def read_box_config(config_path):
+    """
+    Read the binding box from a smina/Vina config file.
+
+    Returns
+    -------
+    pocket_center: list of float
+        Coordinates defining the center of the binding site.
+    pocket_size: list of float
+        Lengths of edges defining the binding site.
+    """
+    values = {}
+    with open(config_path) as f:
+        for line in f:
+            if "=" in line:
+                key, value = line.split("=", 1)
+                values[key.strip()] = float(value)
+    pocket_center = [values[f"center_{axis}"] for axis in "xyz"]
+    pocket_size = [values[f"size_{axis}"] for axis in "xyz"]
+    return pocket_center, pocket_size
+
+
+def trim_receptor(protein, pocket_center, pocket_size, margin=8.0):
+    """
+    Keep only the residues of a PDB file that are close to the binding box.
+
+    A residue is kept if any of its atoms lies within the box enlarged by
+    ``margin`` in every direction. The default of 8 Angstrom is the distance
+    cutoff of the smina scoring function.
+
+    Parameters
+    ----------
+    protein: str or pathlib.Path
+        Path to the receptor PDB file.
+    pocket_center: iterable of float or int
+        Coordinates defining the center of the binding site.
+    pocket_size: iterable of float or int
+        Lengths of edges defining the binding site.
+    margin: float
+        Distance (Angstrom) around the box within which residues are kept.
+
+    Returns
+    -------
+    lines: list of str
+        The ATOM/HETATM records of the kept residues, followed by END.
+    """
+    with open(protein) as f:
+        records = [line for line in f if line.startswith(("ATOM", "HETATM"))]
+
+    coordinates = np.array([[float(line[30:38]), float(line[38:46]), float(line[46:54])]
+                            for line in records])
+    lower = np.asarray(pocket_center, dtype=float) - np.asarray(pocket_size, dtype=float) / 2 - margin
+    upper = np.asarray(pocket_center, dtype=float) + np.asarray(pocket_size, dtype=float) / 2 + margin
+    close = np.all((coordinates >= lower) & (coordinates <= upper), axis=1)
+
+    # Residues are identified by residue name, chain, number and insertion code
+    residues = [line[17:27] for line in records]
+    kept_residues = {residue for residue, is_close in zip(residues, close) if is_close}
+    lines = [line for line, residue in zip(records, residues) if residue in kept_residues]
+    return lines + ["END\n"]
+
+
+def prepare_receptor(protein, pocket_center, pocket_size, output_dir=path.join('output', 'receptor'),
+                     name="receptor", margin=8.0, pdbqt=True):
+    """
+    Trim, convert and store a receptor and its box for repeated docking.
+
+    Parameters
+    ----------
+    protein: str or pathlib.Path
+        Path to the receptor PDB file.
+    pocket_center: iterable of float or int
+        Coordinates defining the center of the binding site.
+    pocket_size: iterable of float or int
+        Lengths of edges defining the binding site.
+    output_dir: str or pathlib.Path
+        Directory to which the prepared files are written.
+    name: str
+        Base name of the prepared files.
+    margin: float
+        Distance (Angstrom) around the box within which residues are kept.
+        Use None to keep the whole receptor.
+    pdbqt: bool
+        Convert the receptor to PDBQT with OpenBabel.
+
+    Returns
+    -------
+    receptor: PreparedReceptor
+        Paths to the prepared receptor and box config file.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    pdb_path = path.join(output_dir, f"{name}.pdb")
+    if margin is None:
+        with open(protein) as f:
+            lines = [line for line in f if line.startswith(("ATOM", "HETATM", "END"))]
+    else:
+        lines = trim_receptor(protein, pocket_center, pocket_size, margin=margin)
+    with open(pdb_path, "w") as f:
+        f.writelines(lines)
+
+    receptor_path = pdb_path
+    if pdbqt:
+        receptor_path = path.join(output_dir, f"{name}.pdbqt")
+        molecule = next(pybel.readfile("pdb", pdb_path))
+        # "r" writes the receptor as rigid molecule without torsion tree
+        molecule.write("pdbqt", receptor_path, overwrite=True, opt={"r": None})
+
+    config_path = path.join(output_dir, f"{name}_box.txt")
+    write_box_config(pocket_center, pocket_size, config_path)
+    return PreparedReceptor(receptor=receptor_path, config=config_path,
+                            center=[float(x) for x in pocket_center],
+                            size=[float(x) for x in pocket_size])
@@ -0,0 +1,208 @@
+"""
+Symmetry-aware RMSD of docking poses, computed for all poses at once.
+
+``AllChem.CalcRMS`` repeats the substructure matching and the enumeration of
+symmetry-equivalent atom mappings for every single pose. All poses of one
+docking run share the same atoms, so here the mappings are computed once per
+ligand and the RMSD of all poses is evaluated as one NumPy operation on the
+stacked coordinates. As with ``CalcRMS``, the poses are not aligned to the
+reference and hydrogens are ignored.
+
+Example
+-------
+>>> from docking_utils import load_poses, rmsd_matrix
+>>> poses = load_poses(docked_ligand)
+>>> reference = Chem.MolFromMolFile(reference_file, removeHs=True)
+>>> rmsd_matrix(poses, [reference])[:, 0]
+"""
+
+from os import path
+
+import numpy as np
+import pandas as pd
+from rdkit import Chem
+
+
+def load_poses(sdf_path, sanitize=True):
+    """
+    Load all poses of a docking output without hydrogens.
+
+    Parameters
+    ----------
+    sdf_path: str or pathlib.Path
+        SDF file containing docking output.
+    sanitize: bool
+        Sanitize the molecules while reading.
+
+    Returns
+    -------
+    poses: list of Chem.rdchem.Mol
+        The poses that could be read.
+    """
+    supplier = Chem.SDMolSupplier(str(sdf_path), sanitize=sanitize, removeHs=False)
+    return [Chem.RemoveHs(pose, sanitize=False) for pose in supplier if pose is not None]
+
+
+def stack_coordinates(poses):
+    """
+    Stack the heavy atom coordinates of poses into one array.
+
+    Parameters
+    ----------
+    poses: list of Chem.rdchem.Mol
+        Poses of the same ligand with identical atom order.
+
+    Returns
+    -------
+    coordinates: numpy.ndarray
+        Array of shape (n_poses, n_atoms, 3).
+    """
+    return np.stack([pose.GetConformer().GetPositions() for pose in poses])
+
+
+_TERMINAL_GROUP = Chem.MolFromSmarts("[O,N,S;D1]~[*]~[O,N,S;D1]")
+
+
+def _symmetrize_terminal_groups(mol):
+    """
+    Copy of ``mol`` in which conjugated terminal groups such as carboxylates
+    and nitro groups have equivalent bonds, so that both terminal atoms can be
+    swapped in the atom mappings (as done by ``CalcRMS``).
+    """
+    mol = Chem.RWMol(mol)
+    for terminal_a, center, terminal_b in mol.GetSubstructMatches(_TERMINAL_GROUP):
+        atom_a = mol.GetAtomWithIdx(terminal_a)
+        atom_b = mol.GetAtomWithIdx(terminal_b)
+        if atom_a.GetAtomicNum() != atom_b.GetAtomicNum():
+            continue
+        for terminal in (atom_a, atom_b):
+            terminal.SetFormalCharge(0)
+            terminal.SetNoImplicit(True)
+            mol.GetBondBetweenAtoms(terminal.GetIdx(), center).SetBondType(Chem.BondType.SINGLE)
+    return mol
+
+
+def atom_mappings(probe, reference, max_matches=10000):
+    """
+    Enumerate all symmetry-equivalent mappings of reference atoms onto probe atoms.
+
+    Parameters
+    ----------
+    probe: Chem.rdchem.Mol
+        Molecule whose atoms are mapped (e.g. a docking pose).
+    reference: Chem.rdchem.Mol
+        Molecule used as substructure query (e.g. the crystal ligand).
+    max_matches: int
+        Maximal number of mappings to enumerate.
+
+    Returns
+    -------
+    mappings: numpy.ndarray
+        Integer array of shape (n_mappings, n_reference_atoms). Row k maps
+        reference atom i to probe atom ``mappings[k, i]``.
+    """
+    matches = _symmetrize_terminal_groups(probe).GetSubstructMatches(
+        _symmetrize_terminal_groups(reference), uniquify=False, useChirality=False,
+        maxMatches=max_matches)
+    if len(matches) == 0:
+        raise ValueError("No sub-structure match found between the reference and probe mol")
+    return np.array(matches, dtype=int)
+
+
+def rmsd_matrix(poses, references, max_matches=10000):
+    """
+    RMSD between every pose and every reference.
+
+    Parameters
+    ----------
+    poses: list of Chem.rdchem.Mol
+        Poses of the same ligand with identical atom order.
+    references: list of Chem.rdchem.Mol
+        Reference structures, e.g. co-crystallized ligands.
+    max_matches: int
+        Maximal number of symmetry-equivalent mappings per reference.
+
+    Returns
+    -------
+    rmsd: numpy.ndarray
+        Array of shape (n_poses, n_references), in Angstrom.
+    """
+    coordinates = stack_coordinates(poses)
+    template = poses[0]
+    rmsd = np.empty((len(poses), len(references)))
+
+    for j, reference in enumerate(references):
+        reference = Chem.RemoveHs(reference, sanitize=False)
+        mappings = atom_mappings(template, reference, max_matches=max_matches)
+        reference_coordinates = reference.GetConformer().GetPositions()
+
+        # (n_poses, n_mappings, n_atoms, 3) -> mean squared deviation per mapping
+        deviation = coordinates[:, mappings, :] - reference_coordinates
+        msd = np.einsum("pkij,pkij->pk", deviation, deviation) / mappings.shape[1]
+        rmsd[:, j] = np.sqrt(msd.min(axis=1))
+    return rmsd
+
+
+def pose_pair_rmsd(poses, max_matches=10000):
+    """
+    Symmetry-corrected RMSD between all pairs of poses.
+
+    Parameters
+    ----------
+    poses: list of Chem.rdchem.Mol
+        Poses of the same ligand with identical atom order.
+    max_matches: int
+        Maximal number of symmetry-equivalent mappings.
+
+    Returns
+    -------
+    rmsd: numpy.ndarray
+        Symmetric array of shape (n_poses, n_poses), in Angstrom.
+    """
+    coordinates = stack_coordinates(poses)
+    n_poses, n_atoms, _ = coordinates.shape
+    automorphisms = atom_mappings(poses[0], poses[0], max_matches=max_matches)
+
+    flat = coordinates.reshape(n_poses, -1)
+    squared_norms = np.einsum("pi,pi->p", flat, flat)
+    msd = np.full((n_poses, n_poses), np.inf)
+    for permutation in automorphisms:
+        permuted = coordinates[:, permutation, :].reshape(n_poses, -1)
+        # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b for all pairs at once
+        squared = squared_norms[:, None] + squared_norms[None, :] - 2 * permuted @ flat.T
+        np.minimum(msd, squared / n_atoms, out=msd)
+
+    rmsd = np.sqrt(np.clip(msd, 0, None))
+    rmsd = np.minimum(rmsd, rmsd.T)
+    np.fill_diagonal(rmsd, 0.0)
+    return rmsd
+
+
+def cross_docking_rmsd(docked_files, reference_files, reference_dir=path.join("input", "cross-docking")):
+    """
+    RMSD of all poses of several docked ligands to their reference structures.
+
+    Parameters
+    ----------
+    docked_files: dict of str to str
+        Docking output file of each ligand.
+    reference_files: dict of str to str
+        Reference file name of each ligand (as ``ligands_references`` in the
+        MolecularDocking notebook).
+    reference_dir: str or pathlib.Path
+        Directory containing the reference files.
+
+    Returns
+    -------
+    rmsd: pandas.DataFrame
+        One row per pose with the columns ``ligand``, ``pose`` and ``rmsd``.
+    """
+    tables = []
+    for ligand_name, docked_file in docked_files.items():
+        reference = Chem.MolFromMolFile(path.join(reference_dir, reference_files[ligand_name]), removeHs=True)
+        poses = load_poses(docked_file)
+        values = rmsd_matrix(poses, [reference])[:, 0]
+        tables.append(pd.DataFrame({"ligand": ligand_name,
+                                    "pose": np.arange(1, len(poses) + 1),
+                                    "rmsd": values}))
+    return pd.concat(tables, ignore_index=True)
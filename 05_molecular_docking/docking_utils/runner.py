@@ -0,0 +1,266 @@
+"""
+Parallel docking of a whole ligand library.
+
+Docking the ligands one after another (as in the VirtualScreening notebook)
+keeps only a single smina process busy. Here, the ligands are distributed over
+a pool of worker processes. Each worker runs one smina job at a time with a
+fixed number of threads (``--cpu``), so that all cores of the machine are used.
+
+Example
+-------
+>>> from docking_utils import dock_dataframe
+>>> information = dock_dataframe(information, protein_path, pocket_center,
+...                              pocket_size, cpu_per_job=2)
+"""
+
+import os
+import subprocess
+import time
+from collections.abc import Hashable
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from os import path
+from pathlib import Path
+
+from tqdm.auto import tqdm
+
+from .receptor import PreparedReceptor
+from .smina import run_smina
+
+
+@dataclass
+class DockingJob:
+    """
+    A single ligand to dock.
+
+    Parameters
+    ----------
+    name: hashable
+        Label identifying the ligand and its result, e.g. the name or the
+        data frame index label (``dock_dataframe`` uses the index).
+    ligand: str
+        Path to the prepared ligand file.
+    output: str
+        Path to which the docking poses are written.
+    log: str or None
+        Path to which the smina log is written.
+    ligand_key: str or None
+        Identifier of the ligand for the docking cache (see ``DockingCache.key``).
+    """
+    name: Hashable
+    ligand: str
+    output: str
+    log: str = None
+    ligand_key: str = None
+
+
+@dataclass
+class DockingResult:
+    """
+    Outcome of a single docking job.
+
+    Parameters
+    ----------
+    name: hashable
+        Label of the docked ligand, as given in its DockingJob.
+    output: str or None
+        Path to the docked poses, None if docking failed.
+    log_text: str
+        The output of the smina calculation.
+    elapsed: float
+        Wall time of the docking run in seconds.
+    error: str or None
+        Error message if docking failed.
+    """
+    name: Hashable
+    output: str = None
+    log_text: str = ""
+    elapsed: float = 0.0
+    error: str = None
+
+
+def split_cores(cpu_per_job=1, n_cores=None):
+    """
+    Split the available cores into worker processes and smina threads.
+
+    Parameters
+    ----------
+    cpu_per_job: int
+        Number of threads each smina process may use (``--cpu``).
+    n_cores: int or None
+        Number of cores to use in total. If None, all cores are used.
+
+    Returns
+    -------
+    n_workers: int
+        Number of smina processes running at the same time.
+    cpu_per_job: int
+        Number of threads per smina process.
+    """
+    if n_cores is None:
+        n_cores = os.cpu_count() or 1
+    cpu_per_job = max(1, min(cpu_per_job, n_cores))
+    n_workers = max(1, n_cores // cpu_per_job)
+    return n_workers, cpu_per_job
+
+
+def _dock_job(job, settings, cache=None):
+    """
+    Dock a single ligand inside a worker process.
+    """
+    start = time.perf_counter()
+    try:
+        if cache is None:
+            log_text = run_smina(ligand=job.ligand, output=job.output, log=job.log, **settings)
+        else:
+            log_text = cache.run_smina(ligand=job.ligand, output=job.output, log=job.log,
+                                       ligand_key=job.ligand_key, **settings)
+    except (subprocess.CalledProcessError, OSError) as error:
+        return DockingResult(name=job.name, elapsed=time.perf_counter() - start, error=str(error))
+    return DockingResult(name=job.name, output=job.output, log_text=log_text,
+                         elapsed=time.perf_counter() - start)
+
+
+def dock_ligands(jobs, protein, pocket_center=None, pocket_size=None, num_poses=10,
+                 exhaustiveness=8, cpu_per_job=1, n_workers=None, cache=None):
+    """
+    Dock many ligands in parallel and yield the results as they finish.
+
+    Jobs are submitted lazily, so ``jobs`` may also be a generator over a very
+    large library. At most two jobs per worker are waiting at any time.
+
+    Parameters
+    ----------
+    jobs: iterable of DockingJob
+        The ligands to dock.
+    protein: str or pathlib.Path or PreparedReceptor
+        Path to protein file that should be docked to (formats: pdb, pdbqt),
+        or a receptor prepared with ``prepare_receptor``.
+    pocket_center: iterable of float or int
+        Coordinates defining the center of the binding site. Not used with a
+        PreparedReceptor, whose config file defines the box.
+    pocket_size: iterable of float or int
+        Lengths of edges defining the binding site. Not used with a
+        PreparedReceptor, whose config file defines the box.
+    num_poses: int
+        Maximum number of poses to generate.
+    exhaustiveness: int
+        Accuracy of docking calculations.
+    cpu_per_job: int
+        Number of threads each smina process may use.
+    n_workers: int or None
+        Number of smina processes running at the same time. If None, the
+        cores of the machine are split according to ``cpu_per_job``.
+    cache: DockingCache or None
+        If given, results are looked up in and stored to this cache.
+
+    Yields
+    ------
+    result: DockingResult
+        The result of each job, in order of completion.
+    """
+    if n_workers is None:
+        n_workers, cpu_per_job = split_cores(cpu_per_job)
+    if isinstance(protein, PreparedReceptor):
+        if pocket_center is not None or pocket_size is not None:
+            raise ValueError("The binding box of a PreparedReceptor is defined by its config file")
+        settings = {"protein": str(protein.receptor), "config": str(protein.config)}
+    else:
+        settings = {"protein": str(protein),
+                    "pocket_center": [float(x) for x in pocket_center],
+                    "pocket_size": [float(x) for x in pocket_size]}
+    settings.update({"num_poses": num_poses,
+                     "exhaustiveness": exhaustiveness,
+                     "cpu": cpu_per_job})
+
+    jobs = iter(jobs)
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        pending = set()
+        exhausted = False
+        while True:
+            # Keep the pool busy without submitting the whole library at once
+            while not exhausted and len(pending) < 2 * n_workers:
+                job = next(jobs, None)
+                if job is None:
+                    exhausted = True
+                    break
+                pending.add(pool.submit(_dock_job, job, settings, cache))
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def dock_dataframe(information, protein, pocket_center=None, pocket_size=None,
+                   output_dir=path.join('output', 'docked'), log_dir=None,
+                   num_poses=10, exhaustiveness=8, cpu_per_job=1, n_workers=None,
+                   cache=None, key_column=None):
+    """
+    Dock all ligands of the VirtualScreening data frame in parallel.
+
+    The data frame needs the columns ``Name`` and ``input_sdf``. The column
+    ``docked_sdf`` is created if it is missing. Ligands that fail to dock get
+    ``None`` as ``docked_sdf`` and the error message in ``docking_error``.
+
+    Parameters
+    ----------
+    information: pandas.DataFrame
+        The ligands to dock.
+    protein: str or pathlib.Path or PreparedReceptor
+        Path to protein file that should be docked to (formats: pdb, pdbqt),
+        or a receptor prepared with ``prepare_receptor``.
+    pocket_center: iterable of float or int
+        Coordinates defining the center of the binding site.
+    pocket_size: iterable of float or int
+        Lengths of edges defining the binding site.
+    output_dir: str or pathlib.Path
+        Directory for docked poses, used if ``docked_sdf`` is missing.
+    log_dir: str or pathlib.Path or None
+        Directory for the smina logs. If None, no logs are written.
+    num_poses: int
+        Maximum number of poses to generate.
+    exhaustiveness: int
+        Accuracy of docking calculations.
+    cpu_per_job: int
+        Number of threads each smina process may use.
+    n_workers: int or None
+        Number of smina processes running at the same time.
+    cache: DockingCache or None
+        If given, results are looked up in and stored to this cache.
+    key_column: str or None
+        Column identifying the ligand in the cache (e.g. ``Smiles``) instead
+        of the content of the prepared ligand file.
+
+    Returns
+    -------
+    information: pandas.DataFrame
+        The same data frame with the columns ``docked_sdf``, ``docking_time``
+        and ``docking_error`` filled in.
+    """
+    if "docked_sdf" not in information:
+        information["docked_sdf"] = [path.join(output_dir, f"{name}.sdf") for name in information["Name"]]
+    for docked_sdf in information["docked_sdf"]:
+        Path(docked_sdf).parent.mkdir(parents=True, exist_ok=True)
+    if log_dir is not None:
+        Path(log_dir).mkdir(parents=True, exist_ok=True)
+
+    jobs = []
+    for index, molecule in information.iterrows():
+        log = None if log_dir is None else path.join(log_dir, f"{molecule['Name']}.txt")
+        ligand_key = None if key_column is None else str(molecule[key_column])
+        jobs.append(DockingJob(name=index, ligand=molecule["input_sdf"],
+                               output=molecule["docked_sdf"], log=log, ligand_key=ligand_key))
+
+    information["docking_time"] = float("nan")
+    information["docking_error"] = None
+    results = dock_ligands(jobs, protein, pocket_center, pocket_size,
+                           num_poses=num_poses, exhaustiveness=exhaustiveness,
+                           cpu_per_job=cpu_per_job, n_workers=n_workers, cache=cache)
+    for result in tqdm(results, total=len(jobs)):
+        information.at[result.name, "docked_sdf"] = result.output
+        information.at[result.name, "docking_time"] = result.elapsed
+        information.at[result.name, "docking_error"] = result.error
+    return information
@@ -0,0 +1,186 @@
+"""
+Two-pass docking: a cheap screen of the whole library followed by a careful
+re-dock of the promising ligands.
+
+Most of the ligands of a virtual screen end up far from the top of the ranking,
+so docking all of them with ``exhaustiveness=8`` and ten poses spends most of
+the compute on ligands nobody looks at again. Here, all ligands are first docked
+with a low exhaustiveness and a single pose. Only the best ``top_fraction`` of
+the ligands, and those whose first-pass score lies within ``margin`` of the
+cutoff, are docked again with the full settings.
+
+:func:`compare_protocols` reports the ROC AUC against the measured affinities
+together with the docking time, so that the cheap protocol can be compared to
+the full-cost baseline.
+
+Example
+-------
+>>> information = two_pass_docking(information, receptor, top_fraction=0.2, margin=0.5)
+>>> compare_protocols(information, ["score_screen", "score", "score_full"])
+"""
+
+from os import path
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import auc, roc_curve
+from tqdm.auto import tqdm
+
+from .runner import DockingJob, dock_ligands
+from .scores import read_sd_tags
+
+
+def _dock_and_score(information, names, docked_dir, protein, pocket_center, pocket_size,
+                    num_poses, exhaustiveness, **kwargs):
+    """
+    Dock the ligands ``names`` and return their best scores, files and timings.
+    """
+    Path(docked_dir).mkdir(parents=True, exist_ok=True)
+    jobs = [DockingJob(name=name, ligand=information.at[name, "input_sdf"],
+                       output=path.join(docked_dir, f"{information.at[name, 'Name']}.sdf"))
+            for name in names]
+
+    scores = pd.Series(np.nan, index=information.index)
+    docked_sdf = pd.Series(None, index=information.index, dtype=object)
+    docking_time = pd.Series(0.0, index=information.index)
+    results = dock_ligands(jobs, protein, pocket_center, pocket_size, num_poses=num_poses,
+                           exhaustiveness=exhaustiveness, **kwargs)
+    for result in tqdm(results, total=len(jobs)):
+        docking_time[result.name] = result.elapsed
+        if result.error is not None:
+            continue
+        docked_sdf[result.name] = result.output
+        # Best score over the poses of all conformers
+        affinities = [float(affinity) for affinity in read_sd_tags(result.output)["minimizedAffinity"]
+                      if affinity is not None]
+        if affinities:
+            scores[result.name] = min(affinities)
+    return scores, docked_sdf, docking_time
+
+
+def select_for_refinement(scores, top_fraction=0.1, margin=0.0):
+    """
+    Select the ligands to re-dock after the first pass.
+
+    Parameters
+    ----------
+    scores: pandas.Series
+        First-pass docking scores (lower is better).
+    top_fraction: float
+        Fraction of the ligands with the best scores that is always re-docked.
+    margin: float
+        Ligands whose score is at most ``margin`` (kcal/mol) worse than the
+        cutoff of the top fraction are re-docked as well.
+
+    Returns
+    -------
+    selected: pandas.Series of bool
+        True for the ligands to re-dock.
+    """
+    valid = scores.dropna()
+    if len(valid) == 0:
+        return pd.Series(False, index=scores.index)
+    n_top = max(1, int(np.ceil(top_fraction * len(valid))))
+    cutoff = np.sort(valid.to_numpy())[n_top - 1]
+    return (scores <= cutoff + margin).fillna(False)
+
+
+def two_pass_docking(information, protein, pocket_center=None, pocket_size=None,
+                     output_dir="output", top_fraction=0.1, margin=0.0,
+                     screen_exhaustiveness=1, screen_poses=1,
+                     refine_exhaustiveness=8, refine_poses=10, **kwargs):
+    """
+    Dock a library with a cheap first pass and re-dock the best ligands.
+
+    Parameters
+    ----------
+    information: pandas.DataFrame
+        The ligands, with the columns ``Name`` and ``input_sdf``.
+    protein: str or pathlib.Path or PreparedReceptor
+        Receptor to dock to.
+    pocket_center: iterable of float or int
+        Coordinates defining the center of the binding site.
+    pocket_size: iterable of float or int
+        Lengths of edges defining the binding site.
+    output_dir: str or pathlib.Path
+        First-pass poses go to ``docked_screen``, re-docked poses to ``docked``.
+    top_fraction: float
+        Fraction of the ligands that is re-docked.
+    margin: float
+        Additional score margin (kcal/mol) around the cutoff.
+    screen_exhaustiveness: int
+        Exhaustiveness of the first pass.
+    screen_poses: int
+        Number of poses of the first pass.
+    refine_exhaustiveness: int
+        Exhaustiveness of the second pass.
+    refine_poses: int
+        Number of poses of the second pass.
+    **kwargs
+        Further settings handed to :func:`docking_utils.runner.dock_ligands`.
+
+    Returns
+    -------
+    information: pandas.DataFrame
+        The same data frame with the columns ``score_screen``, ``refined``,
+        ``score`` (second-pass score where available, first-pass score
+        otherwise), ``docked_sdf`` and ``docking_time`` (both passes).
+    """
+    scores, docked_sdf, time_screen = _dock_and_score(
+        information, information.index, path.join(output_dir, "docked_screen"),
+        protein, pocket_center, pocket_size, screen_poses, screen_exhaustiveness, **kwargs)
+    information["score_screen"] = scores
+    information["refined"] = select_for_refinement(scores, top_fraction=top_fraction, margin=margin)
+    print(f"Re-docking {information['refined'].sum()} of {len(information)} ligands")
+
+    refined = information.index[information["refined"]]
+    scores_refined, docked_refined, time_refine = _dock_and_score(
+        information, refined, path.join(output_dir, "docked"),
+        protein, pocket_center, pocket_size, refine_poses, refine_exhaustiveness, **kwargs)
+
+    information["score"] = scores_refined.fillna(scores)
+    information["docked_sdf"] = docked_refined.fillna(docked_sdf)
+    information["docking_time"] = time_screen + time_refine
+    return information
+
+
+def compare_protocols(information, score_columns, affinity_column="Affinity[µM]",
+                      affinity_threshold=1., time_columns=None):
+    """
+    ROC AUC of several docking scores against the measured affinities.
+
+    As in the VirtualScreening notebook, ligands with an affinity above
+    ``affinity_threshold`` are inactive and a higher (worse) score should
+    indicate an inactive ligand.
+
+    Parameters
+    ----------
+    information: pandas.DataFrame
+        The ligands with their affinities and scores.
+    score_columns: list of str
+        Score columns to compare, e.g. the first-pass, two-pass and full
+        (baseline) scores.
+    affinity_column: str
+        Column with the measured affinities.
+    affinity_threshold: float
+        Affinity (µM) separating actives and inactives.
+    time_columns: dict of str to str or None
+        Docking time column belonging to each score column, to report the
+        compute spent on each protocol.
+
+    Returns
+    -------
+    report: pandas.DataFrame
+        AUC (and total docking time) per score column.
+    """
+    inactive = information[affinity_column] > affinity_threshold
+    rows = []
+    for column in score_columns:
+        valid = information[column].notna()
+        fpr, tpr, _ = roc_curve(inactive[valid], information.loc[valid, column])
+        row = {"score": column, "auc": auc(fpr, tpr), "n_scored": int(valid.sum())}
+        if time_columns is not None and column in time_columns:
+            row["docking_time"] = information[time_columns[column]].sum()
+        rows.append(row)
+    return pd.DataFrame(rows)
@@ -0,0 +1,228 @@
+"""
+Fast extraction of docking scores from smina output.
+
+Reading the docking score with ``Chem.SDMolSupplier`` builds a full RDKit
+molecule for every pose, although only the ``minimizedAffinity`` tag is needed.
+The functions below read the SD data tags directly from the file text. For a
+whole screening, the files are read in parallel into a single table.
+
+Example
+-------
+>>> from docking_utils import collect_scores
+>>> scores = collect_scores(information['docked_sdf'])
+>>> best = scores.groupby('file')['minimizedAffinity'].min()
+>>> information['score'] = information['docked_sdf'].map(best)
+
+Smina sorts the poses by affinity only within one conformer of a multi-conformer
+input file, so the best score of a ligand is the minimum over all its poses.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+def read_sd_tags(sdf_path, tags=("minimizedAffinity",)):
+    """
+    Read SD data tags of all records in an SDF file without parsing molecules.
+
+    Parameters
+    ----------
+    sdf_path: str or pathlib.Path
+        SDF file, e.g. the docking output of smina.
+    tags: iterable of str
+        Names of the data tags to read.
+
+    Returns
+    -------
+    values: dict of str to list of str
+        For each tag, the value of every record (None if a record lacks it).
+    """
+    tags = tuple(tags)
+    values = {tag: [] for tag in tags}
+    record = {}
+    current_tag = None
+
+    with open(sdf_path) as f:
+        for line in f:
+            if current_tag is not None:
+                # The value follows directly on the line after the tag header
+                record[current_tag] = line.strip()
+                current_tag = None
+            elif line.startswith(">"):
+                start = line.find("<")
+                end = line.find(">", start)
+                name = line[start + 1:end]
+                if name in values:
+                    current_tag = name
+            elif line.startswith("$$$$"):
+                for tag in tags:
+                    values[tag].append(record.get(tag))
+                record = {}
+    return values
+
+
+def extract_docking_score(docked_molecule, pose_id=0):
+    """
+    Extract the docking score from an SDF file. The docking score
+    is given under the "minimizedAffinity" property.
+
+    Parameters
+    ----------
+    docked_molecule: str
+        SDF file containing docking output.
+    pose_id: int
+        ID of pose to get the affinity of
+
+    Returns
+    -------
+    score: float
+        The calculated docking score
+    """
+    return float(read_sd_tags(docked_molecule)["minimizedAffinity"][pose_id])
+
+
+def parse_smina_log(log_text):
+    """
+    Read the result tables printed by smina.
+
+    Smina prints one table per record of the ligand file, e.g. one per
+    conformer. The rows of all tables are returned in the order of the poses
+    in the docked SDF file.
+
+    Parameters
+    ----------
+    log_text: str
+        The output of a smina calculation.
+
+    Returns
+    -------
+    table: numpy.ndarray
+        Array of shape (n_poses, 3) with the affinity (kcal/mol) and the
+        lower and upper bound of the RMSD from the best pose of the same
+        conformer.
+    """
+    rows = []
+    in_table = False
+    for line in log_text.splitlines():
+        if line.startswith("-----+"):
+            in_table = True
+            continue
+        if in_table:
+            fields = line.split()
+            try:
+                row = [float(x) for x in fields[1:]] if len(fields) == 4 else None
+            except ValueError:
+                row = None
+            if row is None:
+                # End of this table, the next conformer may print another one
+                in_table = False
+            else:
+                rows.append(row)
+    return np.array(rows, dtype=float).reshape(-1, 3)
+
+
+def _read_scores(task):
+    """
+    Read all pose scores of a single docking output inside a worker process.
+    """
+    sdf_path, tags, log_path = task
+    try:
+        values = read_sd_tags(sdf_path, tags)
+    except OSError:
+        return sdf_path, {tag: [] for tag in tags}, None
+    rmsd = None
+    if log_path is not None and path.exists(log_path):
+        with open(log_path) as f:
+            rmsd = parse_smina_log(f.read())[:, 1:]
+    return sdf_path, values, rmsd
+
+
+def collect_scores(sdf_paths, tags=("minimizedAffinity",), log_dir=None,
+                   n_workers=None, chunksize=256):
+    """
+    Read the scores of all poses of many docking outputs into one table.
+
+    Parameters
+    ----------
+    sdf_paths: iterable of str or pathlib.Path
+        Docking output files.
+    tags: iterable of str
+        SD data tags to read. Numeric tags are converted to float.
+    log_dir: str or pathlib.Path or None
+        Directory with the smina logs, named like the SDF files but with the
+        extension ``.txt``. If given, the columns ``rmsd_lb`` and ``rmsd_ub``
+        are added.
+    n_workers: int or None
+        Number of worker processes. If None, all cores are used.
+    chunksize: int
+        Number of files sent to a worker at once.
+
+    Returns
+    -------
+    scores: pandas.DataFrame
+        One row per pose with the columns ``file``, ``pose`` and one column per tag.
+    """
+    tags = tuple(tags)
+    tasks = []
+    for sdf_path in sdf_paths:
+        if sdf_path is None or (isinstance(sdf_path, float) and np.isnan(sdf_path)):
+            continue
+        log_path = None if log_dir is None else path.join(log_dir, f"{Path(sdf_path).stem}.txt")
+        tasks.append((str(sdf_path), tags, log_path))
+
+    files = []
+    poses = []
+    columns = {tag: [] for tag in tags}
+    rmsd_lb = []
+    rmsd_ub = []
+    with ProcessPoolExecutor(max_workers=n_workers or os.cpu_count()) as pool:
+        for sdf_path, values, rmsd in pool.map(_read_scores, tasks, chunksize=chunksize):
+            n_poses = len(values[tags[0]])
+            files += [sdf_path] * n_poses
+            poses += range(n_poses)
+            for tag in tags:
+                columns[tag] += values[tag]
+            if log_dir is not None:
+                bounds = np.full((n_poses, 2), np.nan)
+                if rmsd is not None:
+                    n = min(n_poses, len(rmsd))
+                    bounds[:n] = rmsd[:n]
+                rmsd_lb += list(bounds[:, 0])
+                rmsd_ub += list(bounds[:, 1])
+
+    scores = pd.DataFrame({"file": files, "pose": np.array(poses, dtype=int)})
+    for tag in tags:
+        try:
+            scores[tag] = pd.to_numeric(pd.Series(columns[tag], dtype=object))
+        except ValueError:
+            scores[tag] = columns[tag]
+    if log_dir is not None:
+        scores["rmsd_lb"] = rmsd_lb
+        scores["rmsd_ub"] = rmsd_ub
+    return scores
+
+
+def collect_scores_dir(directory, pattern="*.sdf", **kwargs):
+    """
+    Read the scores of all docking outputs in a directory.
+
+    Parameters
+    ----------
+    directory: str or pathlib.Path
+        Directory containing the docked SDF files.
+    pattern: str
+        Glob pattern selecting the files.
+    **kwargs
+        Further settings handed to :func:`collect_scores`.
+
+    Returns
+    -------
+    scores: pandas.DataFrame
+        One row per pose, see :func:`collect_scores`.
+    """
+    return collect_scores(sorted(Path(directory).glob(pattern)), **kwargs)
@@ -0,0 +1,119 @@
+"""
+Thin Python wrapper around the smina command line tool.
+
+Smina does not provide a Python API, so (as in the notebooks) we build the
+command as a list of arguments and run it with the subprocess module.
+"""
+
+import subprocess
+
+
+def smina_command(ligand, protein, output, pocket_center=None, pocket_size=None,
+                  num_poses=10, exhaustiveness=8, cpu=None, seed=None, config=None):
+    """
+    Build the smina command line for a single docking run.
+
+    The binding box is given either by ``pocket_center`` and ``pocket_size``
+    or by a smina config file (see ``write_box_config``).
+
+    Parameters
+    ----------
+    ligand: str or pathlib.Path
+        Path to ligand file that should be docked. Formats: mol2, sdf, pdbqt, pdb
+    protein: str or pathlib.Path
+        Path to protein file that should be docked to. Formats: pdb, pdbqt
+    output: str or pathlib.Path
+        Path to which docking poses should be saved. Formats: sdf, mol2, pdb
+    pocket_center: iterable of float or int
+        Coordinates defining the center of the binding site.
+    pocket_size: iterable of float or int
+        Lengths of edges defining the binding site.
+    num_poses: int
+        Maximum number of poses to generate.
+    exhaustiveness: int
+        Accuracy of docking calculations.
+    cpu: int or None
+        Number of threads smina may use. If None, smina uses all cores.
+    seed: int or None
+        Random seed for reproducible docking runs.
+    config: str or pathlib.Path or None
+        Path to a smina config file with the binding box (``--config``).
+
+    Returns
+    -------
+    command: list of str
+        The arguments to hand to the subprocess module.
+    """
+    command = ["smina",
+               "--ligand",   str(ligand),
+               "--receptor", str(protein),
+               "--out",      str(output)
+               ]
+    if config is not None:
+        command += ["--config", str(config)]
+    elif pocket_center is not None and pocket_size is not None:
+        command += ["--center_x", str(pocket_center[0]),
+                    "--center_y", str(pocket_center[1]),
+                    "--center_z", str(pocket_center[2]),
+                    "--size_x",   str(pocket_size[0]),
+                    "--size_y",   str(pocket_size[1]),
+                    "--size_z",   str(pocket_size[2])]
+    else:
+        raise ValueError("smina needs a binding box: pocket_center and pocket_size or a config file")
+    command += ["--num_modes", str(num_poses),
+                "--exhaustiveness", str(exhaustiveness)]
+    if cpu is not None:
+        command += ["--cpu", str(cpu)]
+    if seed is not None:
+        command += ["--seed", str(seed)]
+    return command
+
+
+def run_smina(ligand, protein, output, pocket_center=None, pocket_size=None, log=None,
+              num_poses=10, exhaustiveness=8, cpu=None, seed=None, config=None):
+    """
+    Perform docking with Smina.
+
+    Parameters
+    ----------
+    ligand: str or pathlib.Path
+        Path to ligand file that should be docked. Formats: mol2, sdf, pdbqt, pdb
+    protein: str or pathlib.Path
+        Path to protein file that should be docked to. Formats: pdb, pdbqt
+    output: str or pathlib.Path
+        Path to which docking poses should be saved. Formats: sdf, mol2, pdb
+    pocket_center: iterable of float or int
+        Coordinates defining the center of the binding site.
+    pocket_size: iterable of float or int
+        Lengths of edges defining the binding site.
+    log: str or pathlib.Path or None
+        Location where the smina log is saved. If None, no log file is written.
+    num_poses: int
+        Maximum number of poses to generate.
+    exhaustiveness: int
+        Accuracy of docking calculations.
+    cpu: int or None
+        Number of threads smina may use. If None, smina uses all cores.
+    seed: int or None
+        Random seed for reproducible docking runs.
+    config: str or pathlib.Path or None
+        Path to a smina config file with the binding box, used instead of
+        ``pocket_center`` and ``pocket_size``.
+
+    Returns
+    -------
+    log_text: str
+        The output of the Smina calculation.
+    """
+    command = smina_command(ligand, protein, output, pocket_center, pocket_size,
+                            num_poses=num_poses, exhaustiveness=exhaustiveness,
+                            cpu=cpu, seed=seed, config=config)
+
+    # Execute command in terminal over a Python subprocess
+    log_text = subprocess.check_output(command, universal_newlines=True)
+
+    # Write log to the log folder
+    if log is not None:
+        with open(log, "w") as f:
+            f.writelines(log_text)
+    return log_text
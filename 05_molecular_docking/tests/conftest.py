@@ -0,0 +1,53 @@
+import os
+import stat
+import sys
+from os import path
+
+import pytest
+
+# Make docking_utils importable without installing it
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+FAKE_SMINA = """#!/bin/sh
+# Stand-in for smina: copies the ligand and adds a minimizedAffinity tag
+# depending on the record number, and prints one result table per record.
+# Every exhaustiveness step below 8 makes the affinity 0.1 worse.
+# The arguments are appended to $FAKE_SMINA_ARGS if it is set.
+if [ -n "$FAKE_SMINA_ARGS" ]; then
+    echo "$@" >> "$FAKE_SMINA_ARGS"
+fi
+exhaustiveness=8
+while [ $# -gt 0 ]; do
+    case $1 in
+        --ligand) ligand=$2; shift;;
+        --out) out=$2; shift;;
+        --exhaustiveness) exhaustiveness=$2; shift;;
+        --version) echo "smina fake 1.0"; exit 0;;
+    esac
+    shift
+done
+if [ -n "$FAKE_SMINA_FAIL" ] && [ "${ligand#*$FAKE_SMINA_FAIL}" != "$ligand" ]; then
+    echo "fake failure" >&2
+    exit 3
+fi
+awk -v e="$exhaustiveness" '/^\\$\\$\\$\\$/ {n++; print "> <minimizedAffinity>"; print -n - 5 + (8 - e) / 10; print ""}
+     {print}' "$ligand" > "$out"
+awk -v e="$exhaustiveness" '/^\\$\\$\\$\\$/ {n++; print "mode |   affinity | dist from best mode";
+     print "-----+------------+----------+----------";
+     printf "1       %.1f      0.000      0.000\\n", -n - 5 + (8 - e) / 10; print "Refine time 0.1"}' "$ligand"
+"""
+
+
+@pytest.fixture
+def fake_smina(tmp_path, monkeypatch):
+    """
+    Put a fake smina executable on PATH; the n-th record of a ligand file
+    gets the affinity -(n + 5) (at the default exhaustiveness of 8).
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    executable = bin_dir / "smina"
+    executable.write_text(FAKE_SMINA)
+    executable.chmod(executable.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return executable
@@ -0,0 +1,95 @@
+import os
+import subprocess
+
+import pytest
+
+from docking_utils.cache import DockingCache, smina_version
+from docking_utils.receptor import write_box_config
+
+BOX = dict(pocket_center=[1.0, 2.0, 3.0], pocket_size=[10, 10, 10])
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    protein = tmp_path / "protein.pdb"
+    protein.write_text("ATOM\nEND\n")
+    ligand = tmp_path / "ligand.sdf"
+    ligand.write_text("ligand\n\n\nM  END\n$$$$\n")
+    return protein, ligand
+
+
+@pytest.fixture(autouse=True)
+def clear_version():
+    smina_version.cache_clear()
+    yield
+    smina_version.cache_clear()
+
+
+def test_smina_version(fake_smina):
+    assert smina_version() == "smina fake 1.0"
+
+
+def test_key_depends_on_all_inputs(tmp_path, inputs, fake_smina):
+    protein, ligand = inputs
+    cache = DockingCache(tmp_path / "cache")
+    key = cache.key(ligand, protein, **BOX)
+    assert key == cache.key(str(ligand), str(protein), pocket_center=[1, 2, 3], pocket_size=[10.0, 10.0, 10.0])
+    assert key != cache.key(ligand, protein, pocket_center=[1, 2, 3.5], pocket_size=[10, 10, 10])
+    assert key != cache.key(ligand, protein, num_poses=9, **BOX)
+    assert key != cache.key(ligand, protein, exhaustiveness=16, **BOX)
+    assert key != cache.key(ligand, protein, seed=1, **BOX)
+    assert key != cache.key(ligand, protein, ligand_key="CCO", **BOX)
+
+    # The receptor content, not its path, identifies it
+    protein.write_text("ATOM\nATOM\nEND\n")
+    assert key != cache.key(ligand, protein, **BOX)
+
+
+def test_key_of_config_file(tmp_path, inputs, fake_smina):
+    protein, ligand = inputs
+    cache = DockingCache(tmp_path / "cache")
+    config = tmp_path / "box.txt"
+    write_box_config([1, 2, 3], [10, 10, 10], config)
+    key = cache.key(ligand, protein, config=config)
+    # The box smina reads from the config file is hashed
+    write_box_config([1, 2, 3.5], [10, 10, 10], config)
+    assert key != cache.key(ligand, protein, config=config)
+
+
+def test_run_smina_reuses_results(tmp_path, inputs, fake_smina, monkeypatch):
+    protein, ligand = inputs
+    cache = DockingCache(tmp_path / "cache")
+    log_text = cache.run_smina(ligand, protein, tmp_path / "first.sdf", log=tmp_path / "first.log", **BOX)
+    assert "-6.0" in log_text
+
+    # smina fails from now on, so the second result has to come from the cache
+    monkeypatch.setenv("FAKE_SMINA_FAIL", "ligand")
+    assert cache.run_smina(ligand, protein, tmp_path / "second.sdf", log=tmp_path / "second.log", **BOX) == log_text
+    assert (tmp_path / "second.sdf").read_text() == (tmp_path / "first.sdf").read_text()
+    assert (tmp_path / "second.log").read_text() == log_text
+    with pytest.raises(subprocess.CalledProcessError):
+        cache.run_smina(ligand, protein, tmp_path / "third.sdf", seed=1, **BOX)
+
+
+def test_get_missing_key(tmp_path):
+    cache = DockingCache(tmp_path / "cache")
+    assert cache.get("0" * 64, tmp_path / "out.sdf") is None
+    assert not (tmp_path / "out.sdf").exists()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    poses = tmp_path / "poses.sdf"
+    poses.write_text("x" * 100)
+    cache = DockingCache(tmp_path / "cache", max_size=1000)
+    for index, key in enumerate(["a", "b", "c"]):
+        cache.put(key, poses, "log" * 50)
+        for entry in (tmp_path / "cache").glob(f"{key}.*"):
+            os.utime(entry, (index, index))
+    assert cache.size() == 750
+
+    # Using "a" makes "b" the oldest entry
+    assert cache.get("a", tmp_path / "out.sdf") is not None
+    cache.max_size = 600
+    cache.evict()
+    assert sorted(entry.name for entry in (tmp_path / "cache").iterdir()) == ["a.log", "a.sdf", "c.log", "c.sdf"]
+    assert cache.size() <= 600
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+from rdkit.ML.Scoring import Scoring
+from sklearn.metrics import roc_auc_score, roc_curve
+
+from docking_utils.evaluation import (auc_confidence_intervals, bedroc, bootstrap_auc, delong_auc,
+                                      enrichment_factors, evaluate_screening, roc_auc, roc_points)
+
+
+@pytest.fixture
+def screening():
+    rng = np.random.default_rng(0)
+    y_true = rng.random(300) < 0.2
+    # Rounded scores give ties
+    y_score = np.round(rng.normal(size=300) + y_true, 1)
+    return y_true, y_score
+
+
+def test_roc_points_match_sklearn(screening):
+    y_true, y_score = screening
+    fpr, tpr, thresholds = roc_points(y_true, y_score)
+    expected_fpr, expected_tpr, expected_thresholds = roc_curve(y_true, y_score, drop_intermediate=False)
+    np.testing.assert_allclose(fpr, expected_fpr)
+    np.testing.assert_allclose(tpr, expected_tpr)
+    np.testing.assert_allclose(thresholds[1:], expected_thresholds[1:])
+    assert roc_auc(fpr, tpr) == pytest.approx(roc_auc_score(y_true, y_score))
+
+
+def test_enrichment_factors():
+    # Ranked: active, inactive, active, then 7 inactives
+    y_true = np.array([True, False, True] + [False] * 7)
+    y_score = -np.arange(10.0)
+    # Top 10 %: 1 of 1 is active, the library has 20 % actives
+    np.testing.assert_allclose(enrichment_factors(y_true, y_score, fractions=(0.1, 0.3, 1.0)), [5.0, 10 / 3, 1.0])
+    np.testing.assert_array_equal(enrichment_factors(np.zeros(10, dtype=bool), y_score), np.zeros(4))
+
+
+@pytest.mark.parametrize("alpha", [20.0, 80.5])
+def test_bedroc_matches_rdkit(screening, alpha):
+    y_true, y_score = screening
+    # rdkit ranks the rows in the given order
+    order = np.argsort(-y_score, kind="mergesort")
+    expected = Scoring.CalcBEDROC([[label] for label in y_true[order]], 0, alpha)
+    assert bedroc(y_true, y_score, alpha=alpha) == pytest.approx(expected)
+
+
+def test_evaluate_screening():
+    information = pd.DataFrame({"Affinity[µM]": [0.1, 0.5, 2.0, 5.0, 10.0, 0.2],
+                                "score": [-9.0, -7.0, -8.0, -6.0, -5.0, np.nan]})
+    metrics = evaluate_screening(information, fractions=(0.2, 0.5))
+    assert metrics["n_ligands"] == 5
+    assert metrics["n_actives"] == 2
+    assert metrics["auc"] == pytest.approx(roc_auc_score([1, 1, 0, 0, 0], [9, 7, 8, 6, 5]))
+    assert metrics["EF20%"] == pytest.approx(2.5)
+    assert metrics["EF50%"] == pytest.approx((2 / 3) / 0.4)
+    assert 0 < metrics["bedroc"] <= 1
+
+
+def test_bootstrap_auc_matches_resampled_sklearn(screening):
+    y_true, y_score = screening
+    aucs = bootstrap_auc(y_true, y_score, n_resamples=50, random_seed=3)
+
+    # The same resamples, drawn as in bootstrap_auc
+    rng = np.random.default_rng(3)
+    indices = np.hstack([rng.choice(np.flatnonzero(y_true), (50, y_true.sum())),
+                         rng.choice(np.flatnonzero(~y_true), (50, (~y_true).sum()))])
+    expected = [roc_auc_score(y_true[resample], y_score[resample]) for resample in indices]
+    np.testing.assert_allclose(aucs, expected)
+
+    # Small blocks draw other resamples with the same distribution
+    blocked = bootstrap_auc(y_true, y_score, n_resamples=2000, max_elements=10000)
+    assert blocked.shape == (2000,)
+    assert blocked.mean() == pytest.approx(roc_auc_score(y_true, y_score), abs=0.01)
+
+
+def test_unstratified_bootstrap_and_protocols(screening):
+    y_true, y_score = screening
+    scores = np.vstack([y_score, -y_score])
+    aucs = bootstrap_auc(y_true, scores, n_resamples=200, stratified=False)
+    assert aucs.shape == (200, 2)
+    # Both protocols are evaluated on the same resamples
+    np.testing.assert_allclose(aucs[:, 0] + aucs[:, 1], 1.0)
+
+
+def test_delong_auc(screening):
+    y_true, y_score = screening
+    other = y_score + np.random.default_rng(1).normal(size=len(y_score))
+    aucs, covariance = delong_auc(y_true, np.vstack([y_score, other]))
+    np.testing.assert_allclose(aucs, [roc_auc_score(y_true, y_score), roc_auc_score(y_true, other)])
+
+    # Direct O(N^2) structural components
+    actives, inactives = y_score[y_true], y_score[~y_true]
+    psi = (actives[:, None] > inactives[None, :]) + 0.5 * (actives[:, None] == inactives[None, :])
+    variance = np.var(psi.mean(axis=1), ddof=1) / len(actives) + np.var(psi.mean(axis=0), ddof=1) / len(inactives)
+    assert covariance[0, 0] == pytest.approx(variance)
+    # and the bootstrap agrees on the spread
+    assert np.sqrt(variance) == pytest.approx(np.std(bootstrap_auc(y_true, y_score)), rel=0.15)
+
+
+@pytest.mark.parametrize("method", ["bootstrap", "delong"])
+def test_auc_confidence_intervals(method):
+    rng = np.random.default_rng(0)
+    active = rng.random(200) < 0.3
+    information = pd.DataFrame({"Affinity[µM]": np.where(active, 0.1, 10.0),
+                                "good": -rng.normal(size=200) - 2 * active,
+                                "random": rng.normal(size=200)})
+    information.loc[0, "random"] = np.nan
+    report = auc_confidence_intervals(information, ["good", "random"], method=method).set_index("protocol")
+    assert list(report.index) == ["good", "random", "good - random"]
+    for protocol in report.index:
+        assert report.loc[protocol, "lower"] < report.loc[protocol, "auc"] < report.loc[protocol, "upper"]
+    assert report.loc["good", "lower"] > 0.8
+    assert report.loc["random", "lower"] < 0.5 < report.loc["random", "upper"]
+    assert report.loc["good - random", "lower"] > 0
+    if method == "delong":
+        assert report.loc["good - random", "p_value"] < 1e-6
+
+    with pytest.raises(ValueError):
+        auc_confidence_intervals(information, ["good"], method="jackknife")
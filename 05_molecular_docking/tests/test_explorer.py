@@ -0,0 +1,109 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+
+import pandas as pd
+import pytest
+
+from docking_utils.explorer import canonical_smiles, depiction_file, draw_depictions, write_explorer
+
+
+def test_depictions_are_drawn_once(tmp_path):
+    # "OCC" and "CCO" are the same molecule
+    files = draw_depictions(["CCO", "OCC", "invalid", "c1ccccc1"], cache_dir=tmp_path, n_workers=2)
+    assert files[0] == files[1] == depiction_file(canonical_smiles("OCC"), str(tmp_path))
+    assert files[2] is None
+    assert sorted(os.listdir(tmp_path)) == sorted({os.path.basename(files[0]), os.path.basename(files[3])})
+    assert open(files[3]).read().startswith("<svg")
+
+    # Cached files are not drawn again
+    os.utime(files[0], (0, 0))
+    assert draw_depictions(["CCO"], cache_dir=tmp_path) == files[:1]
+    assert os.stat(files[0]).st_mtime == 0
+
+
+def make_information():
+    return pd.DataFrame({"Name": ["ethanol", "<b>broken</b> & co", "benzene"],
+                         "Smiles": ["CCO", "invalid", "c1ccccc1"],
+                         "Affinity[µM]": [0.5, 2.0, 10.0], "score": [-5.0, -6.0, -7.0],
+                         "active": [True, False, False]})
+
+
+def test_explorer_embeds_depictions(tmp_path):
+    output = tmp_path / "explorer.html"
+    fig = write_explorer(make_information(), output, color="active", cache_dir=tmp_path / "depictions",
+                         n_workers=1)
+    html = output.read_text()
+    # plotly.js is embedded, no server or internet connection is needed
+    has_remote_script = re.search(r"<script[^>]+src=", html) is not None
+    assert not has_remote_script
+    assert len(fig.data) == 2
+
+    depictions = json.loads(re.search(r"var depictions = (.*);\n", html).group(1).replace("<\\/", "</"))
+    assert len(depictions) == 2
+    assert all(svg.startswith("<svg") for svg in depictions.values())
+    custom_data = [row for trace in fig.data for row in trace.customdata.tolist()]
+    assert sorted(title for _, title in custom_data) == ["<b>broken</b> & co", "benzene", "ethanol"]
+    assert sum(key is None for key, _ in custom_data) == 1
+
+
+def test_explorer_refers_to_files(tmp_path):
+    output = tmp_path / "html" / "explorer.html"
+    fig = write_explorer(make_information(), output, cache_dir=tmp_path / "depictions", embed=False,
+                         n_workers=1)
+    assert output.read_text().count("var depictions = null;") == 1
+    keys = [key for key, _ in fig.data[0].customdata.tolist() if key is not None]
+    assert all(key.startswith("../depictions/") for key in keys)
+    assert all((output.parent / key).exists() for key in keys)
+
+
+# Minimal DOM for the hover script: elements record their content and children
+FAKE_DOM = """
+function element(tag) {
+    return {tag: tag, style: {}, children: [], innerHTML: '', textContent: '',
+            appendChild: function(child) { this.children.push(child); }};
+}
+var handlers = {};
+var document = {body: element('body'), createElement: element,
+                getElementById: function() { return {on: function(event, f) { handlers[event] = f; }}; }};
+"""
+
+
+def hover(html, customdata):
+    """
+    Run the hover script of an explorer page for one point and return the panel.
+    """
+    script = re.search(r"var plot = document\.getElementById.*?plotly_unhover.*?\n", html, re.S).group(0)
+    program = FAKE_DOM + script + f"""
+handlers.plotly_hover({{points: [{{customdata: {json.dumps(customdata)}}}]}});
+var panel = document.body.children[0];
+console.log(JSON.stringify({{title: panel.children[0].textContent, title_html: panel.children[0].innerHTML,
+                            image: panel.children[1].innerHTML,
+                            sources: panel.children[1].children.map(function(img) {{ return img.src; }})}}));
+"""
+    return json.loads(subprocess.run(["node", "-e", program], check=True, capture_output=True, text=True).stdout)
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node to run the hover script")
+@pytest.mark.parametrize("embed", [True, False])
+def test_hover_panel(tmp_path, embed):
+    output = tmp_path / "explorer.html"
+    fig = write_explorer(make_information(), output, cache_dir=tmp_path / "depictions", embed=embed,
+                         n_workers=1)
+    html = output.read_text()
+    custom_data = {title: key for key, title in fig.data[0].customdata.tolist()}
+
+    # The name is shown as text, not parsed as markup
+    panel = hover(html, [None, "<b>broken</b> & co"])
+    assert panel["title"] == "<b>broken</b> & co"
+    assert panel["title_html"] == ""
+    # No depiction for an invalid SMILES, and no request for a file "null"
+    assert panel["image"] == "" and panel["sources"] == []
+
+    panel = hover(html, [custom_data["benzene"], "benzene"])
+    if embed:
+        assert panel["image"].startswith("<svg")
+    else:
+        assert panel["sources"] == [custom_data["benzene"]]
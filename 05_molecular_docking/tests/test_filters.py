@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+from rdkit import Chem
+from rdkit.Chem import Descriptors, rdMolDescriptors
+
+from docking_utils.filters import compute_descriptors, filter_ligands
+
+SMILES = ["CCO", "CC(=O)Oc1ccccc1C(=O)O", "not a smiles", "C" * 40]
+
+
+def test_compute_descriptors():
+    information = pd.DataFrame({"Smiles": SMILES})
+    information = compute_descriptors(information, n_workers=2, chunksize=2)
+    aspirin = Chem.MolFromSmiles(SMILES[1])
+    assert information.loc[1, "MW"] == pytest.approx(Descriptors.MolWt(aspirin))
+    assert information.loc[1, "PSA"] == pytest.approx(rdMolDescriptors.CalcTPSA(aspirin))
+    assert information.loc[3, "n_atoms"] == 40
+    assert information.loc[2, ["MW", "logP", "HBD"]].isna().all()
+
+
+def test_compute_descriptors_keeps_given_values():
+    information = pd.DataFrame({"Smiles": SMILES[:2], "MW": [1.0, np.nan]})
+    information = compute_descriptors(information, columns=["MW", "HBD"], n_workers=1)
+    assert information.loc[0, "MW"] == 1.0
+    assert information.loc[1, "MW"] == pytest.approx(180.16, abs=0.01)
+    assert list(information["HBD"]) == [1, 1]
+    assert "logP" not in information
+
+
+def test_filter_ligands():
+    information = pd.DataFrame({"MW": [300, 600, 450, 550, 200],
+                                "logP": [2, 6, 3, 4, np.nan],
+                                "HBD": [1, 1, 6, 1, 1],
+                                "HBA": [3, 3, 3, 3, 3],
+                                "nrotb": [3, 3, 12, 3, 3],
+                                "PSA": [50, 50, 50, 50, 50]})
+    passed, report = filter_ligands(information, rules=("Lipinski", "Veber"), verbose=False)
+    # Missing values violate a criterion
+    assert list(passed.index) == [0]
+    report = report.set_index(["rule", "criterion"])
+    assert report.loc[("Lipinski", "MW"), "failed"] == 2
+    assert report.loc[("Lipinski", "logP"), "failed"] == 2
+    assert report.loc[("Lipinski", "all"), "removed"] == 4
+    # Ligand 2 fails Veber too, but was already removed
+    assert report.loc[("Veber", "all"), "failed"] == 1
+    assert report.loc[("Veber", "all"), "removed"] == 0
+
+    passed, _ = filter_ligands(information, rules=("Lipinski",), max_violations=1, verbose=False)
+    assert list(passed.index) == [0, 2, 3, 4]
+
+
+def test_custom_rules(capsys):
+    information = pd.DataFrame({"MW": [100, 300, 500]})
+    passed, report = filter_ligands(information, rules={"lead-like": {"MW": (250, 450)}})
+    assert list(passed.index) == [1]
+    assert list(report.rule.unique()) == ["lead-like"]
+    assert "1 of 3 ligands pass" in capsys.readouterr().out
+    passed, report = filter_ligands(information, rules=[{"MW": (None, 200)}], verbose=False)
+    assert list(passed.index) == [0]
+    assert report.rule[0] == "custom_0"
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+from rdkit import Chem
+
+from docking_utils.library import ResultWriter, iter_ligand_batches, read_results, screen_library
+
+
+@pytest.fixture
+def sdf_library(tmp_path):
+    """
+    Four ligands; the first two have an ``activity`` tag, the last two a ``vendor`` tag instead.
+    """
+    sdf_path = tmp_path / "library.sdf"
+    with Chem.SDWriter(str(sdf_path)) as writer:
+        for number, smiles in enumerate(["CCO", "CCN", "CCC", "c1ccccc1"]):
+            molecule = Chem.MolFromSmiles(smiles)
+            molecule.SetProp("_Name", f"mol{number}")
+            if number < 2:
+                molecule.SetProp("activity", str(number + 0.5))
+            else:
+                molecule.SetProp("vendor", "enamine")
+            writer.write(molecule)
+    return sdf_path
+
+
+def test_smiles_and_csv_batches(tmp_path):
+    smi_path = tmp_path / "library.smi"
+    smi_path.write_text("# comment\nCCO ethanol\n\nCCN\nCCC propane\n")
+    batches = list(iter_ligand_batches(smi_path, batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert list(batches[0]["Name"]) == ["ethanol", "ligand_3"]
+
+    csv_path = tmp_path / "library.csv"
+    pd.concat(batches).to_csv(csv_path, index=False)
+    batches = list(iter_ligand_batches(csv_path, batch_size=2))
+    assert list(pd.concat(batches)["Smiles"]) == ["CCO", "CCN", "CCC"]
+
+
+def test_sdf_batches_keep_columns_of_first_batch(sdf_library):
+    batches = list(iter_ligand_batches(sdf_library, batch_size=2))
+    assert [list(batch.columns) for batch in batches] == [["Name", "Smiles", "activity"]] * 2
+    assert batches[1]["activity"].isna().all()
+
+    batches = list(iter_ligand_batches(sdf_library, batch_size=2, sd_tags=["vendor"]))
+    assert list(pd.concat(batches)["vendor"].fillna("")) == ["", "", "enamine", "enamine"]
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+def test_result_writer_aligns_batches(tmp_path, suffix):
+    output = tmp_path / f"results{suffix}"
+    with ResultWriter(output) as writer:
+        writer.write(pd.DataFrame({"Name": ["a"], "activity": [1.5], "score": [-7.0]}))
+        # Other column order, a missing and an additional column
+        writer.write(pd.DataFrame({"score": [-6.0], "vendor": ["enamine"], "Name": ["b"]}))
+    results = read_results(output)
+    assert writer.n_rows == 2
+    assert list(results.columns) == ["Name", "activity", "score"]
+    assert list(results["Name"]) == ["a", "b"]
+    assert list(results["score"]) == [-7.0, -6.0]
+    assert results["activity"][0] == 1.5 and pd.isna(results["activity"][1])
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+def test_screen_library(tmp_path, sdf_library, fake_smina, suffix):
+    protein = tmp_path / "protein.pdb"
+    protein.write_text("END\n")
+    output = tmp_path / f"results{suffix}"
+    n_ligands = screen_library(sdf_library, protein, [0, 0, 0], [10, 10, 10], output=output, batch_size=2,
+                               output_dir=tmp_path / "output", num_confs=2, n_workers=2)
+    results = read_results(output)
+    assert n_ligands == len(results) == 4
+    assert list(results["Name"]) == ["mol0", "mol1", "mol2", "mol3"]
+    # Best of the poses of both conformers, not the first pose
+    assert list(results["score"]) == [-7.0] * 4
+    assert list(results["activity"][:2]) == [0.5, 1.5]
+    assert "vendor" not in results
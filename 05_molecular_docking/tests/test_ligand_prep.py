@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from rdkit import Chem
+
+from docking_utils.ligand_prep import generate_conformers, prepare_dataframe, prepare_ligands, save_sdf
+
+
+def test_generate_conformers():
+    molecule = generate_conformers("CCCCO", num_confs=3)
+    assert molecule.GetNumConformers() == 3
+    # Hydrogens are added before the embedding
+    assert molecule.GetNumAtoms() == 15
+    positions = [conformer.GetPositions() for conformer in molecule.GetConformers()]
+    assert not np.allclose(positions[0], positions[1])
+    assert generate_conformers("not a smiles") is None
+
+
+def test_fixed_seed_is_reproducible(tmp_path):
+    save_sdf(generate_conformers("CCCCO", num_confs=2), tmp_path / "a.sdf")
+    save_sdf(generate_conformers("CCCCO", num_confs=2), tmp_path / "b.sdf")
+    assert (tmp_path / "a.sdf").read_text() == (tmp_path / "b.sdf").read_text()
+    save_sdf(generate_conformers("CCCCO", num_confs=2, random_seed=1), tmp_path / "c.sdf")
+    assert (tmp_path / "a.sdf").read_text() != (tmp_path / "c.sdf").read_text()
+
+
+def test_minimize_lowers_the_energy():
+    from rdkit.Chem import AllChem
+    energies = []
+    for minimize in (False, True):
+        molecule = generate_conformers("CCCCCCO", minimize=minimize)
+        properties = AllChem.MMFFGetMoleculeProperties(molecule)
+        energies.append(AllChem.MMFFGetMoleculeForceField(molecule, properties).CalcEnergy())
+    assert energies[1] < energies[0]
+
+
+def test_prepare_ligands(tmp_path):
+    results = list(prepare_ligands(["a", "b", "c"], ["CCO", "C1CC", "c1ccccc1"], output_dir=tmp_path,
+                                   num_confs=2, n_workers=2, chunksize=1))
+    # One result per ligand, in input order
+    assert [name for name, _, _, _ in results] == ["a", "b", "c"]
+    assert results[1][1:3] == (None, 0)
+    assert all(elapsed > 0 for _, _, _, elapsed in results)
+    supplier = Chem.SDMolSupplier(results[2][1], removeHs=False)
+    assert len(supplier) == 2
+    assert supplier[0].GetNumAtoms() == 12
+
+
+def test_prepare_dataframe(tmp_path):
+    information = pd.DataFrame({"Name": ["a", "b"], "SMILES": ["CCO", "invalid"]})
+    information = prepare_dataframe(information, output_dir=tmp_path, smiles_column="SMILES", num_confs=3,
+                                    n_workers=1)
+    assert information.loc[0, "input_sdf"] == str(tmp_path / "a.sdf")
+    assert information.loc[1, "input_sdf"] is None
+    assert list(information["n_conformers"]) == [3, 0]
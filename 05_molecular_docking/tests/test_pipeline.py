@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+from docking_utils.pipeline import JobLedger, ScreeningPipeline
+
+
+@pytest.fixture
+def ligand_file(tmp_path):
+    ligand_file = tmp_path / "ligands.csv"
+    pd.DataFrame({"Name": ["ethanol", "broken", "benzene"],
+                  "Smiles": ["CCO", "C1CC", "c1ccccc1"]}).to_csv(ligand_file, index=False)
+    return ligand_file
+
+
+def test_ledger(tmp_path):
+    ledger = JobLedger(tmp_path / "ledger.sqlite")
+    ledger.start(["a", "b"], "dock")
+    ledger.finish("a", "dock", output="a.sdf", value=-7.0, elapsed=2.0)
+    ledger.fail("b", "dock", "error")
+    assert ledger.completed("dock") == {"a": ("a.sdf", -7.0)}
+    assert ledger.todo(["a", "b", "c"], "dock") == ["b", "c"]
+    ledger.start(["b"], "dock")
+    jobs = ledger.jobs("dock").set_index("name")
+    assert jobs.loc["b", "attempts"] == 2
+    assert jobs.loc["b", "status"] == "running"
+    ledger.close()
+
+
+def test_pipeline_resumes_and_scores_best_pose(tmp_path, ligand_file, fake_smina):
+    protein = tmp_path / "protein.pdb"
+    protein.write_text("END\n")
+    output_dir = tmp_path / "output"
+    pipeline = ScreeningPipeline(ligand_file, protein, [0, 0, 0], [10, 10, 10], output_dir=output_dir,
+                                 num_confs=2, n_workers=2)
+    information = pipeline.run().set_index("Name")
+
+    # The second conformer gets the better affinity from the fake smina
+    assert information.loc["ethanol", "score"] == -7.0
+    assert information.loc["benzene", "score"] == -7.0
+    assert pd.isna(information.loc["broken", "score"])
+    assert (output_dir / "stats.csv").exists()
+
+    prepared = pipeline.ledger.jobs("prepare").set_index("name")
+    assert prepared.loc["broken", "status"] == "failed"
+    assert (prepared["elapsed"] > 0).all()
+
+    # Nothing is repeated when the pipeline runs again, except the failed ligand
+    ScreeningPipeline(ligand_file, protein, [0, 0, 0], [10, 10, 10], output_dir=output_dir,
+                      num_confs=2, n_workers=2).run()
+    jobs = pipeline.ledger.jobs().set_index(["name", "stage"])
+    assert jobs.loc[("ethanol", "dock"), "attempts"] == 1
+    assert jobs.loc[("broken", "prepare"), "attempts"] == 2
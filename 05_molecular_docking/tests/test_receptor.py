@@ -0,0 +1,67 @@
+from os import path
+
+import numpy as np
+import pytest
+
+from docking_utils.receptor import (PreparedReceptor, prepare_receptor, read_box_config, trim_receptor,
+                                    write_box_config)
+
+INPUT_DIR = path.join(path.dirname(path.dirname(path.abspath(__file__))), "1_MolecularDocking", "input")
+RECEPTOR = path.join(INPUT_DIR, "2AMB_receptor.pdb")
+
+
+def ligand_box(margin=5.0):
+    with open(path.join(INPUT_DIR, "2AMB_ligand.pdb")) as f:
+        coordinates = np.array([[float(line[30:38]), float(line[38:46]), float(line[46:54])]
+                                for line in f if line.startswith(("ATOM", "HETATM"))])
+    lower, upper = coordinates.min(axis=0) - margin, coordinates.max(axis=0) + margin
+    return list((lower + upper) / 2), list(upper - lower)
+
+
+def test_box_config_round_trip(tmp_path):
+    write_box_config([1, 2.5, -3], [10, 12, 14], tmp_path / "box.txt")
+    assert read_box_config(tmp_path / "box.txt") == ([1.0, 2.5, -3.0], [10.0, 12.0, 14.0])
+    assert "center_y = 2.5" in (tmp_path / "box.txt").read_text()
+
+
+def test_trim_receptor_keeps_whole_residues():
+    center, size = ligand_box()
+    lines = trim_receptor(RECEPTOR, center, size, margin=8.0)
+    with open(RECEPTOR) as f:
+        records = [line for line in f if line.startswith(("ATOM", "HETATM"))]
+    assert lines[-1] == "END\n"
+    assert 0 < len(lines) - 1 < len(records)
+
+    residues = {line[17:27] for line in lines[:-1]}
+    # Every atom of a kept residue is kept
+    assert len(lines) - 1 == sum(line[17:27] in residues for line in records)
+    # and every kept residue has an atom within the enlarged box
+    lower = np.asarray(center) - np.asarray(size) / 2 - 8.0
+    upper = np.asarray(center) + np.asarray(size) / 2 + 8.0
+    for residue in residues:
+        coordinates = np.array([[float(line[30:38]), float(line[38:46]), float(line[46:54])]
+                                for line in lines[:-1] if line[17:27] == residue])
+        assert np.any(np.all((coordinates >= lower) & (coordinates <= upper), axis=1))
+
+
+@pytest.mark.parametrize("pdbqt", [True, False])
+def test_prepare_receptor(tmp_path, pdbqt):
+    center, size = ligand_box()
+    receptor = prepare_receptor(RECEPTOR, center, size, output_dir=tmp_path, pdbqt=pdbqt)
+    assert receptor.receptor == str(tmp_path / ("receptor.pdbqt" if pdbqt else "receptor.pdb"))
+    assert receptor.center == pytest.approx(center)
+    if pdbqt:
+        text = (tmp_path / "receptor.pdbqt").read_text()
+        # Rigid receptor: no torsion tree
+        assert "ATOM" in text and "ROOT" not in text
+    assert PreparedReceptor.load(tmp_path) == receptor
+
+
+def test_prepare_receptor_without_trimming(tmp_path):
+    center, size = ligand_box()
+    prepare_receptor(RECEPTOR, center, size, output_dir=tmp_path, margin=None, pdbqt=False)
+    n_atoms = []
+    for pdb_file in (RECEPTOR, tmp_path / "receptor.pdb"):
+        with open(pdb_file) as f:
+            n_atoms.append(sum(line.startswith(("ATOM", "HETATM")) for line in f))
+    assert n_atoms[0] == n_atoms[1]
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from rdkit import Chem
+from rdkit.Chem import AllChem
+
+from docking_utils.rmsd import atom_mappings, cross_docking_rmsd, load_poses, pose_pair_rmsd, rmsd_matrix
+
+
+def make_poses(smiles, num_confs=4, seed=7):
+    """
+    Conformers of one ligand as separate heavy-atom poses, like the records of a docking output.
+    """
+    molecule = Chem.AddHs(Chem.MolFromSmiles(smiles))
+    AllChem.EmbedMultipleConfs(molecule, numConfs=num_confs, randomSeed=seed)
+    molecule = Chem.RemoveHs(molecule)
+    return [Chem.Mol(molecule, confId=conformer.GetId()) for conformer in molecule.GetConformers()]
+
+
+@pytest.mark.parametrize("smiles", ["OC(=O)c1ccc(cc1)[N+](=O)[O-]", "CC(C)(C)c1ccccc1", "CCCCO"])
+def test_rmsd_matrix_matches_calc_rms(smiles):
+    poses = make_poses(smiles)
+    references = make_poses(smiles, num_confs=2, seed=11)
+    rmsd = rmsd_matrix(poses, references)
+    assert rmsd.shape == (4, 2)
+    expected = [[AllChem.CalcRMS(pose, reference) for reference in references] for pose in poses]
+    np.testing.assert_allclose(rmsd, expected, atol=1e-6)
+
+
+def test_pose_pair_rmsd_matches_calc_rms():
+    poses = make_poses("OC(=O)c1ccc(cc1)[N+](=O)[O-]", num_confs=5)
+    rmsd = pose_pair_rmsd(poses)
+    expected = [[AllChem.CalcRMS(a, b) for b in poses] for a in poses]
+    np.testing.assert_allclose(rmsd, expected, atol=1e-6)
+    np.testing.assert_array_equal(rmsd, rmsd.T)
+    np.testing.assert_array_equal(np.diag(rmsd), 0.0)
+
+
+def test_atom_mappings_include_symmetric_terminal_atoms():
+    # The two oxygens of the carboxylate and the two ring sides can be swapped
+    molecule = Chem.MolFromSmiles("[O-]C(=O)c1ccccc1")
+    assert len(atom_mappings(molecule, molecule)) == 4
+    with pytest.raises(ValueError):
+        atom_mappings(molecule, Chem.MolFromSmiles("CCN"))
+
+
+def test_load_poses_and_cross_docking(tmp_path):
+    poses = make_poses("CC(=O)Nc1ccc(O)cc1", num_confs=3)
+    with Chem.SDWriter(str(tmp_path / "docked.sdf")) as writer:
+        for pose in poses:
+            writer.write(Chem.AddHs(pose, addCoords=True))
+    Chem.MolToMolFile(poses[1], str(tmp_path / "reference.sdf"))
+
+    loaded = load_poses(tmp_path / "docked.sdf")
+    assert len(loaded) == 3
+    assert loaded[0].GetNumAtoms() == poses[0].GetNumAtoms()
+
+    table = cross_docking_rmsd({"apap": str(tmp_path / "docked.sdf")}, {"apap": "reference.sdf"},
+                               reference_dir=tmp_path)
+    assert list(table.columns) == ["ligand", "pose", "rmsd"]
+    assert list(table.pose) == [1, 2, 3]
+    assert table.rmsd[1] == pytest.approx(0.0, abs=1e-3)
+    assert (table.rmsd[[0, 2]] > 0.1).all()
@@ -0,0 +1,84 @@
+import math
+import os
+
+import pandas as pd
+import pytest
+
+from docking_utils.receptor import PreparedReceptor, write_box_config
+from docking_utils.runner import DockingJob, dock_dataframe, dock_ligands, split_cores
+from docking_utils.smina import smina_command
+
+
+def write_ligand(file, n_records=1):
+    file.write_text("ligand\n  fake\n\nM  END\n$$$$\n" * n_records)
+    return str(file)
+
+
+@pytest.mark.parametrize("cpu_per_job, n_cores, expected", [(1, 8, (8, 1)), (2, 8, (4, 2)), (3, 8, (2, 3)),
+                                                            (16, 8, (1, 8)), (0, 4, (4, 1))])
+def test_split_cores(cpu_per_job, n_cores, expected):
+    assert split_cores(cpu_per_job, n_cores) == expected
+
+
+def test_split_cores_uses_all_cores():
+    n_workers, cpu_per_job = split_cores(1)
+    assert n_workers == (os.cpu_count() or 1)
+
+
+def test_smina_command():
+    command = smina_command("l.sdf", "p.pdb", "o.sdf", [1, 2, 3], [10, 11, 12], num_poses=3, cpu=2, seed=7)
+    assert command[:7] == ["smina", "--ligand", "l.sdf", "--receptor", "p.pdb", "--out", "o.sdf"]
+    assert command[command.index("--center_z") + 1] == "3"
+    assert command[command.index("--size_x") + 1] == "10"
+    assert command[-4:] == ["--cpu", "2", "--seed", "7"]
+    assert "--cpu" not in smina_command("l.sdf", "p.pdb", "o.sdf", [0, 0, 0], [1, 1, 1])
+
+    # A config file replaces the box arguments
+    command = smina_command("l.sdf", "p.pdb", "o.sdf", config="box.txt")
+    assert command[command.index("--config") + 1] == "box.txt"
+    assert "--center_x" not in command and "--size_x" not in command
+    with pytest.raises(ValueError):
+        smina_command("l.sdf", "p.pdb", "o.sdf")
+
+
+def test_dock_ligands_from_generator(tmp_path, fake_smina, monkeypatch):
+    def jobs():
+        for index in range(7):
+            ligand = write_ligand(tmp_path / f"ligand_{index}.sdf")
+            yield DockingJob(name=index, ligand=ligand, output=str(tmp_path / f"docked_{index}.sdf"))
+
+    monkeypatch.setenv("FAKE_SMINA_ARGS", str(tmp_path / "arguments.txt"))
+    write_box_config([0, 0, 0], [10, 10, 10], tmp_path / "box.txt")
+    receptor = PreparedReceptor(receptor=str(tmp_path / "protein.pdbqt"), config=str(tmp_path / "box.txt"),
+                                center=[0.0, 0.0, 0.0], size=[10.0, 10.0, 10.0])
+    results = list(dock_ligands(jobs(), receptor, n_workers=2))
+    assert sorted(result.name for result in results) == list(range(7))
+    for result in results:
+        assert result.error is None
+        assert "minimizedAffinity" in open(result.output).read()
+        assert "-6.0" in result.log_text
+        assert result.elapsed > 0
+    # smina reads the box of the prepared receptor from its config file
+    for arguments in (tmp_path / "arguments.txt").read_text().splitlines():
+        assert f"--config {tmp_path / 'box.txt'}" in arguments
+        assert "--center_x" not in arguments
+    with pytest.raises(ValueError):
+        next(dock_ligands(jobs(), receptor, [1, 1, 1], [5, 5, 5]))
+
+
+def test_dock_dataframe(tmp_path, fake_smina, monkeypatch):
+    monkeypatch.setenv("FAKE_SMINA_FAIL", "broken")
+    # The jobs are named after the index labels, which need not be strings
+    information = pd.DataFrame({"Name": ["good", "broken", "also_good"]}, index=[30, 10, 20])
+    information["input_sdf"] = [write_ligand(tmp_path / f"{name}.sdf", 2) for name in information["Name"]]
+    information = dock_dataframe(information, tmp_path / "protein.pdb", [0, 0, 0], [10, 10, 10],
+                                 output_dir=tmp_path / "docked", log_dir=tmp_path / "logs", n_workers=2)
+
+    assert list(information.index) == [30, 10, 20]
+    assert information.loc[30, "docked_sdf"] == str(tmp_path / "docked" / "good.sdf")
+    assert information.loc[10, "docked_sdf"] is None
+    assert "returned non-zero exit status 3" in information.loc[10, "docking_error"]
+    assert information["docking_error"].isna().tolist() == [True, False, True]
+    assert not any(math.isnan(elapsed) for elapsed in information["docking_time"])
+    assert (tmp_path / "logs" / "also_good.txt").read_text().count("mode |") == 2
+    assert not (tmp_path / "logs" / "broken.txt").exists()
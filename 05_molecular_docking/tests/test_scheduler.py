@@ -0,0 +1,53 @@
+import os
+from os import path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from docking_utils.scheduler import compare_protocols, select_for_refinement, two_pass_docking
+
+
+def test_select_for_refinement():
+    scores = pd.Series([-9.0, -5.0, np.nan, -8.6, -4.0, -7.0, -6.0, -3.0, -2.0, -1.0])
+    selected = select_for_refinement(scores, top_fraction=0.1)
+    assert list(scores.index[selected]) == [0]
+    selected = select_for_refinement(scores, top_fraction=0.1, margin=0.5)
+    assert list(scores.index[selected]) == [0, 3]
+    assert not select_for_refinement(pd.Series([np.nan, np.nan])).any()
+
+
+def test_two_pass_docking(tmp_path, fake_smina):
+    protein = tmp_path / "protein.pdb"
+    protein.write_text("END\n")
+    # The fake smina scores the n-th record (conformer) with -(n + 5), so a
+    # ligand with more conformers gets a better best score
+    information = pd.DataFrame({"Name": ["a", "b", "c", "d"], "n_conformers": [1, 4, 2, 3]})
+    information["input_sdf"] = [str(tmp_path / f"{name}.sdf") for name in information["Name"]]
+    for input_sdf, n_conformers in zip(information["input_sdf"], information["n_conformers"]):
+        with open(input_sdf, "w") as f:
+            f.write("ligand\n  fake\n\nM  END\n$$$$\n" * n_conformers)
+
+    information = two_pass_docking(information, protein, [0, 0, 0], [10, 10, 10], output_dir=tmp_path,
+                                   top_fraction=0.5, n_workers=2)
+    # Best pose of all conformers; exhaustiveness=1 scores 0.7 worse
+    np.testing.assert_allclose(information["score_screen"], [-5.3, -8.3, -6.3, -7.3])
+    assert list(information["refined"]) == [False, True, False, True]
+    # Only the refined ligands have second-pass scores and poses
+    np.testing.assert_allclose(information["score"], [-5.3, -9.0, -6.3, -8.0])
+    for refined, docked_sdf in zip(information["refined"], information["docked_sdf"]):
+        directory = "docked" if refined else "docked_screen"
+        assert path.dirname(docked_sdf) == str(tmp_path / directory)
+    assert sorted(os.listdir(tmp_path / "docked")) == ["b.sdf", "d.sdf"]
+
+
+def test_compare_protocols():
+    information = pd.DataFrame({"Affinity[µM]": [0.1, 0.5, 5.0, 10.0],
+                                "good": [-9.0, -8.0, -6.0, -5.0],
+                                "bad": [-5.0, -6.0, -8.0, np.nan],
+                                "time_good": [1.0, 2.0, 3.0, 4.0]})
+    report = compare_protocols(information, ["good", "bad"], time_columns={"good": "time_good"}).set_index("score")
+    assert report.loc["good", "auc"] == pytest.approx(1.0)
+    assert report.loc["bad", "auc"] == pytest.approx(0.0)
+    assert report.loc["bad", "n_scored"] == 3
+    assert report.loc["good", "docking_time"] == 10.0
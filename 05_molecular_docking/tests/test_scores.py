@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from docking_utils.scores import collect_scores, extract_docking_score, parse_smina_log, read_sd_tags
+
+LOG = """Using random seed: 1
+
+mode |   affinity | dist from best mode
+     | (kcal/mol) | rmsd l.b.| rmsd u.b.
+-----+------------+----------+----------
+1       -7.2       0.000      0.000
+2       -6.9       1.512      2.108
+Refine time 0.52
+
+mode |   affinity | dist from best mode
+     | (kcal/mol) | rmsd l.b.| rmsd u.b.
+-----+------------+----------+----------
+1       -8.1       0.000      0.000
+2       -7.5       2.004      3.117
+3       -7.0       1.100      1.900
+Loop time 1.2
+"""
+
+
+def write_sdf(sdf_path, affinities, extra=None):
+    with open(sdf_path, "w") as f:
+        for number, affinity in enumerate(affinities):
+            f.write(f"pose{number}\n     RDKit          3D\n\n  0  0  0  0  0  0  0  0  0  0999 V2000\nM  END\n")
+            if affinity is not None:
+                f.write(f"> <minimizedAffinity>\n{affinity}\n\n")
+            if extra is not None:
+                f.write(f">  <{extra[0]}>  (1)\n{extra[1]}\n\n")
+            f.write("$$$$\n")
+
+
+def test_parse_smina_log_reads_all_tables():
+    table = parse_smina_log(LOG)
+    assert table.shape == (5, 3)
+    np.testing.assert_allclose(table[:, 0], [-7.2, -6.9, -8.1, -7.5, -7.0])
+    np.testing.assert_allclose(table[4, 1:], [1.1, 1.9])
+
+
+def test_parse_smina_log_without_table():
+    assert parse_smina_log("smina failed\n").shape == (0, 3)
+
+
+def test_read_sd_tags(tmp_path):
+    sdf_path = tmp_path / "docked.sdf"
+    write_sdf(sdf_path, ["-5.5", None, "-6.25"], extra=("rmsd", "1.0"))
+    values = read_sd_tags(sdf_path, tags=("minimizedAffinity", "rmsd"))
+    assert values["minimizedAffinity"] == ["-5.5", None, "-6.25"]
+    assert values["rmsd"] == ["1.0", "1.0", "1.0"]
+    assert extract_docking_score(str(sdf_path), pose_id=2) == pytest.approx(-6.25)
+
+
+def test_collect_scores(tmp_path):
+    write_sdf(tmp_path / "a.sdf", ["-5.0", "-7.0"])
+    write_sdf(tmp_path / "b.sdf", ["-6.0"])
+    (tmp_path / "a.txt").write_text(LOG)
+    scores = collect_scores([tmp_path / "a.sdf", tmp_path / "b.sdf", None], log_dir=tmp_path, n_workers=2)
+    assert list(scores["pose"]) == [0, 1, 0]
+    assert list(scores["minimizedAffinity"]) == [-5.0, -7.0, -6.0]
+    np.testing.assert_allclose(scores["rmsd_lb"][:2], [0.0, 1.512])
+    assert np.isnan(scores["rmsd_lb"][2])
+    # The best pose is not necessarily the first one
+    best = scores.groupby("file")["minimizedAffinity"].min()
+    assert best[str(tmp_path / "a.sdf")] == -7.0